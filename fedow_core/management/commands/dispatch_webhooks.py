@@ -0,0 +1,150 @@
+import time
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import F
+from django.utils import timezone
+
+from fedow_core.models import WebhookOutbox, logger
+
+# Nombre d'echecs avant de remonter l'alerte (logger.error -> Sentry). Les reessais continuent.
+# / Failures before raising the alert (logger.error -> Sentry). Retries go on.
+ALERTE_APRES = 5
+
+# Timeout d'un envoi (connexion, lecture), en secondes.
+# / Timeout of one delivery (connect, read), in seconds.
+TIMEOUT_LIVRAISON = (1, 2)
+
+
+def delai_de_reessai(tentatives: int) -> timedelta:
+    # 30s, 60s, 120s ... plafonne a WEBHOOK_RETRY_MAX.
+    # / 30s, 60s, 120s ... capped at WEBHOOK_RETRY_MAX.
+    secondes = settings.WEBHOOK_RETRY_BASE * 2 ** max(tentatives - 1, 0)
+    return timedelta(seconds=min(secondes, settings.WEBHOOK_RETRY_MAX))
+
+
+def duree_du_bail(taille: int) -> timedelta:
+    # Le lot est livre en sequence : pire cas = taille x timeout d'un envoi, plus la marge WEBHOOK_LEASE.
+    # / The batch is delivered sequentially: worst case = size x one timeout, plus the WEBHOOK_LEASE margin.
+    return timedelta(seconds=taille * sum(TIMEOUT_LIVRAISON) + settings.WEBHOOK_LEASE)
+
+
+def reserve_lot(taille: int) -> list[WebhookOutbox]:
+    """
+    Reserve les lignes echues par compare-and-swap sur next_attempt_at : deux
+    dispatchers ne livrent jamais la meme ligne en meme temps. La reservation couvre
+    le pire cas du lot (duree_du_bail) et n'expire que si le dispatcher s'arrete en
+    cours de lot.
+    / Claims due rows by compare-and-swap on next_attempt_at; the lease covers the
+    batch worst case and only expires if the dispatcher dies mid-batch.
+
+    LOCALISATION : fedow_core/management/commands/dispatch_webhooks.py
+    """
+    maintenant = timezone.now()
+    echues = (WebhookOutbox.objects
+              .filter(delivered_at__isnull=True, next_attempt_at__lte=maintenant)
+              .order_by('next_attempt_at')
+              .values_list('pk', 'next_attempt_at')[:taille])
+    bail = maintenant + duree_du_bail(taille)
+    reservees = [
+        pk for pk, prevu in echues
+        if WebhookOutbox.objects.filter(pk=pk, next_attempt_at=prevu, delivered_at__isnull=True)
+        .update(next_attempt_at=bail)
+    ]
+    return list(WebhookOutbox.objects.filter(pk__in=reservees).order_by('created_at'))
+
+
+def livre(session: requests.Session, message: WebhookOutbox) -> bool:
+    """
+    Un envoi : 2xx -> livre, sinon reessai plus tard. Jamais d'abandon.
+    / One delivery: 2xx -> delivered, otherwise retried later. Never dropped.
+    """
+    try:
+        reponse = session.get(message.url, verify=bool(not settings.DEBUG), timeout=TIMEOUT_LIVRAISON)
+        # Un 4xx/5xx de Lespass (route/tenant absent) est un echec comme un autre.
+        # / A Lespass 4xx/5xx is a failure like any other.
+        reponse.raise_for_status()
+    except requests.RequestException as erreur:
+        tentatives = message.attempts + 1
+        WebhookOutbox.objects.filter(pk=message.pk).update(
+            attempts=F('attempts') + 1,
+            next_attempt_at=timezone.now() + delai_de_reessai(tentatives),
+            last_error=str(erreur)[:1000],
+        )
+        journal = logger.error if tentatives == ALERTE_APRES else logger.warning
+        journal(f"dispatch_webhooks : ECHEC {tentatives} pour {message.url} "
+                f"(transaction {message.transaction_id}) : {erreur}")
+        return False
+
+    WebhookOutbox.objects.filter(pk=message.pk).update(
+        attempts=F('attempts') + 1,
+        delivered_at=timezone.now(),
+        last_error=None,
+    )
+    return True
+
+
+def une_passe(taille: int) -> tuple[int, int]:
+    """
+    Un lot : une session HTTP pour tout le lot (connexions reutilisees par domaine).
+    / One batch: a single HTTP session for the whole batch (connections reused per host).
+
+    :return: (livres, echecs)
+    """
+    lot = reserve_lot(taille)
+    if not lot:
+        return 0, 0
+    with requests.Session() as session:
+        livres = sum(livre(session, message) for message in lot)
+    return livres, len(lot) - livres
+
+
+class Command(BaseCommand):
+    """
+    Livre les webhooks de l'outbox (WebhookOutbox) vers Lespass, en tache de fond.
+    / Delivers the outbox webhooks (WebhookOutbox) to Lespass, in the background.
+
+    LOCALISATION : fedow_core/management/commands/dispatch_webhooks.py
+
+    Tourne en boucle a cote de gunicorn (start.sh). Une passe en erreur est
+    journalisee et reprise, la boucle ne s'arrete jamais. --once fait une seule
+    passe (cron, rattrapage manuel, tests). Plusieurs dispatchers peuvent tourner :
+    chaque ligne est reservee avant l'envoi.
+    """
+
+    help = "Livre les webhooks Lespass en attente (outbox), avec reessais. --once pour une seule passe."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once", action="store_true",
+            help="Une seule passe puis sortie.",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=None,
+            help="Lignes par lot (defaut : WEBHOOK_BATCH_SIZE).",
+        )
+
+    def handle(self, *args, **options):
+        taille = options["batch_size"] or settings.WEBHOOK_BATCH_SIZE
+        while True:
+            try:
+                livres, echecs = une_passe(taille)
+            except Exception as erreur:
+                # Base verrouillee par gunicorn, erreur inattendue : le dispatcher ne doit
+                # jamais s'arreter (start.sh ne le relance pas), on repasse plus tard.
+                # / Locked database, unexpected error: never stop the dispatcher
+                # (start.sh does not restart it), try again later.
+                if options["once"]:
+                    raise
+                logger.exception(f"dispatch_webhooks : passe en erreur, reprise dans "
+                                 f"{settings.WEBHOOK_POLL_INTERVAL}s : {erreur}")
+                time.sleep(settings.WEBHOOK_POLL_INTERVAL)
+                continue
+            if livres or echecs:
+                self.stdout.write(f"{livres} webhooks livres, {echecs} en echec (reessai plus tard).")
+            if options["once"]:
+                return
+            if not livres and not echecs:
+                time.sleep(settings.WEBHOOK_POLL_INTERVAL)
@@ -0,0 +1,105 @@
+"""
+Plans d'execution SQLite des requetes chaudes sur Transaction.
+/ SQLite query plans of the hot Transaction queries.
+
+LOCALISATION : fedow_core/management/commands/explain_hot_queries.py
+
+Chaque requete est construite par le code qui l'execute (constructeurs de
+Transaction, pagination par curseur, reconcile_tokens), puis passee a EXPLAIN
+QUERY PLAN. Un parcours complet de fedow_core_transaction (SCAN
+sans index) est signale : c'est la regression a reperer apres un changement de
+requete ou d'index. --strict sort en erreur dans ce cas (CI, verification manuelle).
+"""
+
+from uuid import UUID
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from fedow_core.management.commands.reconcile_tokens import ACTIONS_CREDIT_RECEIVER, sommes_par_token
+from fedow_core.models import Asset, AssetTotals, Transaction, Wallet
+from fedow_core.views import KeysetPagination, StandardResultsSetPagination
+
+TABLE_TRANSACTION = Transaction._meta.db_table
+
+
+def requetes_chaudes(asset: Asset, wallet: Wallet) -> dict:
+    """
+    Les requetes chaudes, nommees par l'endroit qui les execute. Elles viennent des
+    memes constructeurs que le code de production (Transaction, KeysetPagination,
+    reconcile_tokens) : un changement de requete se voit ici sans recopie.
+    / The hot queries, named after the code that runs them, built by the same
+    helpers as the production code.
+    """
+    wallet_ids = wallet.lineage_ids()
+    page_size = KeysetPagination.page_size
+    debut, fin = asset.created_at or timezone.now(), timezone.now()
+    # Page suivante : le curseur ajoute la borne (datetime, uuid) a chaque branche.
+    # / Next page: the cursor adds the (datetime, uuid) bound to each branch.
+    curseur = (timezone.now(), UUID(int=0))
+    requetes = {
+        # Transaction._previous_asset_transaction (sans tete de chaine)
+        'chain_fallback': Transaction.asset_newest_first(asset.pk)[:1],
+        # TransactionAPI.list_by_asset (lieu d'origine de l'asset, puis lieu federe)
+        'list_by_asset': Transaction.asset_period(asset, debut, fin),
+        'list_by_asset_federated': Transaction.asset_period(asset, debut, fin, wallet=wallet),
+        # TransactionAPI.paginated_list_by_wallet_signature, pagination par numero de page
+        'wallet_history': Transaction.wallet_history(wallet_ids)[:StandardResultsSetPagination.page_size],
+    }
+    # paginated_list_by_wallet_signature?pagination=cursor : une branche par index.
+    # / Cursor pagination: one branch per index.
+    for nom, branche in zip(('sender', 'receiver'), Transaction.wallet_history_branches(wallet_ids)):
+        requetes[f'wallet_history_cursor_{nom}'] = KeysetPagination.branch_page(branche, curseur, page_size)
+    requetes.update({
+        # AssetTotals.from_sums (reconcile_asset_totals, premiere ecriture d'un asset)
+        'asset_totals_from_sums': AssetTotals.sums_by_action(asset.pk),
+        # reconcile_tokens._agreger
+        'reconcile_tokens': sommes_par_token(ACTIONS_CREDIT_RECEIVER, 'receiver'),
+    })
+    return requetes
+
+
+def plan_de_requete(queryset) -> list[str]:
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        return [ligne[-1] for ligne in cursor.fetchall()]
+
+
+def parcours_complet(plan: list[str]) -> bool:
+    # "SCAN fedow_core_transaction" sans "USING ... INDEX" : toute la table est lue.
+    # / "SCAN fedow_core_transaction" without "USING ... INDEX": full table read.
+    return any(etape.startswith(f"SCAN {TABLE_TRANSACTION}") and "INDEX" not in etape
+               for etape in plan)
+
+
+class Command(BaseCommand):
+    help = "Affiche le EXPLAIN QUERY PLAN SQLite de chaque requete chaude sur Transaction."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--strict', action='store_true',
+                            help="Erreur si une requete parcourt toute la table des transactions.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("explain_hot_queries : SQLite uniquement (EXPLAIN QUERY PLAN).")
+
+        asset = Asset.objects.order_by('created_at').first()
+        wallet = Wallet.objects.filter(transactions_sent__isnull=False).first()
+        if not asset or not wallet:
+            raise CommandError("explain_hot_queries : aucun asset ou wallet avec transactions.")
+
+        en_parcours_complet = []
+        for nom, queryset in requetes_chaudes(asset, wallet).items():
+            plan = plan_de_requete(queryset)
+            complet = parcours_complet(plan)
+            if complet:
+                en_parcours_complet.append(nom)
+            style = self.style.WARNING if complet else self.style.SUCCESS
+            self.stdout.write(style(f"{nom}{' : FULL SCAN' if complet else ''}"))
+            for etape in plan:
+                self.stdout.write(f"    {etape}")
+
+        if en_parcours_complet and options['strict']:
+            raise CommandError(f"Parcours complet de {TABLE_TRANSACTION} : {', '.join(en_parcours_complet)}")
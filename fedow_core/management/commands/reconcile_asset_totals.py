@@ -0,0 +1,89 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction as db_transaction
+from django.utils import timezone
+
+from fedow_core.models import Asset, AssetTotals
+
+
+def compare_totaux(asset_id) -> dict:
+    """
+    Compare les totaux courants d'un asset aux SUM recalculees.
+    / Compares the running totals of an asset with the recomputed SUMs.
+
+    LOCALISATION : fedow_core/management/commands/reconcile_asset_totals.py
+
+    Lecture dans un bloc atomique : avec SQLite (WAL), la ligne AssetTotals et
+    les SUM viennent du meme instantane, une transaction concurrente ne cree
+    pas de faux ecart.
+
+    :return: {'totals': AssetTotals, 'sums': {colonne: valeur}, 'gaps': {colonne: ecart}}
+    """
+    with db_transaction.atomic():
+        totaux = AssetTotals.for_asset(asset_id)
+        sommes = AssetTotals.from_sums(asset_id)
+    ecarts = {colonne: sommes[colonne] - getattr(totaux, colonne) for colonne in AssetTotals.COLUMNS}
+    return {
+        'totals': totaux,
+        'sums': sommes,
+        'gaps': {colonne: ecart for colonne, ecart in ecarts.items() if ecart},
+    }
+
+
+class Command(BaseCommand):
+    """
+    Reconciliation des totaux courants (AssetTotals) avec les SUM sur tokens et transactions.
+    / Reconciles the running totals (AssetTotals) with the SUMs over tokens and transactions.
+
+    LOCALISATION : fedow_core/management/commands/reconcile_asset_totals.py
+
+    A lancer en tache de fond (nuit, comme verify_chain). Chaque asset est note
+    (checked_at, drift). Un ecart vient d'une ecriture hors Transaction.save()
+    (shell, SQL direct) : --apply recale la ligne sur les SUM.
+    / Background job: records checked_at / drift per asset; --apply resets drifted rows.
+    """
+
+    help = (
+        "Compare les totaux courants de chaque asset aux SUM reelles. "
+        "Dry-run par defaut ; --apply pour recaler les lignes en ecart."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--asset", nargs="*", default=[],
+            help="UUID des assets a verifier (defaut : tous).",
+        )
+        parser.add_argument(
+            "--apply", action="store_true",
+            help="Recale les totaux en ecart sur les SUM. Sans ce flag : seul le constat est ecrit.",
+        )
+
+    def handle(self, *args, **options):
+        assets = Asset.objects.all().order_by('name')
+        if options["asset"]:
+            assets = assets.filter(uuid__in=options["asset"])
+            if not assets.exists():
+                raise CommandError("Aucun asset trouve.")
+
+        nb_en_ecart = 0
+        for asset in assets:
+            rapport = compare_totaux(asset.pk)
+            ecarts = rapport['gaps']
+            valeurs = {'checked_at': timezone.now(), 'drift': sum(abs(ecart) for ecart in ecarts.values())}
+            if not ecarts:
+                AssetTotals.objects.filter(pk=asset.pk).update(**valeurs)
+                continue
+
+            nb_en_ecart += 1
+            detail = ", ".join(f"{colonne} {ecart:+d}" for colonne, ecart in ecarts.items())
+            self.stdout.write(self.style.ERROR(f"{asset.name} : {detail}"))
+            if options["apply"]:
+                # Recalage relatif : les transactions ecrites depuis la lecture sont conservees.
+                # / Relative reset: transactions written since the read are kept.
+                AssetTotals.apply(asset.pk, ecarts)
+            AssetTotals.objects.filter(pk=asset.pk).update(**valeurs)
+
+        if nb_en_ecart:
+            suite = "recales." if options["apply"] else "relancer avec --apply pour recaler."
+            self.stdout.write(self.style.WARNING(f"{nb_en_ecart} assets en ecart : {suite}"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Totaux des assets reconcilies : aucun ecart."))
@@ -16,6 +16,15 @@ ACTIONS_DEBIT_SENDER = [
 ]
 
 
+def sommes_par_token(actions, champ):
+    # Somme des montants par (wallet, asset) pour la liste d'actions donnee.
+    # / Sum amounts grouped by (wallet, asset) for the given actions.
+    return (
+        Transaction.objects.filter(action__in=actions)
+        .values(champ, "asset").annotate(total=Sum("amount"))
+    )
+
+
 class Command(BaseCommand):
     help = (
         "Recale token.value sur la somme reelle des transactions, via des transactions "
@@ -33,12 +42,7 @@ class Command(BaseCommand):
         )
 
     def _agreger(self, actions, champ):
-        # Somme des montants par (wallet, asset) pour la liste d'actions donnee.
-        # / Sum amounts grouped by (wallet, asset) for the given actions.
-        lignes = (
-            Transaction.objects.filter(action__in=actions)
-            .values(champ, "asset").annotate(total=Sum("amount"))
-        )
+        lignes = sommes_par_token(actions, champ)
         return {(ligne[champ], ligne["asset"]): ligne["total"] for ligne in lignes}
 
     def handle(self, *args, **options):
@@ -0,0 +1,356 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+
+from fedow_core.models import Asset, AssetChainHead, ChainCheckpoint, Transaction
+
+# Taille des paquets lus par .iterator() : borne la memoire sur les gros assets.
+# / Chunk size read by .iterator(): bounds memory on big assets.
+CHUNK_SIZE = 2000
+
+# Nombre d'uuid affiches par type d'anomalie.
+# / Number of uuids printed per anomaly type.
+NB_UUID_AFFICHES = 20
+
+
+def _dans_l_ordre_de_chaine(groupe):
+    """
+    Remet les maillons d'une meme datetime dans l'ordre de la chaine : un enfant peut
+    porter la datetime de son parent et un uuid plus petit, le parent passe devant.
+    / Reorders links sharing one datetime in chain order: parent before child.
+    """
+    par_pk = {transaction.pk: transaction for transaction in groupe}
+    ordonnes, places = [], set()
+    for transaction in groupe:
+        # On remonte les parents du groupe pas encore places, puis on les pose du plus ancien au plus recent.
+        # / Walk up the not yet placed parents within the group, then emit them oldest first.
+        pile = []
+        while transaction and transaction.pk not in places and transaction not in pile:
+            pile.append(transaction)
+            transaction = par_pk.get(transaction.previous_transaction_id)
+        for maillon in reversed(pile):
+            places.add(maillon.pk)
+            ordonnes.append(maillon)
+    return ordonnes
+
+
+def _maillons_dans_l_ordre(transactions):
+    # Lecture en flux par (datetime, uuid), remise en ordre de chaine par paquet de meme datetime.
+    # / Streamed by (datetime, uuid), put back in chain order per same-datetime group.
+    groupe = []
+    for transaction in transactions.iterator(chunk_size=CHUNK_SIZE):
+        if groupe and transaction.datetime != groupe[0].datetime:
+            yield from _dans_l_ordre_de_chaine(groupe)
+            groupe = []
+        groupe.append(transaction)
+    yield from _dans_l_ordre_de_chaine(groupe)
+
+
+def _deja_verifies(asset_uuid, depuis):
+    # Le point de reprise et ses ancetres de meme datetime : deja verifies au passage precedent.
+    # Les autres maillons de cette datetime sont arrives depuis et sont relus.
+    # / The checkpoint and its same-datetime ancestors were verified by the previous run.
+    parents = dict(Transaction.objects
+                   .filter(asset_id=asset_uuid, datetime=depuis['datetime'])
+                   .values_list('pk', 'previous_transaction_id'))
+    verifies, pk = set(), depuis['uuid']
+    while pk in parents and pk not in verifies:
+        verifies.add(pk)
+        pk = parents[pk]
+    return verifies | {depuis['uuid']}
+
+
+def verifie_chaine_asset(asset_uuid, depuis=None):
+    """
+    Parcourt la chaine d'un asset dans l'ordre et recalcule chaque hash.
+    / Walks the chain of an asset in order and recomputes every hash.
+
+    LOCALISATION : fedow_core/management/commands/verify_chain.py
+
+    Ordre de chaine = ordre (datetime, uuid) : save() refuse un maillon plus ancien
+    que son parent. A datetime egale, le parent passe avant l'enfant quel que soit
+    l'uuid (_dans_l_ordre_de_chaine). Chaque maillon est controle contre :
+    - son hash (verify_hash) ;
+    - son parent : meme asset, date anterieure, sinon c'est un TROU ;
+    - les autres enfants de ce parent : plus d'un enfant, c'est un FORK.
+
+    :param asset_uuid: l'asset a verifier
+    :param depuis: point de reprise {'uuid', 'datetime'} (dernier maillon deja verifie),
+                   ou None pour toute la chaine
+    :return: rapport (dict simple, sans objet ORM)
+    """
+    transactions = (Transaction.objects
+                    .filter(asset_id=asset_uuid)
+                    .select_related('previous_transaction', 'checkout_stripe')
+                    .order_by('datetime', 'uuid'))
+
+    vus = set()
+    if depuis:
+        transactions = (transactions
+                        .filter(datetime__gte=depuis['datetime'])
+                        .exclude(pk__in=_deja_verifies(asset_uuid, depuis)))
+        vus.add(depuis['uuid'])
+
+    parents_pris = set()
+    hash_invalides, forks, trous = [], set(), []
+    nb_maillons = 0
+    dernier = None
+
+    for transaction in _maillons_dans_l_ordre(transactions):
+        nb_maillons += 1
+        dernier = transaction
+
+        # Le premier bloc est son propre parent.
+        # / The first block is its own parent.
+        if transaction.action == Transaction.FIRST:
+            vus.add(transaction.pk)
+            continue
+
+        if not transaction.verify_hash():
+            hash_invalides.append(transaction.pk)
+
+        parent_id = transaction.previous_transaction_id
+        parent = transaction.previous_transaction
+        if parent.asset_id != transaction.asset_id or parent.datetime > transaction.datetime:
+            trous.append(transaction.pk)
+        elif parent_id in parents_pris:
+            forks.add(parent_id)
+        elif parent_id not in vus:
+            # Parent anterieur au point de reprise (ou lu hors ordre) :
+            # on demande a la base s'il a deja un enfant.
+            # / Parent older than the resume point: ask the DB for another child.
+            autre_enfant = (Transaction.objects
+                            .filter(previous_transaction_id=parent_id)
+                            .exclude(pk__in=[transaction.pk, parent_id])
+                            .exists())
+            if autre_enfant:
+                forks.add(parent_id)
+            else:
+                trous.append(transaction.pk)
+
+        parents_pris.add(parent_id)
+        vus.add(transaction.pk)
+
+    # La tete de chaine doit pointer sur le dernier maillon lu (dans l'ordre de chaine).
+    # / The chain head must point to the last link read (in chain order).
+    tete_decalee = False
+    if dernier:
+        tete_id = AssetChainHead.objects.filter(asset_id=asset_uuid).values_list('transaction_id', flat=True).first()
+        tete_decalee = bool(tete_id and tete_id != dernier.pk)
+
+    return {
+        'asset': asset_uuid,
+        'nb_links': nb_maillons,
+        'invalid_hashes': hash_invalides,
+        'forks': sorted(forks),
+        'gaps': trous,
+        'head_mismatch': tete_decalee,
+        'last': {
+            'uuid': dernier.pk,
+            'hash': dernier.hash,
+            'datetime': dernier.datetime,
+        } if dernier else None,
+    }
+
+
+def _init_worker(nom_base):
+    """
+    Initialisation d'un worker : sa propre connexion SQLite, en lecture seule.
+    / Worker init: its own read-only SQLite connection.
+
+    La connexion heritee du processus parent (fork) ne doit pas etre reutilisee :
+    on l'abandonne et la prochaine requete ouvre la base en mode=ro.
+    Django ouvre toujours SQLite avec uri=True, l'URI "file:...?mode=ro" suffit.
+    """
+    for connexion in connections.all():
+        connexion.close()
+        connexion.connection = None
+    connections['default'].settings_dict['NAME'] = f"file:{nom_base}?mode=ro"
+
+
+def verifie_en_parallele(travaux, workers, nom_base):
+    """
+    Repartit les assets sur un pool de processus. La chaine d'un asset reste
+    sequentielle, mais deux assets sont independants.
+    / Fans assets out over a process pool. One chain is sequential, assets are independent.
+
+    :param travaux: liste de (asset_uuid, depuis) pour verifie_chaine_asset
+    :param workers: nombre de processus
+    :param nom_base: chemin du fichier SQLite, ouvert en lecture seule par chaque worker
+    :return: {asset_uuid: rapport}
+    """
+    rapports = {}
+    # fork : les workers heritent de Django deja configure (conteneur Linux).
+    # / fork: workers inherit the already configured Django (Linux container).
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=multiprocessing.get_context('fork'),
+                             initializer=_init_worker,
+                             initargs=(str(nom_base),)) as pool:
+        futures = {
+            pool.submit(verifie_chaine_asset, asset_uuid, depuis): asset_uuid
+            for asset_uuid, depuis in travaux
+        }
+        for future in as_completed(futures):
+            rapports[futures[future]] = future.result()
+    return rapports
+
+
+class Command(BaseCommand):
+    """
+    Verifie la chaine de hash de chaque asset, de facon incrementale.
+    / Verifies the hash chain of every asset, incrementally.
+
+    LOCALISATION : fedow_core/management/commands/verify_chain.py
+
+    verify_hash() ne controle un maillon que contre son parent direct. Cette
+    commande parcourt toute la chaine (en flux, .iterator()) et detecte :
+    hash invalides, forks (un parent, plusieurs enfants) et trous (parent d'un
+    autre asset, posterieur, ou hors chaine).
+
+    Un point de reprise par asset (ChainCheckpoint) retient le dernier maillon
+    verifie : le passage nocturne ne relit que les nouveaux maillons.
+    --full repart du premier bloc.
+    --workers N repartit les assets sur N processus (lecture seule) ; le
+    rapport et les points de reprise restent ecrits par le processus principal.
+
+    LECTURE SEULE sur la chaine : seul le point de reprise est ecrit.
+    / READ-ONLY on the chain: only the checkpoint is written.
+    """
+
+    help = (
+        "Verifie la chaine de hash de chaque asset (hash, forks, trous) depuis le "
+        "dernier point de reprise. --full pour tout reverifier."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--asset", nargs="*", default=[],
+            help="UUID des assets a verifier (defaut : tous).",
+        )
+        parser.add_argument(
+            "--full", action="store_true",
+            help="Ignore le point de reprise et reverifie toute la chaine.",
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true",
+            help="N'enregistre pas le point de reprise.",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=1,
+            help="Nombre de processus pour verifier plusieurs assets en parallele (defaut: 1).",
+        )
+
+    def _point_de_reprise(self, asset, checkpoint):
+        # Le maillon du point de reprise doit etre intact, sinon on repart du debut.
+        # / The checkpoint link must be intact, otherwise restart from the beginning.
+        if not checkpoint:
+            return None
+        hash_actuel = Transaction.objects.filter(pk=checkpoint.transaction_id).values_list('hash', flat=True).first()
+        if hash_actuel != checkpoint.transaction_hash:
+            self.stdout.write(self.style.ERROR(
+                f"{asset.name} : le maillon du point de reprise {checkpoint.transaction_id} a change, "
+                f"verification complete."))
+            return None
+        return {
+            'uuid': checkpoint.transaction_id,
+            'datetime': checkpoint.transaction_datetime,
+        }
+
+    def _enregistre(self, asset, checkpoint, rapport, complet):
+        if not rapport['last']:
+            return
+        compteurs = {
+            'nb_links': rapport['nb_links'],
+            'nb_invalid_hashes': len(rapport['invalid_hashes']),
+            'nb_forks': len(rapport['forks']),
+            'nb_gaps': len(rapport['gaps']),
+        }
+        if checkpoint and not complet:
+            # Verification incrementale : on cumule.
+            # / Incremental run: accumulate.
+            for champ in compteurs:
+                compteurs[champ] += getattr(checkpoint, champ)
+
+        ChainCheckpoint.objects.update_or_create(
+            asset=asset,
+            defaults={
+                'transaction_id': rapport['last']['uuid'],
+                'transaction_hash': rapport['last']['hash'],
+                'transaction_datetime': rapport['last']['datetime'],
+                **compteurs,
+            },
+        )
+
+    def _affiche(self, asset, rapport):
+        anomalies = rapport['invalid_hashes'] or rapport['forks'] or rapport['gaps']
+        ligne = (f"{asset.name} : {rapport['nb_links']} maillons verifies, "
+                 f"{len(rapport['invalid_hashes'])} hash invalides, "
+                 f"{len(rapport['forks'])} forks, {len(rapport['gaps'])} trous")
+        self.stdout.write(self.style.ERROR(ligne) if anomalies else ligne)
+
+        for titre, uuids in (("hash invalides", rapport['invalid_hashes']),
+                             ("forks (parent)", rapport['forks']),
+                             ("trous", rapport['gaps'])):
+            if uuids:
+                self.stdout.write(f"  {titre} : {', '.join(str(uuid) for uuid in uuids[:NB_UUID_AFFICHES])}"
+                                  f"{' ...' if len(uuids) > NB_UUID_AFFICHES else ''}")
+        if rapport['head_mismatch']:
+            self.stdout.write(self.style.WARNING(
+                f"  la tete de chaine ne pointe pas sur le dernier maillon {rapport['last']['uuid']}"))
+
+    def _verifie(self, travaux, workers):
+        if workers > 1 and connection.vendor == 'sqlite' and not connection.is_in_memory_db():
+            nom_base = connection.settings_dict['NAME']
+            # Aucune connexion ouverte ne doit traverser le fork.
+            # / No open connection must cross the fork.
+            connections.close_all()
+            return verifie_en_parallele(travaux, workers, nom_base)
+
+        if workers > 1:
+            self.stdout.write(self.style.WARNING(
+                "--workers ignore : base en memoire ou non SQLite, verification sequentielle."))
+        return {asset_uuid: verifie_chaine_asset(asset_uuid, depuis) for asset_uuid, depuis in travaux}
+
+    def handle(self, *args, **options):
+        if options["workers"] < 1:
+            raise CommandError("--workers doit etre un entier >= 1.")
+
+        assets = Asset.objects.all().order_by('name')
+        if options["asset"]:
+            assets = assets.filter(uuid__in=options["asset"])
+            if not assets.exists():
+                raise CommandError("Aucun asset trouve.")
+        assets = list(assets)
+
+        checkpoints = {checkpoint.asset_id: checkpoint for checkpoint in ChainCheckpoint.objects.all()}
+        depuis_par_asset = {
+            asset.pk: None if options["full"] else self._point_de_reprise(asset, checkpoints.get(asset.pk))
+            for asset in assets
+        }
+
+        rapports = self._verifie(list(depuis_par_asset.items()), options["workers"])
+
+        # Fusion des rapports par asset, dans l'ordre des noms.
+        # / Merge the per-asset reports, in name order.
+        totaux = {'nb_links': 0, 'invalid_hashes': 0, 'forks': 0, 'gaps': 0}
+        for asset in assets:
+            rapport = rapports[asset.pk]
+            self._affiche(asset, rapport)
+            totaux['nb_links'] += rapport['nb_links']
+            for champ in ('invalid_hashes', 'forks', 'gaps'):
+                totaux[champ] += len(rapport[champ])
+
+            if not options["dry_run"]:
+                depuis = depuis_par_asset[asset.pk]
+                self._enregistre(asset, checkpoints.get(asset.pk), rapport, complet=depuis is None)
+
+        total_anomalies = totaux['invalid_hashes'] + totaux['forks'] + totaux['gaps']
+        self.stdout.write(
+            f"{len(assets)} assets, {totaux['nb_links']} maillons verifies, "
+            f"{totaux['invalid_hashes']} hash invalides, {totaux['forks']} forks, {totaux['gaps']} trous.")
+        if total_anomalies:
+            self.stdout.write(self.style.ERROR(f"{total_anomalies} anomalies detectees."))
+        else:
+            self.stdout.write(self.style.SUCCESS("Chaines verifiees : aucune anomalie."))
@@ -0,0 +1,32 @@
+"""
+Capture du corps brut des requetes POST signees.
+/ Raw body capture for signed POST requests.
+
+LOCALISATION : fedow_core/middleware.py
+
+Un client qui envoie le header `Signature-Mode: raw-body` signe les octets exacts
+du corps de la requete. Le middleware les garde une fois dans `request.raw_body`,
+les permissions de fedow_core/permissions.py les verifient tels quels : plus de
+json.dumps + base64 de request.data pour reconstruire le message signe.
+Sans ce header, rien n'est capture et l'ancien schema (data_to_b64) s'applique.
+/ With `Signature-Mode: raw-body` the exact body bytes are kept once in
+`request.raw_body` and verified as-is by the permissions; otherwise nothing
+is captured and the legacy data_to_b64 scheme applies.
+"""
+
+SIGNATURE_MODE_HEADER = 'Signature-Mode'
+SIGNATURE_MODE_RAW_BODY = 'raw-body'
+
+
+class RawBodySignatureMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if (request.method == 'POST'
+                and request.headers.get(SIGNATURE_MODE_HEADER) == SIGNATURE_MODE_RAW_BODY):
+            # request.body garde les octets : le parser DRF relit la meme copie.
+            # / request.body keeps the bytes: the DRF parser reads the same copy.
+            request.raw_body = request.body
+        return self.get_response(request)
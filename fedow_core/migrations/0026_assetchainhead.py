@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-18 00:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def init_chain_heads(apps, schema_editor):
+    # La tete de chaine de chaque asset existant = son dernier maillon par date,
+    # exactement ce que choisissait l'ancien _previous_asset_transaction().
+    # / Each existing asset head = its latest link by datetime (former behaviour).
+    Asset = apps.get_model('fedow_core', 'Asset')
+    Transaction = apps.get_model('fedow_core', 'Transaction')
+    AssetChainHead = apps.get_model('fedow_core', 'AssetChainHead')
+    for asset in Asset.objects.all():
+        last = Transaction.objects.filter(asset=asset).order_by('datetime').last()
+        if last:
+            AssetChainHead.objects.create(asset=asset, transaction=last)
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fedow_core', '0025_alter_checkoutstripe_checkout_session_id_stripe'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AssetChainHead',
+            fields=[
+                ('asset', models.OneToOneField(on_delete=django.db.models.deletion.PROTECT, primary_key=True, related_name='chain_head', serialize=False, to='fedow_core.asset')),
+                ('transaction', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='fedow_core.transaction')),
+            ],
+        ),
+        migrations.RunPython(init_chain_heads, migrations.RunPython.noop),
+    ]
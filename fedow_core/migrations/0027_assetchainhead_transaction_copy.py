@@ -0,0 +1,40 @@
+# Generated by Django 4.2.30 on 2026-10-18 00:35
+
+from django.db import migrations, models
+
+
+def copy_head_transaction(apps, schema_editor):
+    # Recopie hash / date / action du maillon de tete des assets existants.
+    # / Copy hash / datetime / action of the existing head links.
+    AssetChainHead = apps.get_model('fedow_core', 'AssetChainHead')
+    for head in AssetChainHead.objects.select_related('transaction'):
+        head.transaction_hash = head.transaction.hash
+        head.transaction_datetime = head.transaction.datetime
+        head.transaction_action = head.transaction.action
+        head.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fedow_core', '0026_assetchainhead'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assetchainhead',
+            name='transaction_action',
+            field=models.CharField(blank=True, choices=[('FST', 'Premier bloc'), ('SAL', "Vente d'article"), ('QRS', 'Vente via QrCode ou NFC'), ('CRE', 'Creation monétaire'), ('REF', 'Recharge'), ('TRF', 'Transfert'), ('SUB', 'Abonnement ou adhésion'), ('BDG', 'Badgeuse'), ('FUS', 'Fusion de deux wallets'), ('RFD', 'Remboursement'), ('VID', 'Dissocciation de la carte et du wallet user'), ('BNK', 'Remise en banque'), ('COR', 'Correction de dérive (réconciliation)')], max_length=3, null=True),
+        ),
+        migrations.AddField(
+            model_name='assetchainhead',
+            name='transaction_datetime',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='assetchainhead',
+            name='transaction_hash',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.RunPython(copy_head_transaction, migrations.RunPython.noop),
+    ]
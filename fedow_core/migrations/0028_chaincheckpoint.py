@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-18 00:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fedow_core', '0027_assetchainhead_transaction_copy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChainCheckpoint',
+            fields=[
+                ('asset', models.OneToOneField(on_delete=django.db.models.deletion.PROTECT, primary_key=True, related_name='chain_checkpoint', serialize=False, to='fedow_core.asset')),
+                ('transaction_hash', models.CharField(max_length=64)),
+                ('transaction_datetime', models.DateTimeField()),
+                ('verified_at', models.DateTimeField(auto_now=True)),
+                ('nb_links', models.PositiveIntegerField(default=0)),
+                ('nb_invalid_hashes', models.PositiveIntegerField(default=0)),
+                ('nb_forks', models.PositiveIntegerField(default=0)),
+                ('nb_gaps', models.PositiveIntegerField(default=0)),
+                ('transaction', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='fedow_core.transaction')),
+            ],
+        ),
+    ]
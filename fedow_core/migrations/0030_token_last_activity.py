@@ -0,0 +1,45 @@
+# Generated by Django 4.2.30 on 2026-10-18 01:19
+
+from django.db import migrations, models
+
+
+def backfill_last_activity(apps, schema_editor):
+    # Un seul parcours de la table par date croissante : la derniere transaction
+    # vue pour (wallet, asset) est la derniere activite du token.
+    # / Single pass in date order: the last transaction seen for (wallet, asset)
+    # is the token last activity.
+    Token = apps.get_model('fedow_core', 'Token')
+    Transaction = apps.get_model('fedow_core', 'Transaction')
+    derniere = {}
+    for uuid, sender, receiver, asset, date in (Transaction.objects.order_by('datetime')
+            .values_list('uuid', 'sender_id', 'receiver_id', 'asset_id', 'datetime').iterator()):
+        derniere[(sender, asset)] = (uuid, date)
+        derniere[(receiver, asset)] = (uuid, date)
+
+    tokens = []
+    for token in Token.objects.only('uuid', 'wallet_id', 'asset_id').iterator():
+        if (token.wallet_id, token.asset_id) in derniere:
+            token.last_transaction_id, token.last_activity_at = derniere[(token.wallet_id, token.asset_id)]
+            tokens.append(token)
+    Token.objects.bulk_update(tokens, ['last_transaction_id', 'last_activity_at'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fedow_core', '0029_transaction_hot_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='token',
+            name='last_activity_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='token',
+            name='last_transaction_id',
+            field=models.UUIDField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_last_activity, migrations.RunPython.noop),
+    ]
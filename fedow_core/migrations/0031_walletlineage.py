@@ -0,0 +1,50 @@
+# Generated by Django 4.2.30 on 2026-10-18 01:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+def backfill_lineage(apps, schema_editor):
+    # Rejoue les FUSION par date : meme fermeture que WalletLineage.link().
+    # / Replay FUSION transactions in date order: same closure as WalletLineage.link().
+    Transaction = apps.get_model('fedow_core', 'Transaction')
+    WalletLineage = apps.get_model('fedow_core', 'WalletLineage')
+    ancetres = {}
+    for wallet_id, ancestor_id in (Transaction.objects.filter(action='FUS').order_by('datetime')
+                                   .values_list('receiver_id', 'sender_id')):
+        if wallet_id == ancestor_id:
+            continue
+        herites = {ancestor_id} | ancetres.get(ancestor_id, set())
+        for descendant, ses_ancetres in list(ancetres.items()):
+            if wallet_id in ses_ancetres:
+                ses_ancetres.update(herites - {descendant})
+        ancetres.setdefault(wallet_id, set()).update(herites - {wallet_id})
+
+    WalletLineage.objects.bulk_create([
+        WalletLineage(wallet_id=wallet_id, ancestor_id=ancestor_id)
+        for wallet_id, ses_ancetres in ancetres.items() for ancestor_id in ses_ancetres
+    ], batch_size=500, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fedow_core', '0030_token_last_activity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WalletLineage',
+            fields=[
+                ('uuid', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='descendants', to='fedow_core.wallet')),
+                ('wallet', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='lineage', to='fedow_core.wallet')),
+            ],
+            options={
+                'unique_together': {('wallet', 'ancestor')},
+            },
+        ),
+        migrations.RunPython(backfill_lineage, migrations.RunPython.noop),
+    ]
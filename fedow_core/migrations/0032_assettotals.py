@@ -0,0 +1,55 @@
+# Generated by Django 4.2.30 on 2026-10-18 02:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Sum
+
+
+def backfill_totals(apps, schema_editor):
+    # Meme calcul que AssetTotals.from_sums(), groupe par asset.
+    # / Same computation as AssetTotals.from_sums(), grouped by asset.
+    Asset = apps.get_model('fedow_core', 'Asset')
+    Token = apps.get_model('fedow_core', 'Token')
+    Transaction = apps.get_model('fedow_core', 'Transaction')
+    AssetTotals = apps.get_model('fedow_core', 'AssetTotals')
+
+    def par_asset(queryset, champ):
+        return dict(queryset.values('asset').annotate(total=Sum(champ)).values_list('asset', 'total'))
+
+    in_places = par_asset(Token.objects.filter(wallet__place__isnull=False), 'value')
+    in_wallets = par_asset(Token.objects.filter(wallet__place__isnull=True), 'value')
+    deposited = par_asset(Transaction.objects.filter(action='BNK'), 'amount')
+    created = par_asset(Transaction.objects.filter(action='CRE'), 'amount')
+    AssetTotals.objects.bulk_create([
+        AssetTotals(
+            asset_id=asset_id,
+            in_places=in_places.get(asset_id) or 0,
+            in_wallets=in_wallets.get(asset_id) or 0,
+            deposited=deposited.get(asset_id) or 0,
+            created=created.get(asset_id) or 0,
+        )
+        for asset_id in Asset.objects.values_list('pk', flat=True)
+    ], batch_size=500, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fedow_core', '0031_walletlineage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AssetTotals',
+            fields=[
+                ('asset', models.OneToOneField(on_delete=django.db.models.deletion.PROTECT, primary_key=True, related_name='totals', serialize=False, to='fedow_core.asset')),
+                ('in_places', models.BigIntegerField(default=0)),
+                ('in_wallets', models.BigIntegerField(default=0)),
+                ('deposited', models.BigIntegerField(default=0)),
+                ('created', models.BigIntegerField(default=0)),
+                ('checked_at', models.DateTimeField(blank=True, null=True)),
+                ('drift', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 02:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fedow_core', '0033_webhookoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='checkoutstripe',
+            name='progress_since',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
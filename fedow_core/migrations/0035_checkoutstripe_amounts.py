@@ -0,0 +1,42 @@
+# Generated by Django 4.2.30 on 2026-10-18 02:21
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_amounts(apps, schema_editor):
+    # Le REFILL d'un checkout porte son montant (amount_total), les REFUND ce qui a deja
+    # ete rembourse : reprise sans appel Stripe.
+    # / A checkout's REFILL holds its amount, its REFUNDs what was refunded: no Stripe call.
+    CheckoutStripe = apps.get_model('fedow_core', 'CheckoutStripe')
+    Transaction = apps.get_model('fedow_core', 'Transaction')
+
+    recharge = Transaction.objects.filter(checkout_stripe=OuterRef('pk'), action='REF')
+    rembourse = (Transaction.objects.filter(checkout_stripe=OuterRef('pk'), action='RFD')
+                 .values('checkout_stripe').annotate(total=Sum('amount')).values('total'))
+    CheckoutStripe.objects.filter(transactions__action='REF').update(
+        amount_paid=Subquery(recharge.values('amount')[:1]),
+        amount_refunded=Coalesce(Subquery(rembourse), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fedow_core', '0034_checkoutstripe_progress_since'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='checkoutstripe',
+            name='amount_paid',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='checkoutstripe',
+            name='amount_refunded',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_amounts, migrations.RunPython.noop),
+    ]
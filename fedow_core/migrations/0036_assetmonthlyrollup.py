@@ -0,0 +1,49 @@
+# Generated by Django 4.2.30 on 2026-10-18 02:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+
+
+def backfill_rollup(apps, schema_editor):
+    # Meme calcul que AssetMonthlyRollup.from_transactions(), groupe par case.
+    # / Same computation as AssetMonthlyRollup.from_transactions(), grouped by cell.
+    Transaction = apps.get_model('fedow_core', 'Transaction')
+    AssetMonthlyRollup = apps.get_model('fedow_core', 'AssetMonthlyRollup')
+
+    cases = (Transaction.objects
+             .annotate(mois=TruncMonth('datetime'))
+             .values('asset', 'mois', 'action')
+             .annotate(nombre=Count('uuid'), somme=Sum('amount')))
+    AssetMonthlyRollup.objects.bulk_create([
+        AssetMonthlyRollup(asset_id=case['asset'], month=case['mois'].date(), action=case['action'],
+                           count=case['nombre'], total=case['somme'] or 0)
+        for case in cases.iterator() if case['mois']
+    ], batch_size=500, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fedow_core', '0035_checkoutstripe_amounts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AssetMonthlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('action', models.CharField(choices=[('FST', 'Premier bloc'), ('SAL', "Vente d'article"), ('QRS', 'Vente via QrCode ou NFC'), ('CRE', 'Creation monétaire'), ('REF', 'Recharge'), ('TRF', 'Transfert'), ('SUB', 'Abonnement ou adhésion'), ('BDG', 'Badgeuse'), ('FUS', 'Fusion de deux wallets'), ('RFD', 'Remboursement'), ('VID', 'Dissocciation de la carte et du wallet user'), ('BNK', 'Remise en banque'), ('COR', 'Correction de dérive (réconciliation)')], max_length=3)),
+                ('count', models.BigIntegerField(default=0)),
+                ('total', models.BigIntegerField(default=0)),
+                ('asset', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='monthly_rollups', to='fedow_core.asset')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='assetmonthlyrollup',
+            constraint=models.UniqueConstraint(fields=('asset', 'month', 'action'), name='rollup_asset_month_action_unique'),
+        ),
+        migrations.RunPython(backfill_rollup, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-18 03:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fedow_core', '0036_assetmonthlyrollup'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transaction',
+            name='asset',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='transactions', to='fedow_core.asset'),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='receiver',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='transactions_received', to='fedow_core.wallet'),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='sender',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='transactions_sent', to='fedow_core.wallet'),
+        ),
+    ]
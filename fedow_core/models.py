@@ -2,6 +2,8 @@ import hashlib
 import json
 import logging
 import os
+from collections import defaultdict
+from datetime import datetime, time, timedelta
 from unicodedata import category
 from uuid import uuid4
 
@@ -12,7 +14,7 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AbstractUser
 from django.core.cache import cache
 from django.core.signing import Signer
-from django.db import models
+from django.db import models, IntegrityError, transaction as db_transaction
 from django.db.models import UniqueConstraint, Q, Sum, F
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
@@ -22,7 +24,7 @@ from stdimage import JPEGField
 from stdimage.validators import MaxSizeValidator, MinSizeValidator
 from stripe import InvalidRequestError
 
-from fedow_core.utils import get_public_key, fernet_decrypt, fernet_encrypt, rsa_generator, utf8_b64_to_dict
+from fedow_core.utils import get_public_key, public_key_cache, fernet_decrypt, fernet_encrypt, rsa_generator, utf8_b64_to_dict
 
 logger = logging.getLogger(__name__)
 
@@ -67,6 +69,90 @@ class CheckoutStripe(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT, related_name='checkout_stripe', blank=True, null=True)
     metadata = models.CharField(editable=False, db_index=False, max_length=500)
 
+    # Debut du traitement en cours (PROGRESS) : au-dela de CHECKOUT_CLAIM_TIMEOUT, le
+    # worker est considere comme mort et le checkout peut etre repris.
+    # / Start of the current processing: past CHECKOUT_CLAIM_TIMEOUT it can be reclaimed.
+    progress_since = models.DateTimeField(blank=True, null=True, editable=False)
+
+    # Montants en centimes tenus localement : amount_paid est pose a la validation du
+    # paiement, amount_refunded augmente a chaque remboursement. Le plan de remboursement
+    # se calcule sans appel Stripe.
+    # / Amounts in cents kept locally: set on validation, increased on each refund.
+    amount_paid = models.PositiveIntegerField(blank=True, null=True, editable=False)
+    amount_refunded = models.PositiveIntegerField(default=0, editable=False)
+
+    # Machine a etats de la validation d'un paiement en ligne :
+    #   CREATED / OPEN --claim()--> PROGRESS --> PAID | ERROR
+    #                    PROGRESS --release()--> OPEN (pas encore paye, erreur passagere)
+    # / Online payment validation state machine.
+    CLAIMABLE = (CREATED, OPEN)
+
+    def claim(self) -> bool:
+        """
+        Prend le checkout pour le valider, par compare-and-swap : un seul webhook
+        ou retour d'URL gagne, les autres repondent tout de suite (202 / 208).
+        / Claims the checkout by compare-and-swap: a single delivery wins.
+        """
+        maintenant = timezone.now()
+        expire = maintenant - timedelta(seconds=settings.CHECKOUT_CLAIM_TIMEOUT)
+        pris = CheckoutStripe.objects.filter(
+            Q(status__in=self.CLAIMABLE) | Q(status=self.PROGRESS, progress_since__lt=expire),
+            pk=self.pk,
+        ).update(status=self.PROGRESS, progress_since=maintenant)
+        self.refresh_from_db(fields=['status', 'progress_since'])
+        return bool(pris)
+
+    def conclude(self, status, **fields) -> bool:
+        """
+        Ecriture de cloture (PAID, ERROR, OPEN) conditionnee au claim de CE worker :
+        si un autre a repris le checkout apres expiration, rien n'est ecrase.
+        / Closing write conditioned on THIS worker's claim: a checkout reclaimed by
+        another worker after expiry is never overwritten.
+        """
+        conclu = CheckoutStripe.objects.filter(
+            pk=self.pk, status=self.PROGRESS, progress_since=self.progress_since,
+        ).update(status=status, progress_since=None, **fields)
+        # progress_since n'est pas relu : il reste la preuve du claim de ce worker.
+        # / progress_since is not reloaded: it stays this worker's claim token.
+        self.refresh_from_db(fields=['status', *fields])
+        return bool(conclu)
+
+    def release(self):
+        # Rend la main sans conclure : une prochaine livraison pourra reprendre.
+        # / Hands the checkout back without concluding: a later delivery can retry.
+        return self.conclude(self.OPEN)
+
+    # Statuts d'un paiement dont il peut rester quelque chose a rembourser.
+    # / Statuses of a payment that may still have something to refund.
+    REFUNDABLE = (PAID, WALLET_USER_OK, REFUND)
+
+    def refundable_amount(self) -> int:
+        return max((self.amount_paid or 0) - self.amount_refunded, 0)
+
+    @staticmethod
+    def refund_plan(checkouts, to_refund: int) -> dict:
+        """
+        Repartit un remboursement sur les paiements, du plus recent au plus ancien.
+        Un seul paiement suffisant est prefere a plusieurs. Calcul local, sans Stripe.
+        / Splits a refund over the payments, newest first; a single sufficient
+        payment is preferred. Local computation, no Stripe call.
+
+        :return: {CheckoutStripe: montant} ; vide si aucun paiement remboursable.
+        """
+        plan = {}
+        rest_to_refund = to_refund
+        for checkout in checkouts:
+            refundable = checkout.refundable_amount()
+            if not refundable:
+                continue
+            if refundable >= to_refund:
+                return {checkout: to_refund}
+            plan[checkout] = min(refundable, rest_to_refund)
+            rest_to_refund -= plan[checkout]
+            if rest_to_refund == 0:
+                break
+        return plan
+
     def unsign_metadata(self):
         signer = Signer()
         return utf8_b64_to_dict(signer.unsign(self.metadata))
@@ -96,13 +182,35 @@ class CheckoutStripe(models.Model):
         return stripe.PaymentIntent.retrieve(intent_payment_id_stripe)
 
 
+    def get_intent_payment_id(self):
+        # L'id est enregistre a la validation : pas d'aller-retour Stripe dans ce cas.
+        # / The id is stored on validation: no Stripe round trip in that case.
+        if self.intent_payment_id_stripe:
+            return self.intent_payment_id_stripe
+        if self.checkout_session_id_stripe and "pi_" in self.checkout_session_id_stripe:
+            return self.checkout_session_id_stripe
+        checkout = self.get_stripe_checkout()
+        return checkout.payment_intent if checkout else None
+
+    def record_refund(self, amount):
+        """
+        Inscrit un remboursement dans le meme bloc atomique que la transaction REFUND :
+        tant que le maillon n'est pas ecrit, amount_refunded ne bouge pas et la cle
+        d'idempotence Stripe d'un nouvel essai reste la meme.
+        / Records a refund in the REFUND transaction's atomic block: until the link is
+        written, amount_refunded does not move and a retry keeps the same Stripe key.
+        """
+        CheckoutStripe.objects.filter(pk=self.pk).update(
+            status=self.REFUND, amount_refunded=F('amount_refunded') + amount)
+        self.refresh_from_db(fields=['status', 'amount_refunded'])
+
     def refund_payment_intent(self, amount, idempotency_key=None):
         if not amount :
             raise Exception(f"CheckoutStripe Refund : {self.uuid} without amount")
         config = Configuration.get_solo()
         stripe.api_key = config.get_stripe_api()
 
-        payment_intent_stripe_id = self.get_intent_payment()
+        payment_intent_stripe_id = self.get_intent_payment_id()
 
         try :
             logger.info(f"launch stripe refund for {payment_intent_stripe_id} amount {amount}")
@@ -117,8 +225,6 @@ class CheckoutStripe(models.Model):
                 idempotency_key=idempotency_key,
             )
             logger.info(f"Refund response : \n{refund}")
-            self.status = self.REFUND
-            self.save()
         except InvalidRequestError as e:
             logger.error(f"CheckoutStripe Refund InvalidRequestError {e}")
             raise Exception(f"CheckoutStripe Refund InvalidRequestError {e}")
@@ -201,17 +307,22 @@ class Asset(models.Model):
     # A Stripe Chekcout must be associated to the transaction creation money
     id_price_stripe = models.CharField(max_length=30, blank=True, null=True, editable=False)
 
+    def running_totals(self) -> 'AssetTotals':
+        # Totaux tenus a jour par Transaction.save() (cf AssetTotals) : une lecture par cle.
+        # / Totals kept up to date by Transaction.save(): one primary key read.
+        return AssetTotals.for_asset(self.pk)
+
     def total_token_value(self):
-        return self.tokens.aggregate(total_value=Sum('value'))['total_value'] or 0
+        return self.running_totals().in_circulation
 
     def total_in_place(self):
-        return self.tokens.filter(wallet__place__isnull=False).aggregate(total_value=Sum('value'))['total_value'] or 0
+        return self.running_totals().in_places
 
     def total_in_wallet_not_place(self):
-        return self.tokens.filter(wallet__place__isnull=True).aggregate(total_value=Sum('value'))['total_value'] or 0
+        return self.running_totals().in_wallets
 
     def total_bank_deposit(self):
-        return self.transactions.filter(action=Transaction.DEPOSIT).aggregate(total_amount=Sum('amount'))['total_amount'] or 0
+        return self.running_totals().deposited
 
     def total_by_place(self):
         """
@@ -284,9 +395,11 @@ class Asset(models.Model):
         return [place.uuid for place in places]
 
     def is_stripe_primary(self):
-        if (self.wallet_origin == Configuration.get_solo().primary_wallet
+        # Categorie et prix d'abord : le singleton n'est lu que pour l'asset fédéré.
+        # / Category and price first: the singleton is only read for the federated asset.
+        if (self.category == Asset.STRIPE_FED_FIAT
                 and self.id_price_stripe != None
-                and self.category == Asset.STRIPE_FED_FIAT):
+                and self.wallet_origin_id == Configuration.get_solo().primary_wallet_id):
             return True
         return False
 
@@ -382,7 +495,19 @@ class Wallet(models.Model):
         return False
 
     def public_key(self) -> rsa.RSAPublicKey:
-        return get_public_key(self.public_pem)
+        # Cle chargee une fois par processus, rechargee si public_pem change.
+        # / Loaded once per process, reloaded when public_pem changes.
+        return public_key_cache.get(f"wallet:{self.uuid}", self.public_pem)
+
+    def lineage_ids(self) -> list:
+        """
+        Ce wallet et tous les wallets fusionnes dedans (cartes anonymes puis
+        declarees), a toutes les profondeurs : une requete sur WalletLineage.
+        / This wallet and every wallet merged into it, at any depth: one query.
+
+        LOCALISATION : fedow_core/models.py
+        """
+        return [self.pk] + list(self.lineage.values_list('ancestor_id', flat=True))
 
     def has_user_card(self) -> bool:
         if hasattr(self, 'user'):
@@ -394,7 +519,7 @@ class Wallet(models.Model):
     #     return get_private_key(self.private_pem)
 
     def __str__(self):
-        return f"{self.get_name()} - {[(token.asset.name, token.value) for token in self.tokens.all()]}"
+        return f"{self.get_name()} - {[(token.asset.name, token.value) for token in self.tokens.select_related('asset')]}"
 
 
 class Token(models.Model):
@@ -404,6 +529,12 @@ class Token(models.Model):
     wallet = models.ForeignKey(Wallet, on_delete=models.PROTECT, related_name='tokens')
     asset = models.ForeignKey(Asset, on_delete=models.PROTECT, related_name='tokens')
 
+    # Derniere transaction du wallet sur cet asset (emetteur ou receveur), tenue a jour
+    # par Transaction.save() dans le meme UPDATE que le delta de solde.
+    # / Last transaction of the wallet on this asset (sender or receiver), maintained by
+    # Transaction.save() in the same UPDATE as the balance delta.
+    last_transaction_id = models.UUIDField(blank=True, null=True, editable=False)
+    last_activity_at = models.DateTimeField(blank=True, null=True, editable=False)
 
     def name(self):
         return self.asset.name
@@ -424,17 +555,17 @@ class Token(models.Model):
 
     def last_transaction(self):
         # The transaction the most recent of the wallet.
-        # exclude transaction Fusion
-        #TODO: mettre en cache, souvent appelé
-        return self.asset.transactions.filter(
-            Q(sender=self.wallet) | Q(receiver=self.wallet)
-        ).order_by('datetime').last()
+        # Lecture d'une ligne par sa clé, mémorisée sur l'instance (le serializer
+        # l'appelle aussi via start_membership_date).
+        # / Single-row read by primary key, memoized on the instance.
+        if not self.last_transaction_id:
+            return None
+        if not hasattr(self, '_last_transaction'):
+            self._last_transaction = Transaction.objects.filter(pk=self.last_transaction_id).first()
+        return self._last_transaction
 
     def last_transaction_datetime(self):
-        last_transaction = self.last_transaction()
-        if last_transaction:
-            return last_transaction.datetime
-        return None
+        return self.last_activity_at
 
     def start_membership_date(self):
         # Only for membership asset
@@ -453,6 +584,80 @@ class Token(models.Model):
         unique_together = [['wallet', 'asset']]
 
 
+def prefetch_last_transactions(tokens) -> list:
+    """
+    Charge en une requete la derniere transaction de chaque token (avec les wallets
+    pour leur nom et le parent pour verify_hash), au lieu d'une lecture par token.
+    / Loads the last transaction of every token in one query (with the wallets for
+    their names and the parent for verify_hash), instead of one read per token.
+
+    LOCALISATION : fedow_core/models.py
+    """
+    tokens = list(tokens)
+    ids = {token.last_transaction_id for token in tokens if token.last_transaction_id}
+    transactions = {}
+    if ids:
+        transactions = Transaction.objects.select_related(
+            'sender__place', 'sender__primary', 'receiver__place', 'receiver__primary',
+            'previous_transaction', 'checkout_stripe',
+        ).in_bulk(ids)
+    for token in tokens:
+        token._last_transaction = transactions.get(token.last_transaction_id)
+    return tokens
+
+
+class WalletLineage(models.Model):
+    """
+    Lignee des wallets fusionnes : une ligne par couple (wallet, ancetre), a toutes
+    les profondeurs (table de fermeture). Ecrite par la branche FUSION de
+    Transaction.save(), dans la meme ecriture que le maillon.
+    / Lineage of fused wallets: one row per (wallet, ancestor) pair at every depth
+    (closure table), written by the FUSION branch of Transaction.save().
+
+    LOCALISATION : fedow_core/models.py
+
+    Historique, remboursement et reconstruction de solde lisent toute la lignee en
+    une requete : sender_id IN (...) OR receiver_id IN (...).
+    """
+    uuid = models.UUIDField(primary_key=True, default=uuid4, editable=False)
+    wallet = models.ForeignKey(Wallet, on_delete=models.PROTECT, related_name='lineage')
+    ancestor = models.ForeignKey(Wallet, on_delete=models.PROTECT, related_name='descendants')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = [['wallet', 'ancestor']]
+
+    @classmethod
+    def link(cls, wallet_id, ancestor_id):
+        """
+        ancestor_id fusionne dans wallet_id : chaque descendant de wallet_id (lui
+        compris) herite d'ancestor_id et de tous ses ancetres.
+        / ancestor_id merged into wallet_id: every descendant of wallet_id (itself
+        included) inherits ancestor_id and all of its ancestors.
+        """
+        if wallet_id == ancestor_id:
+            return
+        ancetres = {ancestor_id} | set(cls.objects.filter(wallet_id=ancestor_id).values_list('ancestor_id', flat=True))
+        descendants = {wallet_id} | set(cls.objects.filter(ancestor_id=wallet_id).values_list('wallet_id', flat=True))
+        cls.objects.bulk_create([
+            cls(wallet_id=descendant, ancestor_id=ancetre)
+            for descendant in descendants for ancetre in ancetres if descendant != ancetre
+        ], ignore_conflicts=True)
+
+
+# Nombre de raccrochages a la tete de chaine avant d'abandonner l'ecriture.
+# / Relink attempts on the chain head before giving up the write.
+CHAIN_APPEND_MAX_RETRY = 20
+
+
+class ChainHeadConflict(Exception):
+    """
+    La tete de chaine de l'asset a bouge entre la lecture du parent et l'ecriture.
+    / The asset chain head moved between reading the parent and writing.
+    """
+    pass
+
+
 class Transaction(models.Model):
     uuid = models.UUIDField(primary_key=True, default=uuid4, editable=False, db_index=False)
     hash = models.CharField(max_length=64, unique=True, editable=False)
@@ -461,9 +666,15 @@ class Transaction(models.Model):
     checkout_stripe = models.ForeignKey(CheckoutStripe, on_delete=models.PROTECT, related_name='transactions',
                                         blank=True, null=True)
 
-    sender = models.ForeignKey(Wallet, on_delete=models.PROTECT, related_name='transactions_sent')
-    receiver = models.ForeignKey(Wallet, on_delete=models.PROTECT, related_name='transactions_received')
-    asset = models.ForeignKey(Asset, on_delete=models.PROTECT, related_name='transactions')
+    # Pas d'index simple : les index composites (sender|receiver|asset, datetime) de Meta.indexes
+    # servent aussi les filtres sur la seule cle etrangere (prefixe gauche).
+    # / No single-column index: the composite (fk, datetime) indexes in Meta.indexes also serve
+    # lookups on the foreign key alone (left prefix).
+    sender = models.ForeignKey(Wallet, on_delete=models.PROTECT, related_name='transactions_sent',
+                               db_index=False)
+    receiver = models.ForeignKey(Wallet, on_delete=models.PROTECT, related_name='transactions_received',
+                                 db_index=False)
+    asset = models.ForeignKey(Asset, on_delete=models.PROTECT, related_name='transactions', db_index=False)
 
     card = models.ForeignKey('Card', on_delete=models.PROTECT, related_name='transactions', blank=True, null=True)
     primary_card = models.ForeignKey('Card', on_delete=models.PROTECT,
@@ -517,10 +728,12 @@ class Transaction(models.Model):
     action = models.CharField(max_length=3, choices=TYPE_ACTION, default=SALE)
 
     def dict_for_hash(self):
+        # Les *_id suffisent (meme valeur que .uuid) : pas de requete par cle etrangere.
+        # / The *_id values are enough (same as .uuid): no query per foreign key.
         dict_for_hash = {
-            'sender': f"{self.sender.uuid}",
-            'receiver': f"{self.receiver.uuid}",
-            'asset': f"{self.asset.uuid}",
+            'sender': f"{self.sender_id}",
+            'receiver': f"{self.receiver_id}",
+            'asset': f"{self.asset_id}",
             'amount': f"{self.amount}",
             'datetime': f"{self.datetime.isoformat()}",
             'subscription_type': f"{self.subscription_type}",
@@ -528,25 +741,130 @@ class Transaction(models.Model):
             'subscription_start_datetime': f"{self.subscription_start_datetime.isoformat()}" if self.subscription_start_datetime else None,
             'last_check': f"{self.last_check.isoformat()}" if self.last_check else None,
             'action': f"{self.action}",
-            'card': f"{self.card.uuid}" if self.card else None,
-            'primary_card': f"{self.primary_card.uuid}" if self.primary_card else None,
+            'card': f"{self.card_id}" if self.card_id else None,
+            'primary_card': f"{self.primary_card_id}" if self.primary_card_id else None,
             'comment': f"{self.comment}",
             'metadata': f"{self.metadata}",
             'checkoupt_stripe': f"{self._checkout_session_id_stripe()}",
-            'previous_asset_transaction_uuid': f"{self.previous_transaction.uuid}",
+            'previous_asset_transaction_uuid': f"{self.previous_transaction_id}",
             'previous_asset_transaction_hash': f"{self.previous_transaction.hash}",
         }
         return dict_for_hash
 
+    def _asset_totals_deltas(self, delta_du_token_sender, delta_du_token_receiver) -> dict:
+        # Memes deltas que les tokens, ranges par colonne de AssetTotals.
+        # / Same deltas as the tokens, sorted into the AssetTotals columns.
+        deltas = defaultdict(int)
+        deltas['in_places' if self.sender.is_place() else 'in_wallets'] += delta_du_token_sender
+        deltas['in_places' if self.receiver.is_place() else 'in_wallets'] += delta_du_token_receiver
+        if self.action == Transaction.DEPOSIT:
+            deltas['deposited'] += self.amount
+        elif self.action == Transaction.CREATION:
+            deltas['created'] += self.amount
+        return {colonne: delta for colonne, delta in deltas.items() if delta}
+
     def _checkout_session_id_stripe(self):
-        if self.checkout_stripe:
+        if self.checkout_stripe_id:
             return self.checkout_stripe.checkout_session_id_stripe
         return None
 
     def _previous_asset_transaction(self):
+        # Le parent est la tete de chaine de l'asset (cf AssetChainHead).
+        # / The parent is the asset chain head (see AssetChainHead).
+        head = AssetChainHead.objects.filter(asset_id=self.asset_id).first()
+        if head:
+            return head.as_parent()
+        # Pas encore de tete : premier bloc de l'asset, ou base anterieure a la table des tetes.
         # Return self if it's the first transaction of the asset
         # Order by date. The newest is the last wrote in database.
-        return self.asset.transactions.all().order_by('datetime').last() or self
+        return Transaction.asset_newest_first(self.asset_id).first() or self
+
+    def _claim_chain_head(self, tete=None):
+        """
+        Compare-and-swap sur la tete de chaine de l'asset : on ne deplace la tete
+        vers ce maillon que si elle pointe toujours sur le parent lu au debut du save.
+        Un UPDATE conditionnel suffit : SQLite serialise les ecritures, le premier
+        arrive gagne, le second voit 0 ligne modifiee et doit se raccrocher.
+        / Compare-and-swap on the asset chain head. The conditional UPDATE is the
+        single serialized append point of the asset: the loser sees 0 rows updated.
+
+        LOCALISATION : fedow_core/models.py
+
+        :param tete: dernier maillon d'un groupe ecrit en une fois (create_chained) ;
+                     par defaut ce maillon.
+        """
+        tete = tete or self
+        previous_uuid = self.previous_transaction.pk
+        if previous_uuid == self.pk:
+            # Premier bloc : la tete n'existe pas encore. Unicite garantie par la pk asset.
+            # / First block: the head does not exist yet. Uniqueness enforced by the asset pk.
+            AssetChainHead.objects.create(asset_id=self.asset_id, **tete._chain_head_values())
+            return
+
+        claimed = AssetChainHead.objects.filter(
+            asset_id=self.asset_id,
+            transaction_id=previous_uuid,
+        ).update(**tete._chain_head_values())
+        if claimed:
+            return
+
+        if AssetChainHead.objects.filter(asset_id=self.asset_id).exists():
+            raise ChainHeadConflict(f"Chain head of asset {self.asset_id} moved, previous {previous_uuid} is stale.")
+
+        # Asset anterieur a la table des tetes et non migre : on initialise la tete.
+        # / Asset older than the head table and not migrated: bootstrap the head.
+        try:
+            with db_transaction.atomic():
+                AssetChainHead.objects.create(asset_id=self.asset_id, **tete._chain_head_values())
+        except IntegrityError:
+            raise ChainHeadConflict(f"Chain head of asset {self.asset_id} created concurrently.")
+
+    def _chain_head_values(self):
+        # Ce que la tete retient du maillon : de quoi chainer le suivant sans relire la ligne.
+        # / What the head keeps from the link: enough to chain the next one without a read.
+        return {
+            'transaction_id': self.pk,
+            'transaction_hash': self.hash,
+            'transaction_datetime': self.datetime,
+            'transaction_action': self.action,
+        }
+
+    def _verify_previous_hash(self):
+        # Un parent lu dans la tete a ete verifie a son ecriture, dans la meme ecriture
+        # que la tete : inutile de recharger sa ligne (et celle de son propre parent).
+        # / A parent read from the head was verified when written with the head.
+        if getattr(self.previous_transaction, 'from_chain_head', False):
+            return True
+        return self.previous_transaction.verify_hash()
+
+    def _reload_previous_if_stale(self):
+        # La copie de la tete ne voit pas une ligne modifiee hors save() (update() direct).
+        # Si la date ne colle pas, on relit la vraie ligne avant de conclure.
+        # / The head copy misses rows updated outside save(): reread the real row on doubt.
+        if (getattr(self.previous_transaction, 'from_chain_head', False)
+                and self.previous_transaction.datetime > self.datetime):
+            self.previous_transaction = Transaction.objects.get(pk=self.previous_transaction.pk)
+
+    def _relink_on_chain_head(self, datetime_auto, parent=None):
+        """
+        Un autre maillon a pris la tete : on se raccroche a la nouvelle tete
+        et on recalcule le hash. Memes controles que dans save().
+        Dans un groupe (create_chained), les maillons suivants gardent leur parent
+        du groupe, deja raccroche : seuls leur date et leur hash suivent.
+        / Another link took the head: relink on the new head and rehash. Later links
+        of a group keep their in-group parent, only datetime and hash follow.
+        """
+        self.previous_transaction = parent or self._previous_asset_transaction()
+        if datetime_auto and self.previous_transaction.datetime > self.datetime:
+            # Date posee par save() : elle suit le temps reel, pas le parent perdu.
+            # / Datetime set by save(): follow the clock, not the lost parent.
+            self.datetime = timezone.localtime()
+        self._reload_previous_if_stale()
+        assert self._verify_previous_hash(), "Previous transaction hash is not valid."
+        assert self.previous_transaction.datetime <= self.datetime, "Datetime must be after previous transaction."
+        if self.action == Transaction.REFILL:
+            assert self.previous_transaction.action == Transaction.CREATION, "Previous transaction of Refill must be a creation money."
+        self.hash = self.create_hash()
 
     def create_hash(self):
         dict_for_hash = self.dict_for_hash()
@@ -560,10 +878,150 @@ class Transaction(models.Model):
         encoded_block = json.dumps(dict_for_hash, sort_keys=True).encode('utf-8')
         return hashlib.sha256(encoded_block).hexdigest() == self.hash
 
+    # Requetes chaudes : construites ici, executees par les vues et la chaine,
+    # expliquees telles quelles par explain_hot_queries.
+    # / Hot queries: built here, run by the views and the chain, explained as-is
+    # by explain_hot_queries.
+
+    @classmethod
+    def asset_newest_first(cls, asset_id):
+        # Repli de _previous_asset_transaction quand l'asset n'a pas encore de tete de chaine.
+        # / Fallback of _previous_asset_transaction when the asset has no chain head yet.
+        return cls.objects.filter(asset_id=asset_id).order_by('-datetime')
+
+    @classmethod
+    def asset_period(cls, asset, start_date, end_date, wallet=None):
+        """
+        Transactions d'un asset sur une periode, hors CREATION (list_by_asset).
+        Avec wallet : seulement celles qu'il a envoyees ou recues.
+        / An asset's transactions over a period, CREATION excluded; with wallet,
+        only the ones it sent or received.
+        """
+        transactions = cls.objects.filter(
+            asset=asset, datetime__gte=start_date, datetime__lte=end_date,
+        ).exclude(action=cls.CREATION).order_by('-datetime')
+        if wallet:
+            transactions = transactions.filter(Q(sender=wallet) | Q(receiver=wallet))
+        return transactions
+
+    @classmethod
+    def wallet_history(cls, wallet_ids):
+        # Historique d'une lignee en un seul OR (pagination par numero de page, remboursement).
+        # / A lineage's history as a single OR (page-number pagination, refund).
+        return cls.objects.filter(Q(sender__in=wallet_ids) | Q(receiver__in=wallet_ids))
+
+    @classmethod
+    def wallet_history_branches(cls, wallet_ids) -> list:
+        # Le meme historique en deux branches, une par index (sender, datetime) / (receiver, datetime).
+        # / The same history as two branches, one per index.
+        return [cls.objects.filter(sender__in=wallet_ids), cls.objects.filter(receiver__in=wallet_ids)]
+
     def save(self, *args, **kwargs):
         # TODO: Checker le lancement via update et create. Utiliser les nouveaux validateur en db de django 5 ?
+        Transaction._append_chain([self], *args, **kwargs)
+
+    @classmethod
+    def create_chained(cls, *champs_des_maillons) -> list['Transaction']:
+        """
+        Ecrit plusieurs maillons consecutifs du meme asset sous une seule prise de
+        tete : la CREATION et la REFILL d'une recharge. Rien ne peut s'intercaler
+        entre eux ; si la tete a bouge, tout le groupe se raccroche et reessaie.
+        / Writes consecutive links of one asset under a single chain head claim
+        (CREATION + REFILL): nothing can land between them.
+
+        LOCALISATION : fedow_core/models.py
+
+        :param champs_des_maillons: un dict de champs par maillon, dans l'ordre de la chaine
+        :return: les maillons ecrits, dans le meme ordre
+        """
+        maillons = [cls(**champs) for champs in champs_des_maillons]
+        cls._append_chain(maillons, force_insert=True)
+        return maillons
+
+    @staticmethod
+    def _append_chain(maillons, *args, **kwargs):
+        """
+        Controle puis ecrit un groupe de maillons. Le premier se chaine sur la tete,
+        chaque suivant sur le precedent du groupe. Un seul compare-and-swap deplace
+        la tete du parent du premier vers le dernier.
+        / Validates then writes a group of links under one compare-and-swap.
+        """
+        parent, en_attente, ecritures = None, defaultdict(int), []
+        for maillon in maillons:
+            ecriture = maillon._prepare_link(parent, en_attente)
+            # Les deltas du groupe pas encore ecrits comptent pour les controles de solde du suivant.
+            # / Pending group deltas count for the next link's balance checks.
+            en_attente[ecriture['token_sender'].pk] += ecriture['delta_du_token_sender']
+            en_attente[ecriture['token_receiver'].pk] += ecriture['delta_du_token_receiver']
+            ecritures.append(ecriture)
+            parent = maillon
+
+        premier, dernier = maillons[0], maillons[-1]
+        # Ecriture courte et atomique : prise de la tete de chaine (CAS), deltas
+        # de solde, insertion du maillon. Le premier UPDATE prend le verrou
+        # d'ecriture SQLite, les autres workers attendent quelques ms au lieu de
+        # forker la chaine (cf TECH_DEV/DRIFT §6). Le webhook Lespass n'est qu'une
+        # ligne d'outbox ecrite dans ce bloc : aucun appel reseau sous ce verrou,
+        # dispatch_webhooks livre apres le commit.
+        # / Short atomic write: chain head CAS, balance deltas, link insert.
+        # The loser of the CAS relinks on the new head and retries.
+        for tentative in range(CHAIN_APPEND_MAX_RETRY):
+            try:
+                with db_transaction.atomic():
+                    premier._claim_chain_head(tete=dernier)
+                    for maillon, ecriture in zip(maillons, ecritures):
+                        maillon._write_link(ecriture, *args, **kwargs)
+                for maillon in maillons:
+                    invalidate_wallet_snapshot(maillon.sender_id, maillon.receiver_id)
+                    # Le parent en memoire est partiel (lu dans la tete) : on laisse
+                    # Django recharger la vraie ligne au prochain acces.
+                    # / The in-memory parent is partial: let Django reload it lazily.
+                    if getattr(maillon.previous_transaction, 'from_chain_head', False):
+                        Transaction.previous_transaction.field.delete_cached_value(maillon)
+                return
+            except ChainHeadConflict:
+                logger.info(f"CHAIN HEAD CONFLICT {premier.asset_id} : relink, tentative {tentative + 1}")
+                premier._relink_on_chain_head(ecritures[0]['datetime_auto'])
+                for precedent, maillon, ecriture in zip(maillons, maillons[1:], ecritures[1:]):
+                    maillon._relink_on_chain_head(ecriture['datetime_auto'], parent=precedent)
+
+        raise ChainHeadConflict(f"Chain head of asset {premier.asset_id} still moving after {CHAIN_APPEND_MAX_RETRY} retries.")
+
+    def _write_link(self, ecriture, *args, **kwargs):
+        # Le meme UPDATE pose la derniere activite du token : la chaine
+        # de l'asset avance par dates croissantes, le dernier ecrit gagne.
+        # / The same UPDATE stamps the token last activity: the asset
+        # chain moves forward in time, the last writer wins.
+        Token.objects.filter(pk=ecriture['token_sender'].pk).update(
+            value=F("value") + ecriture['delta_du_token_sender'],
+            last_transaction_id=self.uuid,
+            last_activity_at=self.datetime,
+        )
+        Token.objects.filter(pk=ecriture['token_receiver'].pk).update(
+            value=F("value") + ecriture['delta_du_token_receiver'],
+            last_transaction_id=self.uuid,
+            last_activity_at=self.datetime,
+        )
+        super(Transaction, self).save(*args, **kwargs)
+        # Apres l'insertion : une ligne creee depuis les SUM compte deja ce maillon.
+        # / After the insert: a row built from the SUMs already counts this link.
+        AssetTotals.apply(self.asset_id, ecriture['deltas_des_totaux'])
+        AssetMonthlyRollup.record(self)
+        if self.action == Transaction.FUSION:
+            WalletLineage.link(self.receiver_id, self.sender_id)
+
+    def _prepare_link(self, parent=None, en_attente=None) -> dict:
+        """
+        Controles metier, soldes et hash d'un maillon, sans rien ecrire.
+        / Business checks, balances and hash of a link, nothing written.
+
+        :param parent: maillon precedent du meme groupe, sinon la tete de chaine
+        :param en_attente: {token_pk: delta} des maillons du groupe pas encore ecrits
+        :return: ce que _write_link() applique
+        """
         if settings.DEBUG:
             logger.info(f"SAVE TRANSACTION {self.action}")
+        datetime_auto = not self.datetime
         if not self.datetime:
             self.datetime = timezone.localtime()
 
@@ -581,6 +1039,10 @@ class Transaction(models.Model):
         except Token.DoesNotExist:
             token_receiver = Token.objects.create(wallet=self.receiver, asset=self.asset)
 
+        if en_attente:
+            token_sender.value += en_attente.get(token_sender.pk, 0)
+            token_receiver.value += en_attente.get(token_receiver.pk, 0)
+
         # On note le solde des tokens au moment ou on les lit. Il servira a
         # calculer la difference (delta) a appliquer en base de donnees.
         # / Snapshot the loaded balances to compute the delta to apply later.
@@ -589,8 +1051,9 @@ class Transaction(models.Model):
 
         ## Check previous transaction
         # Le hash ne peut se faire que si la transaction précédente est validée
-        self.previous_transaction = self._previous_asset_transaction()
-        assert self.previous_transaction.verify_hash(), "Previous transaction hash is not valid."
+        self.previous_transaction = parent or self._previous_asset_transaction()
+        self._reload_previous_if_stale()
+        assert self._verify_previous_hash(), "Previous transaction hash is not valid."
         assert self.previous_transaction.datetime <= self.datetime, "Datetime must be after previous transaction."
 
         # Validator FIRST : First must be unique
@@ -663,7 +1126,7 @@ class Transaction(models.Model):
 
             assert self.receiver.is_place(), "Receiver must be a place wallet"
             assert self.receiver.place, "Receiver must be a place wallet"
-            assert self.asset in self.receiver.place.accepted_assets(), "Asset must be accepted by place"
+            assert self.asset_id in self.receiver.place.accepted_asset_ids(), "Asset must be accepted by place"
             assert not self.receiver.is_primary(), "Receiver is not the primary asset"
             assert not self.sender.is_place(), "Sender must be a user wallet"
 
@@ -689,7 +1152,7 @@ class Transaction(models.Model):
 
             assert self.receiver.is_place(), "Receiver must be a place wallet"
             assert self.receiver.place, "Receiver must be a place wallet"
-            assert self.asset in self.receiver.place.accepted_assets(), "Asset must be accepted by place"
+            assert self.asset_id in self.receiver.place.accepted_asset_ids(), "Asset must be accepted by place"
             assert not self.receiver.is_primary(), "Receiver is not the primary asset"
             assert not self.sender.is_place(), "Sender must be a user wallet"
 
@@ -766,33 +1229,91 @@ class Transaction(models.Model):
         if not self.hash:
             self.hash = self.create_hash()
 
-        if self.verify_hash():
-            # On applique la DIFFERENCE de solde (delta), pas la valeur absolue.
-            # token.save() ecrirait "value = <valeur lue en memoire>" : deux ventes
-            # simultanees liraient le meme solde de depart et la seconde ecraserait
-            # la premiere (lost update). Avec "value = value + delta", c'est SQLite
-            # qui calcule l'increment sur le solde reel courant, et le mode WAL
-            # serialise les ecritures : les montants s'additionnent sans perte.
-            # / Persist the balance delta via F() to prevent concurrent lost updates.
-            delta_du_token_sender = token_sender.value - valeur_du_token_sender_au_chargement
-            delta_du_token_receiver = token_receiver.value - valeur_du_token_receiver_au_chargement
-
-            if delta_du_token_sender != 0:
-                Token.objects.filter(pk=token_sender.pk).update(
-                    value=F("value") + delta_du_token_sender
-                )
-            if delta_du_token_receiver != 0:
-                Token.objects.filter(pk=token_receiver.pk).update(
-                    value=F("value") + delta_du_token_receiver
-                )
-
-            print(f"*** {self.action} : {token_sender} -> {token_receiver}")
-            super(Transaction, self).save(*args, **kwargs)
-        else:
+        if not self.verify_hash():
             raise Exception("Transaction hash already set.")
 
+        # On applique la DIFFERENCE de solde (delta), pas la valeur absolue.
+        # token.save() ecrirait "value = <valeur lue en memoire>" : deux ventes
+        # simultanees liraient le meme solde de depart et la seconde ecraserait
+        # la premiere (lost update). Avec "value = value + delta", c'est SQLite
+        # qui calcule l'increment sur le solde reel courant, et le mode WAL
+        # serialise les ecritures : les montants s'additionnent sans perte.
+        # / Persist the balance delta via F() to prevent concurrent lost updates.
+        delta_du_token_sender = token_sender.value - valeur_du_token_sender_au_chargement
+        delta_du_token_receiver = token_receiver.value - valeur_du_token_receiver_au_chargement
+
+        print(f"*** {self.action} : {token_sender} -> {token_receiver}")
+        return {
+            'datetime_auto': datetime_auto,
+            'token_sender': token_sender,
+            'token_receiver': token_receiver,
+            'delta_du_token_sender': delta_du_token_sender,
+            'delta_du_token_receiver': delta_du_token_receiver,
+            'deltas_des_totaux': self._asset_totals_deltas(delta_du_token_sender, delta_du_token_receiver),
+        }
+
     class Meta:
         ordering = ['-datetime']
+        # Index composites tires des requetes chaudes (cf commande explain_hot_queries).
+        # / Composite indexes designed from the hot queries (see explain_hot_queries).
+        indexes = [
+            # Chaine d'un asset, list_by_asset, tableau de bord par asset.
+            # / Asset chain, list_by_asset, per-asset dashboard.
+            models.Index(fields=['asset', 'datetime'], name='tx_asset_datetime_idx'),
+            # Historique d'un wallet (sender OU receiver, tri par date) : un index par branche du OR.
+            # / Wallet history (sender OR receiver, ordered by date): one index per OR branch.
+            models.Index(fields=['sender', 'datetime'], name='tx_sender_datetime_idx'),
+            models.Index(fields=['receiver', 'datetime'], name='tx_receiver_datetime_idx'),
+            # Sommes par action et asset (tableau de bord, reconcile_tokens) : index couvrant.
+            # / Sums per action and asset (dashboard, reconcile_tokens): covering index.
+            models.Index(fields=['action', 'asset', 'amount'], name='tx_action_asset_amount_idx'),
+        ]
+
+
+class AssetChainHead(models.Model):
+    """
+    Tete de chaine d'un asset : le dernier maillon ecrit, une ligne par asset.
+    / Chain head of an asset: the last written link, one row per asset.
+
+    LOCALISATION : fedow_core/models.py
+
+    C'est le point d'ajout unique et serialise de la chaine de hash d'un asset.
+    Transaction.save() ne choisit plus son parent par "le plus recent par date"
+    (source des forks, cf TECH_DEV/DRIFT §6) : il lit la tete puis la deplace
+    par compare-and-swap dans la meme ecriture que l'insertion du maillon.
+    / Single serialized append point of the asset hash chain.
+    """
+    asset = models.OneToOneField(Asset, on_delete=models.PROTECT, primary_key=True, related_name='chain_head')
+    transaction = models.ForeignKey(Transaction, on_delete=models.PROTECT, related_name='+')
+
+    # Copie du maillon de tete, ecrite dans le meme UPDATE que le pointeur.
+    # Le save() suivant chaine dessus en O(1), sans relire la transaction.
+    # / Copy of the head link, written in the same UPDATE as the pointer.
+    transaction_hash = models.CharField(max_length=64, blank=True, null=True)
+    transaction_datetime = models.DateTimeField(blank=True, null=True)
+    transaction_action = models.CharField(max_length=3, choices=Transaction.TYPE_ACTION, blank=True, null=True)
+
+    def as_parent(self) -> Transaction:
+        """
+        Le maillon de tete, pret a servir de previous_transaction.
+        Instance partielle (uuid, hash, datetime, action) : tout ce que save() lit
+        sur son parent. Si la copie n'est pas encore remplie, on lit la vraie ligne.
+        / The head link, ready to be used as previous_transaction. Partial instance.
+        """
+        if not self.transaction_hash:
+            return self.transaction
+        parent = Transaction(
+            uuid=self.transaction_id,
+            hash=self.transaction_hash,
+            datetime=self.transaction_datetime,
+            action=self.transaction_action,
+            asset_id=self.asset_id,
+        )
+        parent.from_chain_head = True
+        return parent
+
+    def __str__(self):
+        return f"{self.asset.name} -> {self.transaction_id}"
 
 
 # #
@@ -821,6 +1342,219 @@ class Transaction(models.Model):
 #         return cls.work_hours(employee, date) < 4
 #
 
+class ChainCheckpoint(models.Model):
+    """
+    Point de reprise de la verification de chaine d'un asset (commande verify_chain).
+    / Resume point of the chain verification of an asset (verify_chain command).
+
+    LOCALISATION : fedow_core/models.py
+
+    Dernier maillon verifie + compteurs cumules des anomalies trouvees depuis le
+    debut. La verification nocturne ne relit que les maillons posterieurs.
+    """
+    asset = models.OneToOneField(Asset, on_delete=models.PROTECT, primary_key=True, related_name='chain_checkpoint')
+    transaction = models.ForeignKey(Transaction, on_delete=models.PROTECT, related_name='+')
+    transaction_hash = models.CharField(max_length=64)
+    transaction_datetime = models.DateTimeField()
+    verified_at = models.DateTimeField(auto_now=True)
+
+    nb_links = models.PositiveIntegerField(default=0)
+    nb_invalid_hashes = models.PositiveIntegerField(default=0)
+    nb_forks = models.PositiveIntegerField(default=0)
+    nb_gaps = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.asset.name} : {self.nb_links} links verified at {self.verified_at}"
+
+
+class AssetTotals(models.Model):
+    """
+    Totaux courants d'un asset, une ligne par asset.
+    / Running totals of an asset, one row per asset.
+
+    LOCALISATION : fedow_core/models.py
+
+    Transaction.save() y applique les memes deltas que sur les tokens, en F(),
+    dans le meme bloc atomique : plus de SUM sur tous les tokens a chaque
+    affichage (serializer, admin, tableau de bord). La commande
+    reconcile_asset_totals compare chaque nuit ces totaux aux SUM reelles.
+    / Transaction.save() applies the token deltas here too, in the same atomic
+    block. reconcile_asset_totals checks them nightly against the real SUMs.
+    """
+    asset = models.OneToOneField(Asset, on_delete=models.PROTECT, primary_key=True, related_name='totals')
+    # Tokens dans les wallets de lieux / dans les autres wallets (users, primaire, ephemeres).
+    # / Tokens in place wallets / in every other wallet.
+    in_places = models.BigIntegerField(default=0)
+    in_wallets = models.BigIntegerField(default=0)
+    # Cumul des DEPOSIT (retours en banque) et des CREATION.
+    # / Cumulated DEPOSIT and CREATION amounts.
+    deposited = models.BigIntegerField(default=0)
+    created = models.BigIntegerField(default=0)
+
+    # Derniere reconciliation et ecart trouve (somme des ecarts absolus).
+    # / Last reconciliation and gap found (sum of absolute gaps).
+    checked_at = models.DateTimeField(blank=True, null=True)
+    drift = models.BigIntegerField(default=0)
+
+    COLUMNS = ('in_places', 'in_wallets', 'deposited', 'created')
+
+    @property
+    def in_circulation(self):
+        return self.in_places + self.in_wallets
+
+    @staticmethod
+    def from_sums(asset_id) -> dict:
+        """
+        Les totaux recalcules par SUM : reference de la reconciliation.
+        / Totals recomputed with SUM: the reconciliation reference.
+        """
+        tokens = Token.objects.filter(asset_id=asset_id)
+        par_action = dict(AssetTotals.sums_by_action(asset_id).values_list('action', 'total'))
+        return {
+            'in_places': tokens.filter(wallet__place__isnull=False).aggregate(total=Sum('value'))['total'] or 0,
+            'in_wallets': tokens.filter(wallet__place__isnull=True).aggregate(total=Sum('value'))['total'] or 0,
+            'deposited': par_action.get(Transaction.DEPOSIT) or 0,
+            'created': par_action.get(Transaction.CREATION) or 0,
+        }
+
+    @staticmethod
+    def sums_by_action(asset_id):
+        # Cumuls DEPOSIT et CREATION de l'asset, une ligne par action.
+        # / The asset's DEPOSIT and CREATION sums, one row per action.
+        return Transaction.objects.filter(
+            asset_id=asset_id, action__in=[Transaction.DEPOSIT, Transaction.CREATION],
+        ).values('action').annotate(total=Sum('amount'))
+
+    @classmethod
+    def for_asset(cls, asset_id) -> 'AssetTotals':
+        totaux = cls.objects.filter(asset_id=asset_id).first()
+        if totaux:
+            return totaux
+        # Asset sans ligne (cree avant la migration ou jamais mouvemente) : on part des SUM.
+        # / Asset without a row yet: start from the SUMs.
+        totaux, _created = cls.objects.get_or_create(asset_id=asset_id, defaults=cls.from_sums(asset_id))
+        return totaux
+
+    @classmethod
+    def apply(cls, asset_id, deltas: dict):
+        """
+        Applique les deltas d'une transaction, dans le bloc atomique de Transaction.save().
+        Sans ligne, elle est creee depuis les SUM, qui incluent deja ces deltas.
+        / Applies the deltas of a transaction; a missing row is built from the SUMs.
+        """
+        if not deltas:
+            return
+        if not cls.objects.filter(asset_id=asset_id).update(
+                **{colonne: F(colonne) + delta for colonne, delta in deltas.items()}):
+            cls.objects.create(asset_id=asset_id, **cls.from_sums(asset_id))
+
+    def __str__(self):
+        return f"{self.asset.name} : {self.in_circulation} in circulation"
+
+
+class AssetMonthlyRollup(models.Model):
+    """
+    Nombre et somme des transactions par (asset, mois, action).
+    / Transaction count and sum per (asset, month, action).
+
+    LOCALISATION : fedow_core/models.py
+
+    Tenu a jour par Transaction.save(), en F(), dans le meme bloc atomique que
+    le maillon. Les graphes du tableau de bord lisent quelques centaines de
+    lignes au lieu de re-agreger toute la table des transactions.
+    Le mois est celui du fuseau courant (TIME_ZONE), comme TruncMonth.
+    / Maintained by Transaction.save() in the link's atomic block; dashboard
+    charts read a few hundred rows instead of re-aggregating every transaction.
+    """
+    asset = models.ForeignKey(Asset, on_delete=models.PROTECT, related_name='monthly_rollups')
+    month = models.DateField()
+    action = models.CharField(max_length=3, choices=Transaction.TYPE_ACTION)
+    count = models.BigIntegerField(default=0)
+    total = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [UniqueConstraint(fields=['asset', 'month', 'action'], name='rollup_asset_month_action_unique')]
+
+    @staticmethod
+    def month_of(moment):
+        return timezone.localtime(moment).date().replace(day=1)
+
+    @classmethod
+    def from_transactions(cls, asset_id, month, action) -> dict:
+        """
+        Nombre et somme recalcules sur les transactions du mois : reference et reprise.
+        / Count and sum recomputed over the month's transactions.
+        """
+        debut = timezone.make_aware(datetime.combine(month, time.min))
+        fin = timezone.make_aware(datetime.combine((month + timedelta(days=32)).replace(day=1), time.min))
+        agregat = Transaction.objects.filter(
+            asset_id=asset_id, action=action, datetime__gte=debut, datetime__lt=fin,
+        ).aggregate(count=models.Count('uuid'), total=Sum('amount'))
+        return {'count': agregat['count'], 'total': agregat['total'] or 0}
+
+    @classmethod
+    def record(cls, transaction: Transaction):
+        """
+        Ajoute un maillon a sa case, dans le bloc atomique de Transaction.save().
+        Sans ligne, elle est creee depuis les transactions, qui incluent deja ce maillon.
+        / Adds a link to its cell; a missing row is built from the transactions.
+        """
+        month = cls.month_of(transaction.datetime)
+        case = cls.objects.filter(asset_id=transaction.asset_id, month=month, action=transaction.action)
+        if not case.update(count=F('count') + 1, total=F('total') + transaction.amount):
+            cls.objects.create(asset_id=transaction.asset_id, month=month, action=transaction.action,
+                               **cls.from_transactions(transaction.asset_id, month, transaction.action))
+
+    def __str__(self):
+        return f"{self.asset.name} {self.month:%Y-%m} {self.action} : {self.count}"
+
+
+class WebhookOutbox(models.Model):
+    """
+    File d'envoi durable des webhooks vers Lespass (outbox).
+    / Durable outbox of the webhooks sent to Lespass.
+
+    LOCALISATION : fedow_core/models.py
+
+    La ligne est ecrite dans la meme transaction SQL que le maillon qui la
+    declenche : pas de maillon sans webhook, pas de webhook sans maillon.
+    La commande dispatch_webhooks la livre en tache de fond, avec reessais
+    et delai croissant. Une ligne n'est jamais supprimee ni abandonnee :
+    delivered_at reste vide tant que Lespass n'a pas repondu en 2xx.
+    / Written in the same SQL transaction as the link; delivered in the
+    background by dispatch_webhooks, retried with backoff, never dropped.
+    """
+    uuid = models.UUIDField(primary_key=True, default=uuid4, editable=False)
+    transaction = models.ForeignKey(Transaction, on_delete=models.PROTECT, related_name='webhooks')
+    url = models.URLField(max_length=500)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    attempts = models.PositiveIntegerField(default=0)
+    # Prochain envoi possible. Le dispatcher le repousse aussi pour reserver la ligne.
+    # / Next possible delivery. The dispatcher also pushes it back to claim the row.
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    delivered_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True, null=True)
+
+    @classmethod
+    def enqueue_membership(cls, transaction: Transaction) -> 'WebhookOutbox':
+        place = transaction.sender.place
+        return cls.objects.create(
+            transaction=transaction,
+            url=f"https://{place.lespass_domain}/fwh/membership/{transaction.uuid}",
+        )
+
+    def __str__(self):
+        return f"{self.url} ({'delivered' if self.delivered_at else f'{self.attempts} attempts'})"
+
+    class Meta:
+        indexes = [
+            # Lignes a livrer, par date d'echeance (dispatch_webhooks).
+            # / Rows to deliver, by due date (dispatch_webhooks).
+            models.Index(fields=['delivered_at', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+
 class Federation(models.Model):
     uuid = models.UUIDField(primary_key=True, default=uuid4, editable=False, db_index=False)
     name = models.CharField(max_length=100, unique=True)
@@ -838,9 +1572,177 @@ class Federation(models.Model):
         return f"{self.name} : {','.join([place.name for place in self.places.all()])}"
 
     def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
-        cache.clear()
-        logger.info(f'CLEAR cache')
+        # Plus de cache.clear() : seul l'index des federations est perime
+        # (les ajouts / retraits de places et d'assets passent par m2m_changed, signals.py).
+        # / No more cache.clear(): only the federation index is stale
+        # (place / asset changes go through m2m_changed, signals.py).
         super().save(force_insert, force_update, using, update_fields)
+        invalidate_federation_index()
+
+
+FEDERATION_INDEX_VERSION_KEY = 'federation_index_version'
+FEDERATION_INDEX_TTL = 60 * 60
+
+# Dernier index lu par ce processus, avec sa version.
+# / Last index read by this process, with its version.
+_federation_index_local = {}
+
+
+def federation_index_version() -> str:
+    # Jeton aleatoire plutot qu'un compteur : apres une eviction ou un cache.clear(),
+    # la nouvelle version ne peut pas retomber sur un ancien index.
+    # / Random token rather than a counter: after an eviction or a cache.clear(),
+    # the new version can never match an old index.
+    cache.add(FEDERATION_INDEX_VERSION_KEY, uuid4().hex, None)
+    return cache.get(FEDERATION_INDEX_VERSION_KEY) or ''
+
+
+def invalidate_federation_index():
+    """
+    Perime l'index des federations sans toucher au reste du cache.
+    Appele tout de suite (ce processus, meme transaction) et apres le commit
+    (un autre processus aurait pu reconstruire l'index avant le commit).
+    / Expires the federation index, now and again after commit.
+
+    LOCALISATION : fedow_core/models.py
+    """
+    def nouvelle_version():
+        cache.set(FEDERATION_INDEX_VERSION_KEY, uuid4().hex, None)
+
+    nouvelle_version()
+    db_transaction.on_commit(nouvelle_version)
+
+
+def build_federation_index() -> dict:
+    """
+    Index des federations, en quelques requetes :
+    place uuid -> {'places', 'assets', 'wallets'} (frozensets d'uuid).
+    Assets acceptes : assets non archives des federations de la place, asset
+    federe Stripe (primaire) et assets non archives crees par la place.
+    / Federation index in a few queries: place uuid -> accepted places,
+    assets and wallets (frozensets of uuids).
+
+    LOCALISATION : fedow_core/models.py
+    """
+    places_par_federation = defaultdict(set)
+    federations_par_place = defaultdict(set)
+    for federation_id, place_id in Federation.places.through.objects.values_list('federation_id', 'place_id'):
+        places_par_federation[federation_id].add(place_id)
+        federations_par_place[place_id].add(federation_id)
+
+    assets_par_federation = defaultdict(set)
+    for federation_id, asset_id in (Federation.assets.through.objects
+                                    .filter(asset__archive=False)
+                                    .values_list('federation_id', 'asset_id')):
+        assets_par_federation[federation_id].add(asset_id)
+
+    # On ajoute automatiquement l'asset stripe primaire
+    # / The primary Stripe asset is always accepted
+    assets_primaires = set(Asset.objects.filter(category=Asset.STRIPE_FED_FIAT).values_list('uuid', flat=True))
+
+    assets_crees = defaultdict(set)
+    for asset_id, wallet_origin_id in Asset.objects.filter(archive=False).values_list('uuid', 'wallet_origin_id'):
+        assets_crees[wallet_origin_id].add(asset_id)
+
+    wallet_par_place = dict(Place.objects.values_list('uuid', 'wallet_id'))
+
+    index = {}
+    for place_id, wallet_id in wallet_par_place.items():
+        places, assets = {place_id}, set(assets_primaires)
+        for federation_id in federations_par_place[place_id]:
+            places.update(places_par_federation[federation_id])
+            assets.update(assets_par_federation[federation_id])
+        assets.update(assets_crees[wallet_id])
+        index[place_id] = {
+            'places': frozenset(places),
+            'assets': frozenset(assets),
+            'wallets': frozenset(wallet_par_place[place] for place in places),
+        }
+    return index
+
+
+def get_federation_index() -> dict:
+    """
+    Index des federations courant : memoire du processus si la version n'a pas
+    bouge, sinon cache partage, sinon reconstruction.
+    / Current federation index: process memory if the version did not move,
+    otherwise the shared cache, otherwise rebuilt.
+
+    LOCALISATION : fedow_core/models.py
+    """
+    version = federation_index_version()
+    if _federation_index_local.get('version') == version:
+        return _federation_index_local['index']
+
+    index = cache.get(f'federation_index_{version}')
+    if index is None:
+        index = build_federation_index()
+        cache.set(f'federation_index_{version}', index, FEDERATION_INDEX_TTL)
+        logger.debug(f'federation_index_{version} SET in cache')
+
+    _federation_index_local.update(version=version, index=index)
+    return index
+
+
+def wallet_snapshot_version_key(wallet_id) -> str:
+    return f'wallet_snapshot_version_{wallet_id}'
+
+
+def card_snapshot_version_key(card_id) -> str:
+    return f'card_snapshot_version_{card_id}'
+
+
+def wallet_snapshot_version(wallet_id) -> str:
+    # Jeton aleatoire, comme pour l'index des federations.
+    # / Random token, as for the federation index.
+    cache.add(wallet_snapshot_version_key(wallet_id), uuid4().hex, None)
+    return cache.get(wallet_snapshot_version_key(wallet_id)) or ''
+
+
+def snapshot_versions(cles) -> dict:
+    """
+    Versions de plusieurs photos (wallets, cartes) et de l'index des federations,
+    en un seul get_many. Une version absente (jamais posee, evincee) est creee.
+    / Versions of several snapshots plus the federation index, in one get_many.
+
+    LOCALISATION : fedow_core/models.py
+    """
+    cles = set(cles) | {FEDERATION_INDEX_VERSION_KEY}
+    versions = cache.get_many(cles)
+    for cle in cles - set(versions):
+        cache.add(cle, uuid4().hex, None)
+        versions[cle] = cache.get(cle) or ''
+    return versions
+
+
+def _nouvelles_versions(cles: set):
+    # Tout de suite et apres le commit : une lecture concurrente de l'etat d'avant
+    # ne peut pas etre reposee sous la nouvelle version.
+    # / Now and after commit: a concurrent read of the previous state cannot be
+    # stored under the new version.
+    def nouvelle_version():
+        cache.set_many({cle: uuid4().hex for cle in cles}, None)
+
+    nouvelle_version()
+    db_transaction.on_commit(nouvelle_version)
+
+
+def invalidate_wallet_snapshot(*wallet_ids):
+    """
+    Perime la photo des soldes des wallets (WalletSerializer en cache) : des qu'un
+    delta de token est applique, puis de nouveau apres le commit, pour qu'une lecture
+    concurrente de l'etat d'avant ne puisse pas etre servie apres la vente.
+    / Expires the wallets balance snapshot, now and again after commit.
+
+    LOCALISATION : fedow_core/models.py
+    """
+    _nouvelles_versions({wallet_snapshot_version_key(wallet_id) for wallet_id in wallet_ids if wallet_id})
+
+
+def invalidate_card_snapshot(*card_ids):
+    # Carte serialisee (CachedTransactionSerializer) : son wallet est relu a part.
+    # / Serialized card: its wallet is read separately.
+    _nouvelles_versions({card_snapshot_version_key(card_id) for card_id in card_ids if card_id})
 
 
 # class ReadOnlyAPIKey(AbstractAPIKey):
@@ -961,64 +1863,47 @@ class Place(models.Model):
                      blank=True, null=True,
                      )
 
-    def federated_with(self):
-        # logger.info(f'federated_with_{self.uuid} called')
-        # print(f'federated_with_{self.uuid} called')
-        places, assets, wallets = set(), set(), set()
-        for federation in self.federations.all():
-            places.update(federation.places.all())
-            assets.update(federation.assets.filter(archive=False))
-            wallets.update([place.wallet for place in federation.places.all()])
-
-        # On a joute automatiquement l'asset stripe primaire
-        assets.add(Asset.objects.get(category=Asset.STRIPE_FED_FIAT))
-
-        # Les assets créé par le lieu
-        assets.update(self.wallet.assets_created.filter(archive=False))
-        # Soi-même
-        wallets.add(self.wallet)
-        places.add(self)
-
-        # Mise en cache :
-        feds = places, assets, wallets
-        cache.set(f'federated_with_{self.uuid}', feds, 120)
-        logger.debug(f'federated_with_{self.uuid} SET in cache')
-
-        return feds
+    def federation_entry(self) -> dict:
+        entry = get_federation_index().get(self.uuid)
+        if entry is None:
+            # Place plus recente que l'index : on le reconstruit une fois.
+            # / Place newer than the index: rebuild it once.
+            invalidate_federation_index()
+            entry = get_federation_index()[self.uuid]
+        return entry
 
-    def cached_federated_with(self):
-        feds = cache.get(f'federated_with_{self.uuid}')
-        if feds:
-            logger.debug(f'federated_with_{self.uuid} GET from cache')
-        else:
-            feds = self.federated_with()
+    def accepted_asset_ids(self) -> frozenset:
+        # Simple lecture dans l'index des federations.
+        # / Plain lookup in the federation index.
+        return self.federation_entry()['assets']
 
-        places, assets, wallets = feds
+    def federated_with(self):
+        entry = self.federation_entry()
+        places = set(Place.objects.filter(uuid__in=entry['places']))
+        assets = set(Asset.objects.filter(uuid__in=entry['assets']))
+        wallets = set(Wallet.objects.filter(uuid__in=entry['wallets']))
         return places, assets, wallets
 
+    def cached_federated_with(self):
+        return self.federated_with()
+
     def accepted_assets(self):
-        place, assets, wallets = self.cached_federated_with()
-        # import ipdb; ipdb.set_trace()
-        return assets
+        return Asset.objects.filter(uuid__in=self.accepted_asset_ids())
 
     def accepted_assets_fiat(self):
-        assets = []
-        for asset in self.accepted_assets():
-            asset: Asset
-            if asset.category in [Asset.TOKEN_LOCAL_FIAT, Asset.STRIPE_FED_FIAT]: # seulement les token fiduciaires
-                assets.append(asset)
+        # seulement les token fiduciaires
+        assets = list(self.accepted_assets().filter(category__in=[Asset.TOKEN_LOCAL_FIAT, Asset.STRIPE_FED_FIAT]))
         return assets if assets else None
 
     def wallet_federated_with(self):
-        place, assets, wallets = self.cached_federated_with()
-        return wallets
+        return Wallet.objects.filter(uuid__in=self.federation_entry()['wallets'])
 
     def logo_variations(self):
         return self.logo.variations
 
     def cashless_public_key(self) -> rsa.RSAPublicKey:
         if self.cashless_rsa_pub_key:
-            return get_public_key(self.cashless_rsa_pub_key)
+            return public_key_cache.get(f"place:{self.uuid}", self.cashless_rsa_pub_key)
         else:
             raise Exception("Cashless public key empty.")
 
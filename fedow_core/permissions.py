@@ -1,21 +1,144 @@
+import hashlib
 import logging
 import typing
 from datetime import datetime
 
 import stripe
+from django.conf import settings
+from django.core.cache import cache
 from django.http import HttpRequest
+from django.utils.crypto import constant_time_compare
+from django.utils import timezone
 from rest_framework import permissions
 from rest_framework.permissions import AllowAny
 from rest_framework.views import PermissionDenied
 from rest_framework_api_key.permissions import BaseHasAPIKey
 from stripe import SignatureVerificationError
 
-from fedow_core.models import OrganizationAPIKey, Configuration, CreatePlaceAPIKey, Wallet
-from fedow_core.utils import verify_signature, data_to_b64
+from fedow_core.middleware import SIGNATURE_MODE_HEADER, SIGNATURE_MODE_RAW_BODY
+from fedow_core.models import OrganizationAPIKey, Configuration, CreatePlaceAPIKey, Wallet, Place
+from fedow_core.utils import verify_signature, data_to_b64, verified_signature_cache
 
 logger = logging.getLogger(__name__)
 
 
+def api_key_cache_key(prefix: str) -> str:
+    return f"verified_api_key_{prefix}"
+
+
+def get_place_from_api_key(key: str) -> Place:
+    """
+    Clé API d'organisation -> Place (avec son wallet), via un cache des clés vérifiées.
+    Le cache (par prefix) garde l'empreinte SHA256 de la clé, jamais la clé elle-même,
+    avec place / wallet / expiration. Sur un hit : une seule requête (place + wallet).
+    Sur un miss : get_from_key classique, puis mise en cache.
+    Révocation ou suppression d'une clé : entrée supprimée (signals.py).
+    Leve OrganizationAPIKey.DoesNotExist si la clé est inconnue, révoquée ou expirée.
+    / Organization API key -> Place (wallet joined) through a verified-key cache:
+    one query on a hit, invalidated on revocation. Raises DoesNotExist if invalid.
+
+    LOCALISATION : fedow_core/permissions.py
+    """
+    prefix, _, _ = key.partition(".")
+    empreinte = hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    verifiee = cache.get(api_key_cache_key(prefix))
+    if verifiee and constant_time_compare(verifiee['digest'], empreinte):
+        if verifiee['expiry_date'] and verifiee['expiry_date'] < timezone.now():
+            raise OrganizationAPIKey.DoesNotExist("Key has expired.")
+        try:
+            return Place.objects.select_related('wallet').get(uuid=verifiee['place_uuid'])
+        except Place.DoesNotExist:
+            cache.delete(api_key_cache_key(prefix))
+            raise OrganizationAPIKey.DoesNotExist("Place not found.")
+
+    api_key = (OrganizationAPIKey.objects.get_usable_keys()
+               .select_related('place__wallet')
+               .get(prefix=prefix))
+    if not api_key.is_valid(key):
+        raise OrganizationAPIKey.DoesNotExist("Key is not valid.")
+    if api_key.has_expired:
+        raise OrganizationAPIKey.DoesNotExist("Key has expired.")
+
+    place = api_key.place
+    cache.set(api_key_cache_key(prefix), {
+        'digest': empreinte,
+        'place_uuid': place.uuid,
+        'wallet_uuid': place.wallet_id,
+        'expiry_date': api_key.expiry_date,
+    }, settings.API_KEY_CACHE_TTL)
+    return place
+
+
+def signed_post_message(request: HttpRequest) -> bytes:
+    """
+    Message signe d'une requete POST.
+    `Signature-Mode: raw-body` : les octets du corps, captures une fois par
+    RawBodySignatureMiddleware, verifies tels quels.
+    Sinon (anciens clients) : data_to_b64(request.data), qui re-serialise le corps parse.
+    / Signed message of a POST: the raw body bytes in raw-body mode, otherwise
+    the legacy data_to_b64(request.data).
+
+    LOCALISATION : fedow_core/permissions.py
+    """
+    if request.headers.get(SIGNATURE_MODE_HEADER) == SIGNATURE_MODE_RAW_BODY:
+        raw_body = getattr(request, 'raw_body', None)
+        if raw_body is not None:
+            return raw_body
+        logger.warning("signed_post_message : raw-body sans RawBodySignatureMiddleware")
+    return data_to_b64(request.data)
+
+
+def secondes_hors_fenetre(date: datetime) -> float:
+    """
+    Ecart entre le header Date et maintenant, au-dela de SIGNATURE_DATE_WINDOW.
+    Positif : date perimee (ou trop dans le futur), a refuser avant toute crypto.
+    Negatif : temps restant avant que la date ne sorte de la fenetre.
+    / Distance beyond SIGNATURE_DATE_WINDOW: positive means reject, negative is
+    the time left before the date leaves the window.
+
+    LOCALISATION : fedow_core/permissions.py
+    """
+    # Date ISO 8601, avec fuseau de preference. Une date naive est lue dans
+    # settings.TIME_ZONE, pas dans l'heure locale du processus.
+    # / ISO 8601 date, preferably with an offset. A naive date is read in
+    # settings.TIME_ZONE, not in the process local time.
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date, timezone.get_default_timezone())
+    return abs((timezone.now() - date).total_seconds()) - settings.SIGNATURE_DATE_WINDOW
+
+
+def verify_wallet_get_signature(wallet: Wallet, date: datetime, signature: str) -> bool:
+    """
+    Signature GET d'un wallet : "{wallet.uuid}:{date}".
+    Date hors fenetre -> refus sans calcul RSA. Paire deja verifiee dans la
+    fenetre -> acceptee depuis le cache, sans calcul RSA.
+    / Wallet GET signature: stale date rejected before any crypto, repeat
+    (message, signature) inside the window served from the cache.
+
+    LOCALISATION : fedow_core/permissions.py
+    """
+    message = f"{wallet.uuid}:{date.isoformat()}".encode('utf8')
+    if not settings.SIGNATURE_DATE_WINDOW:
+        return verify_signature(wallet.public_key(), message, signature)
+
+    hors_fenetre = secondes_hors_fenetre(date)
+    if hors_fenetre > 0:
+        logger.warning(f"verify_wallet_get_signature : date {date.isoformat()} hors fenetre")
+        return False
+
+    empreinte = verified_signature_cache.empreinte(wallet.public_pem, message, signature)
+    if verified_signature_cache.contains(empreinte):
+        return True
+
+    if verify_signature(wallet.public_key(), message, signature):
+        # Valable tant que la date reste dans la fenetre.
+        # / Valid as long as the date stays inside the window.
+        verified_signature_cache.add(empreinte, ttl=-hors_fenetre)
+        return True
+    return False
+
+
 class IsStripe(AllowAny):
     def valid_signature(self, request: HttpRequest) -> str | bool:
         start = datetime.now()
@@ -82,7 +205,12 @@ class HasWalletSignature(permissions.BasePermission):
         date_str = request.META.get("HTTP_DATE")
         if not date_str:
             return None
-        date = datetime.fromisoformat(date_str)
+        try:
+            date = datetime.fromisoformat(date_str)
+        except ValueError:
+            # Date illisible : traitee comme absente.
+            # / Unreadable date: treated as missing.
+            return None
         return date
 
     def has_permission(self, request: HttpRequest, view: typing.Any) -> bool:
@@ -94,19 +222,18 @@ class HasWalletSignature(permissions.BasePermission):
         signature = self.get_signature(request)
         if not signature:
             raise PermissionDenied("Missing signature")
-        wallet_public_key = wallet.public_key() if wallet else None
 
         # SIGNATURE ( GET / POST )
         # On signe la donnée si c'est du post.
         # Uniquement la clé si c'est du get.
         if request.method == 'POST':
-            message = data_to_b64(request.data)
+            valid = verify_signature(wallet.public_key(), signed_post_message(request), signature)
         elif request.method == 'GET':
-            message = f"{wallet.uuid}:{date.isoformat()}".encode('utf8') if wallet else None
+            valid = verify_wallet_get_signature(wallet, date, signature)
         else :
             raise PermissionDenied("Invalid method")
 
-        if wallet and verify_signature(wallet_public_key, message, signature):
+        if valid:
             request.wallet = wallet
             return True
 
@@ -140,7 +267,12 @@ class HasPlaceKeyAndWalletSignature(BaseHasAPIKey):
         date_str = request.META.get("HTTP_DATE")
         if not date_str:
             return None
-        date = datetime.fromisoformat(date_str)
+        try:
+            date = datetime.fromisoformat(date_str)
+        except ValueError:
+            # Date illisible : traitee comme absente.
+            # / Unreadable date: treated as missing.
+            return None
         return date
 
     def has_permission(self, request: HttpRequest, view: typing.Any) -> bool:
@@ -152,8 +284,7 @@ class HasPlaceKeyAndWalletSignature(BaseHasAPIKey):
             return False
 
         try :
-            api_key = self.model.objects.get_from_key(key)
-            place = api_key.place
+            place = get_place_from_api_key(key)
             request.place = place
         except Exception as e :
             logger.warning(f"HasPlaceKeyAndUserSignature : {e}")
@@ -169,19 +300,18 @@ class HasPlaceKeyAndWalletSignature(BaseHasAPIKey):
         signature = self.get_signature(request)
         if not signature:
             return False  # Signature manquante
-        wallet_public_key = wallet.public_key()
 
         # SIGNATURE ( GET / POST )
         # On signe la donnée si c'est du post.
         # Uniquement la clé si c'est du get.
         if request.method == 'POST':
-            message = data_to_b64(request.data)
+            valid = verify_signature(wallet.public_key(), signed_post_message(request), signature)
         elif request.method == 'GET':
-            message = f"{wallet.uuid}:{date.isoformat()}".encode('utf8')
+            valid = verify_wallet_get_signature(wallet, date, signature)
         else :
             return False
 
-        if verify_signature(wallet_public_key, message, signature):
+        if valid:
             request.wallet = wallet
             return True
 
@@ -203,8 +333,7 @@ class HasOrganizationAPIKeyOnly(BaseHasAPIKey):
             return False
 
         try :
-            api_key = self.model.objects.get_from_key(key)
-            place = api_key.place
+            place = get_place_from_api_key(key)
             request.place = place
             return True
         except Exception as e :
@@ -237,8 +366,7 @@ class HasKeyAndPlaceSignature(BaseHasAPIKey):
             return False
 
         try :
-            api_key = self.model.objects.get_from_key(key)
-            place = api_key.place
+            place = get_place_from_api_key(key)
             request.place = place
         except OrganizationAPIKey.DoesNotExist:
             logger.warning(f"HasKeyAndCashlessSignature : no api key")
@@ -253,8 +381,10 @@ class HasKeyAndPlaceSignature(BaseHasAPIKey):
         # has NO cashless RSA and cannot produce a place signature, so its place
         # API key is ENOUGH — per-place / federation filtering still applies
         # downstream (TransactionW2W, CardRefundOrVoidValidator, accepted_assets).
+        # (La clé est déjà vérifiée, expiration comprise, par get_place_from_api_key.)
+        # / (Key already verified, expiry included, by get_place_from_api_key.)
         if place.lespass_domain and not place.cashless_rsa_pub_key:
-            return super().has_permission(request, view)
+            return True
 
         # Place avec cashless RSA (LaBoutik V1) : signature de place exigee.
         # / Place with a cashless RSA (LaBoutik V1): place signature required.
@@ -274,7 +404,7 @@ class HasKeyAndPlaceSignature(BaseHasAPIKey):
         # On signe la donnée si c'est du post.
         # Uniquement la clé si c'est du get.
         if request.method == 'POST':
-            message = data_to_b64(request.data)
+            message = signed_post_message(request)
         elif request.method == 'GET':
             message = key.encode('utf8')
         else :
@@ -282,7 +412,7 @@ class HasKeyAndPlaceSignature(BaseHasAPIKey):
 
         if cashless_public_key:
             if verify_signature(cashless_public_key, message, signature):
-                return super().has_permission(request, view)
+                return True
 
         logger.warning(f"HasKeyAndCashlessSignature : signature invalid")
         return False
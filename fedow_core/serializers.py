@@ -10,14 +10,17 @@ import stripe
 from cryptography.hazmat.primitives.asymmetric import rsa
 from django.conf import settings
 from django.core.cache import cache
-from django.db.models import Sum
+from django.db.models import Sum, F
 from django.db.transaction import atomic
 from django.utils import timezone
 from rest_framework import serializers
 from rest_framework.generics import get_object_or_404
 
 from fedow_core.models import Place, FedowUser, Card, Wallet, Transaction, OrganizationAPIKey, Asset, Token, \
-    get_or_create_user, Origin, asset_creator, Configuration, Federation, CheckoutStripe
+    get_or_create_user, Origin, asset_creator, Configuration, Federation, CheckoutStripe, AssetChainHead, \
+    prefetch_last_transactions, wallet_snapshot_version, federation_index_version, snapshot_versions, \
+    wallet_snapshot_version_key, card_snapshot_version_key, FEDERATION_INDEX_VERSION_KEY
+from fedow_core.permissions import signed_post_message
 from fedow_core.utils import get_request_ip, get_public_key, dict_to_b64, verify_signature, data_to_b64
 
 logger = logging.getLogger(__name__)
@@ -142,13 +145,25 @@ class WalletSerializer(serializers.ModelSerializer):
             if hasattr(request, 'place'):
                 logger.info(f"{timezone.localtime()} WalletSerializer from PLACE : {request.place}")
                 place = request.place
-                assets = place.accepted_assets()
+                assets = place.accepted_asset_ids()
                 logger.info(f"{timezone.localtime()} Wallet : {obj}")
-                return TokenSerializer(obj.tokens.filter(wallet=obj, asset__in=assets), many=True).data
+                tokens = self.tokens_a_serialiser(obj.tokens.filter(wallet=obj, asset__in=assets))
+                return TokenSerializer(tokens, many=True).data
 
         # Si pas de lieu, on envoi tous les tokens du wallet
         logger.info(f"{timezone.localtime()} WalletSerializer without PLACE")
-        return TokenSerializer(obj.tokens.filter(wallet=obj), many=True).data
+        return TokenSerializer(self.tokens_a_serialiser(obj.tokens.filter(wallet=obj)), many=True).data
+
+    @staticmethod
+    def tokens_a_serialiser(tokens):
+        # Tout ce que lit TokenSerializer (asset, lieu d'origine, fédérations, dernière
+        # transaction) est chargé ici : le nombre de requêtes ne dépend pas du nombre de tokens.
+        # / Everything TokenSerializer reads is loaded here: the query count does not
+        # depend on the number of tokens.
+        return prefetch_last_transactions(
+            tokens.select_related('asset__wallet_origin__place')
+            .prefetch_related('asset__federations__places')
+        )
 
     class Meta:
         model = Wallet
@@ -160,6 +175,68 @@ class WalletSerializer(serializers.ModelSerializer):
         )
 
 
+def wallet_snapshot_key(wallet_id, place, version: str, federation_version: str) -> str:
+    return f"wallet_snapshot_{wallet_id}_{place.pk if place else 'all'}_{version}_{federation_version}"
+
+
+def wallet_snapshot(wallet_id, context: dict = None, wallet: Wallet = None) -> dict:
+    """
+    WalletSerializer en cache : une photo par wallet et par lieu demandeur (les
+    tokens envoyes dependent des assets acceptes par le lieu).
+    La cle porte la version du wallet (changee par Transaction.save() a chaque delta
+    de token, par les cartes et les tokens) et celle de l'index des federations
+    (assets et federations) : une photo perimee n'est jamais relue.
+    / Cached WalletSerializer, one snapshot per wallet and requesting place. The key
+    carries the wallet version and the federation index version.
+
+    LOCALISATION : fedow_core/serializers.py
+    """
+    # Meme forme que Transaction.sender_id pour tomber sur la meme version.
+    # / Same form as Transaction.sender_id to hit the same version.
+    wallet_id = UUID(f"{wallet_id}")
+    context = context or {}
+    place = getattr(context.get('request'), 'place', None)
+    cle = wallet_snapshot_key(wallet_id, place, wallet_snapshot_version(wallet_id), federation_index_version())
+
+    data = cache.get(cle)
+    if data is None:
+        if wallet is None:
+            wallet = Wallet.objects.get(pk=wallet_id)
+        data = WalletSerializer(wallet, context=context).data
+        cache.set(cle, data, settings.WALLET_SNAPSHOT_TTL)
+    return data
+
+
+def wallet_snapshots(wallet_ids) -> dict:
+    """
+    wallet_snapshot() pour plusieurs wallets (sans lieu demandeur) : versions et
+    photos lues en deux get_many, photos manquantes calculees et posees en bloc.
+    / wallet_snapshot() for several wallets: versions and snapshots read with two
+    get_many, missing snapshots computed and stored at once.
+
+    LOCALISATION : fedow_core/serializers.py
+    """
+    wallet_ids = {UUID(f"{wallet_id}") for wallet_id in wallet_ids}
+    if not wallet_ids:
+        return {}
+    versions = snapshot_versions(wallet_snapshot_version_key(wallet_id) for wallet_id in wallet_ids)
+    cles = {wallet_id: wallet_snapshot_key(wallet_id, None,
+                                           versions[wallet_snapshot_version_key(wallet_id)],
+                                           versions[FEDERATION_INDEX_VERSION_KEY])
+            for wallet_id in wallet_ids}
+
+    photos = cache.get_many(cles.values())
+    manquants = {cles[wallet_id] for wallet_id in wallet_ids} - set(photos)
+    if manquants:
+        nouvelles = {
+            cles[wallet.pk]: WalletSerializer(wallet).data
+            for wallet in Wallet.objects.filter(pk__in=[w for w in wallet_ids if cles[w] in manquants])
+        }
+        cache.set_many(nouvelles, settings.WALLET_SNAPSHOT_TTL)
+        photos.update(nouvelles)
+    return {wallet_id: photos.get(cles[wallet_id]) for wallet_id in wallet_ids}
+
+
 class UserSerializer(serializers.ModelSerializer):
     wallet = WalletSerializer(many=False)
 
@@ -342,20 +419,12 @@ class AssetSerializer(serializers.ModelSerializer):
         # Add apikey user to representation
         rep = super().to_representation(instance)
         if self.context.get('action') == 'retrieve':
-            # get_or_set va toujours faire la fonction callable avant de vérifier le cache.
-            # Solution : soit retirer les () dans le callable, soit utiliser lambda si on a besoin de passer des arguments
-
-            # Pour les test unitaire, desactiver le cache
-            if not settings.DEBUG:
-                rep['total_token_value'] = cache.get_or_set(f"{instance.uuid}_total_token_value",
-                                                            instance.total_token_value, 5)
-                rep['total_in_place'] = cache.get_or_set(f"{instance.uuid}_total_in_place", instance.total_in_place, 5)
-                rep['total_in_wallet_not_place'] = cache.get_or_set(f"{instance.uuid}_total_in_wallet_not_place",
-                                                                    instance.total_in_wallet_not_place, 5)
-            else:
-                rep['total_token_value'] = instance.total_token_value()
-                rep['total_in_place'] = instance.total_in_place()
-                rep['total_in_wallet_not_place'] = instance.total_in_wallet_not_place()
+            # Totaux courants (AssetTotals) : une lecture par clé, plus de SUM ni de cache à 5s.
+            # / Running totals: one primary key read, no more SUM nor 5s cache.
+            totaux = instance.running_totals()
+            rep['total_token_value'] = totaux.in_circulation
+            rep['total_in_place'] = totaux.in_places
+            rep['total_in_wallet_not_place'] = totaux.in_wallets
         return rep
 
 
@@ -427,6 +496,10 @@ class CardSerializer(serializers.ModelSerializer):
     is_primary = serializers.SerializerMethodField()
 
     def get_is_primary(self, obj: Card):
+        # Annoté par le check carte (CardAPI.retrieve) : pas de requête en plus.
+        # / Annotated by the card check (CardAPI.retrieve): no extra query.
+        if hasattr(obj, 'is_primary_for_place'):
+            return obj.is_primary_for_place
         try:
             request = self.context.get('request')
             place = request.place
@@ -440,7 +513,7 @@ class CardSerializer(serializers.ModelSerializer):
 
     def get_wallet(self, obj: Card):
         wallet: Wallet = obj.get_wallet()
-        return WalletSerializer(wallet, context=self.context).data
+        return wallet_snapshot(wallet.pk, context=self.context, wallet=wallet)
 
     class Meta:
         model = Card
@@ -533,6 +606,66 @@ class TransactionSimpleSerializer(serializers.ModelSerializer):
         return name
 
 
+class TransactionListSerializer(serializers.ModelSerializer):
+    """
+    Liste des transactions (GET /transaction/) : sans le serializer de la carte,
+    noms des wallets tirés du select_related de la vue.
+    verify_hash seulement si context['verify_hash'], projection par context['fields'].
+    / Transaction list: no nested card, optional hash check and field projection.
+
+    LOCALISATION : fedow_core/serializers.py
+    """
+    sender_name = serializers.SerializerMethodField()
+    receiver_name = serializers.SerializerMethodField()
+    verify_hash = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Transaction
+        fields = (
+            "uuid",
+            "action",
+            "get_action_display",
+            "hash",
+            "datetime",
+            "subscription_first_datetime",
+            "subscription_start_datetime",
+            "subscription_type",
+            "last_check",
+            "sender",
+            "receiver",
+            "sender_name",
+            "receiver_name",
+            "asset",
+            "amount",
+            "comment",
+            "metadata",
+            "card",
+            "primary_card",
+            "previous_transaction",
+            "verify_hash",
+        )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Le calcul du hash est le poste le plus cher : il n'est fait qu'à la demande.
+        # / The hash check is the most expensive part: only on demand.
+        if not self.context.get('verify_hash'):
+            self.fields.pop('verify_hash')
+        demandes = self.context.get('fields')
+        if demandes:
+            for champ in set(self.fields) - set(demandes):
+                self.fields.pop(champ)
+
+    def get_sender_name(self, obj: Transaction):
+        return obj.sender.get_name()
+
+    def get_receiver_name(self, obj: Transaction):
+        return obj.receiver.get_name()
+
+    def get_verify_hash(self, obj: Transaction):
+        return obj.verify_hash()
+
+
 class TokenSerializer(serializers.ModelSerializer):
     asset = AssetSerializer(many=False)
     last_transaction = TransactionSimpleSerializer(many=False)
@@ -582,7 +715,7 @@ class WalletGetOrCreate(serializers.Serializer):
         self.created = False
 
         # Vérification de la signature
-        message = data_to_b64(request.data)
+        message = signed_post_message(request)
         signature = request.META.get("HTTP_SIGNATURE")
         if not verify_signature(self.sended_public_key, message, signature):
             raise serializers.ValidationError("Invalid singature")
@@ -970,13 +1103,6 @@ class TransactionRefilFromLespassSerializer(serializers.Serializer):
             "primary_card": None,
             "card": None,
         }
-        crea_transaction = Transaction.objects.create(**crea_transac_dict)
-
-        if not crea_transaction.verify_hash():
-            logger.error(
-                f"{timezone.localtime()} ERROR NewTransactionWallet2WalletValidator : transaction hash is not valid on CREATION")
-            raise serializers.ValidationError("Transaction hash is not valid")
-
         transaction_dict = {
             "ip": get_request_ip(request),
             "sender": attrs.get('sender'),
@@ -991,7 +1117,14 @@ class TransactionRefilFromLespassSerializer(serializers.Serializer):
             "card": None,
             "subscription_start_datetime": None
         }
-        transaction = Transaction.objects.create(**transaction_dict)
+        # Creation et recharge sous une seule prise de tete : rien ne s'intercale.
+        # / Creation and refill under one chain head claim: nothing lands between.
+        crea_transaction, transaction = Transaction.create_chained(crea_transac_dict, transaction_dict)
+
+        if not crea_transaction.verify_hash():
+            logger.error(
+                f"{timezone.localtime()} ERROR NewTransactionWallet2WalletValidator : transaction hash is not valid on CREATION")
+            raise serializers.ValidationError("Transaction hash is not valid")
 
         if not transaction.verify_hash():
             logger.error(
@@ -1271,7 +1404,7 @@ class TransactionW2W(serializers.Serializer):
             # Place must be in card user wallet authority delegation
             # logger.warning(f"{timezone.localtime()} WARNING sender not in receiver authority delegation")
             # raise serializers.ValidationError("Unauthorized")
-            if self.asset not in self.place.accepted_assets():
+            if self.asset.pk not in self.place.accepted_asset_ids():
                 raise serializers.ValidationError("Asset not accepted")
             # Toute validation passée, c'est une vente
             return Transaction.SALE
@@ -1392,12 +1525,6 @@ class TransactionW2W(serializers.Serializer):
                 "primary_card": self.primary_card,
                 "card": self.user_card,
             }
-            crea_transaction = Transaction.objects.create(**crea_transac_dict)
-
-            if not crea_transaction.verify_hash():
-                logger.error(
-                    f"{timezone.localtime()} ERROR NewTransactionWallet2WalletValidator : transaction hash is not valid on CREATION")
-                raise serializers.ValidationError("Transaction hash is not valid")
 
         transaction_dict = {
             "ip": get_request_ip(request),
@@ -1413,7 +1540,23 @@ class TransactionW2W(serializers.Serializer):
             "card": self.user_card,
             "subscription_start_datetime": self.subscription_start_datetime
         }
-        transaction = Transaction.objects.create(**transaction_dict)
+        # uuid fourni par le client : cle d'idempotence du lot (cf TransactionBatchW2W)
+        # / Client supplied uuid: batch idempotency key (see TransactionBatchW2W)
+        if attrs.get('uuid'):
+            transaction_dict['uuid'] = attrs.get('uuid')
+
+        if action == Transaction.REFILL:
+            # Creation et recharge sous une seule prise de tete : une vente concurrente
+            # sur l'asset ne peut pas s'intercaler entre les deux.
+            # / Creation and refill under one chain head claim: a concurrent sale on
+            # the asset cannot land between them.
+            crea_transaction, transaction = Transaction.create_chained(crea_transac_dict, transaction_dict)
+            if not crea_transaction.verify_hash():
+                logger.error(
+                    f"{timezone.localtime()} ERROR NewTransactionWallet2WalletValidator : transaction hash is not valid on CREATION")
+                raise serializers.ValidationError("Transaction hash is not valid")
+        else:
+            transaction = Transaction.objects.create(**transaction_dict)
 
         if not transaction.verify_hash():
             logger.error(
@@ -1424,6 +1567,201 @@ class TransactionW2W(serializers.Serializer):
         return attrs
 
 
+class TransactionW2WBatchItem(TransactionW2W):
+    # Une ligne du lot : une TransactionW2W dont l'uuid est fixe par le serveur cashless.
+    # / One batch line: a TransactionW2W whose uuid is set by the cashless server.
+    uuid = serializers.UUIDField()
+
+
+class TransactionBatchW2W(serializers.Serializer):
+    """
+    Lot de transactions W2W envoye par un serveur cashless (fermeture de festival).
+    / Batch of W2W transactions posted by a cashless server (festival closing).
+
+    LOCALISATION : fedow_core/serializers.py
+
+    La signature est verifiee une seule fois sur tout le lot (HasKeyAndPlaceSignature).
+    1. Toutes les lignes sont validees champ par champ AVANT la moindre ecriture.
+    2. Tout le lot est ecrit dans UNE transaction de base : tout passe ou rien.
+    Chaque ligne porte son uuid : une ligne deja ecrite (lot rejoue apres un
+    timeout) est reportee "already_done" et jamais debitee deux fois.
+    """
+    transactions = serializers.ListField(
+        child=serializers.DictField(),
+        allow_empty=False,
+        max_length=500,
+    )
+
+    CREATED, ALREADY_DONE, ERROR, NOT_APPLIED = 'created', 'already_done', 'error', 'not_applied'
+
+    def _resultat(self, data, statut, transaction=None, errors=None):
+        resultat = {
+            "uuid": f"{data.get('uuid')}",
+            "status": statut,
+        }
+        if transaction:
+            resultat["action"] = transaction.action
+            resultat["hash"] = transaction.hash
+        if errors:
+            resultat["errors"] = errors
+        return resultat
+
+    def _erreur_du_lot(self, index, errors):
+        # Une ligne refuse : on rend le detail de chaque ligne, rien n'est ecrit.
+        # / One line refused: report every line, nothing is written.
+        self.results = [
+            self._resultat(data, self.ERROR, errors=errors) if i == index
+            else self._resultat(data, self.NOT_APPLIED)
+            for i, data in enumerate(self.initial_data.get('transactions'))
+        ]
+        raise serializers.ValidationError(self.results)
+
+    def validate_transactions(self, value):
+        uuids = [data.get('uuid') for data in value]
+        if None in uuids:
+            raise serializers.ValidationError("Each transaction must have an uuid")
+        if len(set(uuids)) != len(uuids):
+            raise serializers.ValidationError("Duplicate transaction uuid in batch")
+        return value
+
+    def _deja_ecrites(self, lignes):
+        # Idempotence : les lignes deja ecrites par un envoi precedent du lot.
+        # / Idempotency: lines already written by a previous send of the batch.
+        return {
+            f"{tx.uuid}": tx for tx in Transaction.objects.filter(
+                uuid__in=[data.get('uuid') for data in lignes]
+            ).select_related('sender', 'receiver')
+        }
+
+    def _est_deja_ecrite(self, index, data, deja_ecrites, place: Place) -> bool:
+        deja_ecrite = deja_ecrites.get(f"{data.get('uuid')}")
+        if deja_ecrite and place.wallet not in [deja_ecrite.sender, deja_ecrite.receiver]:
+            self._erreur_du_lot(index, ["Transaction uuid already used"])
+        return bool(deja_ecrite)
+
+    def validate(self, attrs):
+        request = self.context.get('request')
+        place: Place = request.place
+        lignes = attrs.get('transactions')
+        deja_ecrites = self._deja_ecrites(lignes)
+
+        # 1. Validation des champs de toutes les lignes, sans ecrire.
+        # / 1. Field validation of every line, no write.
+        a_ecrire = []
+        for index, data in enumerate(lignes):
+            if self._est_deja_ecrite(index, data, deja_ecrites, place):
+                continue
+
+            validator = TransactionW2WBatchItem(data=data, context=self.context)
+            try:
+                item_attrs = validator.to_internal_value(data)
+            except serializers.ValidationError as e:
+                self._erreur_du_lot(index, e.detail)
+            a_ecrire.append((index, validator, item_attrs))
+
+        # 2. Ecriture du lot dans une seule transaction de base.
+        # Premiere instruction = une ecriture sur les tetes de chaine des assets du lot :
+        # on prend le verrou d'ecriture tout de suite, avant toute lecture (sinon SQLite
+        # refuse l'ecriture d'un snapshot devenu perime).
+        # / 2. Write the whole batch in one DB transaction. First statement is a write on
+        # the chain heads of the batch assets: take the write lock before any read.
+        ecrites = {}
+        with atomic():
+            AssetChainHead.objects.filter(
+                asset__in={item_attrs.get('asset') for index, validator, item_attrs in a_ecrire}
+            ).update(transaction_id=F('transaction_id'))
+
+            # Un envoi concurrent du meme lot a pu ecrire entre la premiere lecture et le
+            # verrou : on relit sous le verrou, ses lignes repartent en already_done.
+            # / A concurrent send of the same batch may have written between the first read
+            # and the lock: re-read under the lock, its lines are reported already_done.
+            deja_ecrites.update(self._deja_ecrites([lignes[index] for index, _v, _a in a_ecrire]))
+            for index, validator, item_attrs in a_ecrire:
+                if self._est_deja_ecrite(index, lignes[index], deja_ecrites, place):
+                    continue
+                try:
+                    validator.validate(item_attrs)
+                except serializers.ValidationError as e:
+                    self._erreur_du_lot(index, e.detail)
+                except (AssertionError, ValueError) as e:
+                    logger.error(f"{timezone.localtime()} ERROR TransactionBatchW2W ligne {index} : {e}")
+                    self._erreur_du_lot(index, [f"{e}"])
+                ecrites[index] = validator.transaction
+
+        self.results = []
+        for index, data in enumerate(lignes):
+            if index in ecrites:
+                self.results.append(self._resultat(data, self.CREATED, transaction=ecrites[index]))
+            else:
+                self.results.append(self._resultat(
+                    data, self.ALREADY_DONE, transaction=deja_ecrites.get(f"{data.get('uuid')}")))
+        return attrs
+
+
+def transaction_fragments(transactions, context: dict) -> dict:
+    """
+    Fragments d'une page de CachedTransactionSerializer (assets, cartes, wallets
+    emetteurs / receveurs), lus en bloc au lieu de trois get_or_set par ligne.
+    Cles versionnees : asset par la version de l'index des federations (changee a
+    chaque save d'asset, de lieu et de federation), carte par sa propre version et
+    celle de l'index (elle embarque son lieu), wallet par sa version de solde. Le wallet d'une carte est toujours pris dans la photo du
+    wallet, jamais dans le fragment de la carte.
+    / Page fragments read in bulk with versioned keys instead of three get_or_set
+    per row. A card's wallet always comes from the wallet snapshot.
+
+    LOCALISATION : fedow_core/serializers.py
+    """
+    asset_ids, card_ids, wallet_ids = set(), set(), set()
+    for transaction in transactions:
+        if context.get('detailed_asset'):
+            asset_ids.add(transaction.asset_id)
+        if context.get('serialized_sender'):
+            wallet_ids.add(transaction.sender_id)
+        if context.get('serialized_receiver'):
+            wallet_ids.add(transaction.receiver_id)
+        if transaction.card_id:
+            card_ids.add(transaction.card_id)
+
+    versions = snapshot_versions(card_snapshot_version_key(card_id) for card_id in card_ids)
+    cles_assets = {asset_id: f"serialized_asset_{asset_id}_{versions[FEDERATION_INDEX_VERSION_KEY]}"
+                   for asset_id in asset_ids}
+    cles_cartes = {card_id: f"serialized_card_{card_id}_{versions[card_snapshot_version_key(card_id)]}"
+                            f"_{versions[FEDERATION_INDEX_VERSION_KEY]}"
+                   for card_id in card_ids}
+    en_cache = cache.get_many(list(cles_assets.values()) + list(cles_cartes.values()))
+
+    nouveaux = {}
+    manquants = [asset_id for asset_id, cle in cles_assets.items() if cle not in en_cache]
+    for asset in Asset.objects.filter(pk__in=manquants).select_related('wallet_origin__place'):
+        nouveaux[cles_assets[asset.pk]] = AssetSerializer(asset).data
+    manquants = [card_id for card_id, cle in cles_cartes.items() if cle not in en_cache]
+    for card in Card.objects.filter(pk__in=manquants).select_related('origin__place', 'user'):
+        nouveaux[cles_cartes[card.pk]] = CardSerializer(card).data
+    if nouveaux:
+        cache.set_many(nouveaux, settings.SERIALIZED_FRAGMENT_TTL)
+        en_cache.update(nouveaux)
+
+    cartes = {card_id: en_cache[cle] for card_id, cle in cles_cartes.items()}
+    wallet_ids.update(UUID(f"{carte['wallet']['uuid']}") for carte in cartes.values())
+    wallets = wallet_snapshots(wallet_ids)
+
+    return {
+        'assets': {asset_id: en_cache[cle] for asset_id, cle in cles_assets.items()},
+        'cards': {card_id: dict(carte, wallet=wallets[UUID(f"{carte['wallet']['uuid']}")])
+                  for card_id, carte in cartes.items()},
+        'wallets': wallets,
+    }
+
+
+class CachedTransactionListSerializer(serializers.ListSerializer):
+    # Les fragments de toute la page sont lus avant de serialiser les lignes.
+    # / Fragments of the whole page are read before serializing the rows.
+    def to_representation(self, data):
+        transactions = list(data.all() if hasattr(data, 'all') else data)
+        self.child.fragments = transaction_fragments(transactions, self.context)
+        return super().to_representation(transactions)
+
+
 class CachedTransactionSerializer(serializers.ModelSerializer):
     # Un serializer qui est sensé gérer plusieurs transaction par liste : on utilise le cache
     # Utilisé uniquement pour la vue DERNIERE TRANSACTION de Lespass : my_account
@@ -1432,8 +1770,11 @@ class CachedTransactionSerializer(serializers.ModelSerializer):
     serialized_receiver = serializers.SerializerMethodField()
     card = serializers.SerializerMethodField()
 
+    fragments = None
+
     class Meta:
         model = Transaction
+        list_serializer_class = CachedTransactionListSerializer
         fields = (
             "uuid",
             "action",
@@ -1461,34 +1802,29 @@ class CachedTransactionSerializer(serializers.ModelSerializer):
             "card",
         )
 
+    def to_representation(self, instance):
+        if self.parent is None:
+            self.fragments = transaction_fragments([instance], self.context)
+        return super().to_representation(instance)
+
     def get_card(self, obj):
-        if obj.card:
-            # get_or_set va toujours faire la fonction callable avant de vérifier le cache.
-            # Solution : soit retirer les () dans le callable, soit utiliser lambda si on a besoin de passer des arguments
-            return cache.get_or_set(f'serialized_card_{obj.card.uuid}',
-                                    lambda: CardSerializer(obj.card, many=False).data,
-                                    300)
+        if obj.card_id:
+            return self.fragments['cards'][obj.card_id]
         return None
 
     def get_serialized_asset(self, obj):
         if self.context.get('detailed_asset'):
-            return cache.get_or_set(f'serialized_asset_{obj.asset.uuid}',
-                                    lambda: AssetSerializer(obj.asset).data,
-                                    300)
+            return self.fragments['assets'][obj.asset_id]
         return None
 
     def get_serialized_sender(self, obj):
         if self.context.get('serialized_sender'):
-            return cache.get_or_set(f'serialized_wallet_{obj.sender.uuid}',
-                                    lambda: WalletSerializer(obj.sender).data,
-                                    300)
+            return self.fragments['wallets'][obj.sender_id]
         return None
 
     def get_serialized_receiver(self, obj):
         if self.context.get('serialized_receiver'):
-            return cache.get_or_set(f'serialized_wallet_{obj.receiver.uuid}',
-                                    lambda: WalletSerializer(obj.receiver).data,
-                                    300)
+            return self.fragments['wallets'][obj.receiver_id]
         return None
 
 
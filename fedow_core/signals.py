@@ -1,11 +1,12 @@
-import requests
-from django.conf import settings
 from django.core.cache import cache
-from django.db.models.signals import post_save
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
 from django.dispatch import receiver
 from django.utils import timezone
 
-from fedow_core.models import Transaction, Place, Asset, Token, logger
+from fedow_core.models import Transaction, Place, Asset, Token, Wallet, OrganizationAPIKey, Federation, Card, logger, \
+    invalidate_federation_index, invalidate_wallet_snapshot, invalidate_card_snapshot, WebhookOutbox
+from fedow_core.permissions import api_key_cache_key
+from fedow_core.utils import public_key_cache
 
 
 @receiver(post_save, sender=Transaction)
@@ -21,37 +22,41 @@ def transaction_webhook_new_membership(sender, instance: Transaction, created, *
             not instance.checkout_stripe and
             instance.primary_card
     ):
-        # Récupération du lieu
-        place: Place = instance.sender.place
-        url = place.lespass_domain
-        # Le webhook vers Lespass est best-effort : il ne doit JAMAIS bloquer ni
-        # faire echouer la transaction Fedow (qui est deja committee et fait foi).
-        # Sinon la vente en caisse LaBoutik attend la reponse, timeoute a 5s
-        # (read timeout de create_sub) et derive : souscription creee cote Fedow
-        # mais aucune vente enregistree cote LaBoutik.
-        # Le timeout borne l'attente sous les 5s de LaBoutik ; le try/except evite
-        # qu'un Lespass lent ou injoignable ne casse la souscription.
-        # (Regression 18d73ed : le timeout=1 avait ete retire ici.)
-        # / Best-effort webhook: must never block nor fail the committed Fedow transaction.
-        try:
-            reponse_webhook = requests.get(
-                f"https://{url}/fwh/membership/{instance.uuid}",
-                verify=bool(not settings.DEBUG),
-                timeout=(1, 2))
-            # Un 4xx/5xx de Lespass (500, 404 route/tenant absent) ne leve pas tout seul :
-            # on force l'erreur pour rendre l'echec de propagation visible dans Sentry.
-            # Le nominal Lespass (200/201/208) est en 2xx -> pas d'impact.
-            # / Force error on 4xx/5xx so propagation failures surface in Sentry.
-            reponse_webhook.raise_for_status()
-        except requests.RequestException:
-            # Adhesion NON propagee a Lespass (qui est la source de verite de l'adhesion).
-            # logger.exception attache la stacktrace -> event Sentry complet (event_level=ERROR).
-            # Rattrapage manuel : rejouer le GET ci-dessous (handler idempotent, 208 si deja la).
-            # / Membership NOT propagated to Lespass (source of truth). Manual replay of the GET.
-            logger.exception(
-                f"transaction_webhook_new_membership : webhook Lespass ECHEC pour la "
-                f"transaction {instance.uuid} — adhesion NON propagee a Lespass. "
-                f"Rattrapage : GET https://{url}/fwh/membership/{instance.uuid}")
+        # post_save est appele dans le bloc atomique de Transaction.save() : la ligne
+        # d'outbox est commitee avec le maillon, ou pas du tout. Aucun appel reseau ici,
+        # la vente LaBoutik repond tout de suite ; dispatch_webhooks livre Lespass en
+        # tache de fond et reessaie tant qu'il le faut (handler Lespass idempotent, 208).
+        # / Written in the same atomic block as the link. No network call here:
+        # dispatch_webhooks delivers in the background and retries until it succeeds.
+        WebhookOutbox.enqueue_membership(instance)
+
+
+@receiver(post_save, sender=Wallet)
+@receiver(post_delete, sender=Wallet)
+def invalidate_wallet_public_key(sender, instance: Wallet, **kwargs):
+    # Le cache des cles publiques se recale tout seul sur l'empreinte du PEM,
+    # on libere quand meme l'entree si public_pem a change ou si le wallet disparait.
+    # / The key cache follows the PEM fingerprint; still drop the stale entry.
+    public_pem = instance.public_pem if kwargs.get('signal') is post_save else None
+    public_key_cache.invalidate(f"wallet:{instance.uuid}", public_pem)
+
+
+@receiver(post_save, sender=Place)
+@receiver(post_delete, sender=Place)
+def invalidate_place_cashless_public_key(sender, instance: Place, **kwargs):
+    # Idem pour la cle RSA du serveur cashless (handshake LaBoutik).
+    # / Same for the cashless server RSA key (LaBoutik handshake).
+    cashless_rsa_pub_key = instance.cashless_rsa_pub_key if kwargs.get('signal') is post_save else None
+    public_key_cache.invalidate(f"place:{instance.uuid}", cashless_rsa_pub_key)
+
+
+@receiver(post_save, sender=OrganizationAPIKey)
+@receiver(post_delete, sender=OrganizationAPIKey)
+def invalidate_verified_api_key(sender, instance: OrganizationAPIKey, **kwargs):
+    # Cle revoquee, expiration modifiee ou cle supprimee : le cache des cles
+    # verifiees ne doit plus la servir.
+    # / Revoked, expiry changed or deleted key: no longer served by the cache.
+    cache.delete(api_key_cache_key(instance.prefix))
 
 
 @receiver(post_save, sender=Asset)
@@ -85,4 +90,80 @@ def first_block_for_new_asset(sender, instance: Asset, created, **kwargs):
         )
 
         print(f"First block created for {asset.name}")
-        cache.clear()
\ No newline at end of file
+
+@receiver(post_save, sender=Asset)
+@receiver(post_delete, sender=Asset)
+def asset_federation_index(sender, instance: Asset, **kwargs):
+    # Nouvel asset, archive ou categorie modifiee : les assets acceptes changent, et les
+    # assets serialises (serialized_asset_*, cles par cette version) avec eux.
+    # / New asset, archive or category changed: accepted assets and serialized assets
+    # (keyed by this version) change.
+    invalidate_federation_index()
+
+
+@receiver(post_save, sender=Place)
+def place_federation_index(sender, instance: Place, created, **kwargs):
+    # A chaque save, pas seulement a la creation : les assets et cartes serialises
+    # embarquent le lieu (nom, lespass_domain) et sont cles par cette version.
+    # / On every save, not only on creation: serialized assets and cards embed the
+    # place (name, lespass_domain) and are keyed by this version.
+    invalidate_federation_index()
+
+
+@receiver(post_delete, sender=Place)
+@receiver(post_delete, sender=Federation)
+def federation_index_on_delete(sender, instance, **kwargs):
+    invalidate_federation_index()
+
+
+@receiver(m2m_changed, sender=Federation.places.through)
+@receiver(m2m_changed, sender=Federation.assets.through)
+def federation_m2m_changed(sender, instance, action, **kwargs):
+    """
+    Place ou asset ajoute / retire d'une federation : on perime l'index des
+    federations, et avec lui les assets serialises (cles par sa version), pas tout le cache.
+    / Place or asset added to / removed from a federation: expire the federation
+    index, and with it the serialized assets keyed by its version.
+    """
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    invalidate_federation_index()
+
+
+@receiver(post_save, sender=Wallet)
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def wallet_snapshot_on_change(sender, instance, **kwargs):
+    # Nom du wallet, token cree ou supprime (fusion) : la photo des soldes est perimee.
+    # Les deltas de solde passent par Transaction.save(), qui la perime lui-meme.
+    # / Wallet name, token created or deleted: the balance snapshot is stale.
+    invalidate_wallet_snapshot(instance.pk if sender is Wallet else instance.wallet_id)
+
+
+def _wallets_de_la_carte(card_values) -> set:
+    user_wallet_id, wallet_ephemere_id = card_values
+    return {user_wallet_id, wallet_ephemere_id} - {None}
+
+
+@receiver(pre_save, sender=Card)
+def card_wallets_before_save(sender, instance: Card, **kwargs):
+    # Wallets lies a la carte avant l'ecriture : une carte perdue ou fusionnee change
+    # has_user_card et le wallet de l'ancien proprietaire aussi.
+    # / Wallets linked before the write: the former owner snapshot changes too.
+    instance._wallets_avant = set()
+    if instance.pk:
+        avant = Card.objects.filter(pk=instance.pk).values_list('user__wallet', 'wallet_ephemere').first()
+        if avant:
+            instance._wallets_avant = _wallets_de_la_carte(avant)
+
+
+@receiver(post_save, sender=Card)
+@receiver(post_delete, sender=Card)
+def wallet_snapshot_on_card_change(sender, instance: Card, **kwargs):
+    wallets = set(getattr(instance, '_wallets_avant', set()))
+    wallets |= _wallets_de_la_carte((
+        instance.user.wallet_id if instance.user_id else None,
+        instance.wallet_ephemere_id,
+    ))
+    invalidate_wallet_snapshot(*wallets)
+    invalidate_card_snapshot(instance.pk)
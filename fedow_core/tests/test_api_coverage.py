@@ -261,7 +261,7 @@ class TransactionAPITest(FedowTestCase):
         """Test listing transactions."""
         response = self._get_from_simulated_cashless('transaction/')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertTrue(isinstance(response.data, list))
+        self.assertTrue(isinstance(response.data['results'], list))
 
     def test_retrieve(self):
         """Test retrieving a transaction."""
@@ -0,0 +1,50 @@
+"""
+Cache des clés API vérifiées : clé d'organisation -> place + wallet.
+/ Verified API key cache: organization key -> place + wallet.
+
+LOCALISATION : fedow_core/tests/test_api_key_cache.py
+
+Une fois vérifiée, la clé se résout en une seule requête (place + wallet).
+Une clé révoquée n'est plus jamais servie par le cache.
+"""
+
+from django.core.cache import cache
+from rest_framework import status
+
+from fedow_core.models import OrganizationAPIKey
+from fedow_core.permissions import get_place_from_api_key
+from fedow_core.tests.tests import FedowTestCase
+
+
+class ApiKeyCacheTest(FedowTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_cle_verifiee_en_une_requete(self):
+        place = get_place_from_api_key(self.temp_key_place)
+        self.assertEqual(place, self.place)
+
+        with self.assertNumQueries(1):
+            place = get_place_from_api_key(self.temp_key_place)
+            self.assertEqual(place.wallet.uuid, self.place.wallet_id)
+
+    def test_mauvais_secret_meme_prefix(self):
+        get_place_from_api_key(self.temp_key_place)
+        prefix, _, secret = self.temp_key_place.partition(".")
+        with self.assertRaises(OrganizationAPIKey.DoesNotExist):
+            get_place_from_api_key(f"{prefix}.{secret[::-1]}")
+
+    def test_cle_revoquee_invalide_le_cache(self):
+        response = self._get_from_simulated_cashless('asset/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        api_key = OrganizationAPIKey.objects.get_from_key(self.temp_key_place)
+        api_key.revoked = True
+        api_key.save()
+
+        with self.assertRaises(OrganizationAPIKey.DoesNotExist):
+            get_place_from_api_key(self.temp_key_place)
+        response = self._get_from_simulated_cashless('asset/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
@@ -0,0 +1,85 @@
+"""
+Totaux courants d'un asset (AssetTotals) et leur reconciliation.
+/ Running totals of an asset (AssetTotals) and their reconciliation.
+
+LOCALISATION : fedow_core/tests/test_asset_totals.py
+
+Transaction.save() applique aux totaux les memes deltas qu'aux tokens.
+Les lectures (serializer, admin, tableau de bord) ne font plus de SUM, et
+reconcile_asset_totals signale puis recale un ecart.
+"""
+
+from io import StringIO
+
+from django.core.management import call_command
+from django.db.models import F
+
+from fedow_core.models import AssetTotals, Token, Transaction
+from fedow_core.tests.tests import FedowTestCase
+
+
+class AssetTotalsTest(FedowTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.wallet, _private_pem, _public_pem = self.create_wallet_via_api()
+        self.primary_card = self.create_primary_card()
+
+        self.asset = self.create_local_asset()
+
+    def _creation_puis_recharge(self, creation, recharge):
+        Transaction.objects.create(sender=self.place.wallet, receiver=self.place.wallet, asset=self.asset,
+                                   amount=creation, action=Transaction.CREATION, ip="127.0.0.1",
+                                   primary_card=self.primary_card)
+        Transaction.objects.create(sender=self.place.wallet, receiver=self.wallet, asset=self.asset,
+                                   amount=recharge, action=Transaction.REFILL, ip="127.0.0.1",
+                                   primary_card=self.primary_card)
+
+    def test_totaux_suivent_les_transactions(self):
+        self._creation_puis_recharge(1000, 300)
+        self._creation_puis_recharge(500, 500)
+
+        totaux = AssetTotals.objects.get(asset=self.asset)
+        self.assertEqual(totaux.created, 1500)
+        self.assertEqual(totaux.in_places, 700)
+        self.assertEqual(totaux.in_wallets, 800)
+        self.assertEqual({colonne: getattr(totaux, colonne) for colonne in AssetTotals.COLUMNS},
+                         AssetTotals.from_sums(self.asset.pk))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.asset.total_token_value(), 1500)
+
+    def test_asset_sans_ligne_repart_des_sommes(self):
+        self._creation_puis_recharge(1000, 400)
+        AssetTotals.objects.filter(asset=self.asset).delete()
+
+        self.assertEqual(self.asset.total_in_place(), 600)
+        self.assertEqual(self.asset.total_in_wallet_not_place(), 400)
+        self.assertEqual(self.asset.total_bank_deposit(), 0)
+
+        # La transaction suivante reprend sur la ligne recreee.
+        # / The next transaction carries on from the rebuilt row.
+        self._creation_puis_recharge(100, 100)
+        self.assertEqual(AssetTotals.objects.get(asset=self.asset).in_wallets, 500)
+
+    def test_reconciliation_signale_puis_recale(self):
+        self._creation_puis_recharge(1000, 250)
+        # Ecriture hors Transaction.save() : les totaux ne la voient pas.
+        # / Write outside Transaction.save(): the totals do not see it.
+        Token.objects.filter(wallet=self.wallet, asset=self.asset).update(value=F('value') + 50)
+
+        sortie = StringIO()
+        call_command('reconcile_asset_totals', '--asset', str(self.asset.pk), stdout=sortie)
+        self.assertIn('in_wallets +50', sortie.getvalue())
+        totaux = AssetTotals.objects.get(asset=self.asset)
+        self.assertEqual(totaux.drift, 50)
+        self.assertEqual(totaux.in_wallets, 250)
+        self.assertIsNotNone(totaux.checked_at)
+
+        call_command('reconcile_asset_totals', '--asset', str(self.asset.pk), '--apply', stdout=StringIO())
+        self.assertEqual(AssetTotals.objects.get(asset=self.asset).in_wallets, 300)
+
+        sortie = StringIO()
+        call_command('reconcile_asset_totals', '--asset', str(self.asset.pk), stdout=sortie)
+        self.assertIn('aucun ecart', sortie.getvalue())
+        self.assertEqual(AssetTotals.objects.get(asset=self.asset).drift, 0)
@@ -0,0 +1,77 @@
+"""
+Check carte des terminaux cashless : nombre de requetes constant.
+/ Cashless terminal card check: constant number of queries.
+
+LOCALISATION : fedow_core/tests/test_card_check_queries.py
+
+GET /card/<first_tag_id>/ part a chaque badge NFC. Le nombre de requetes ne
+doit pas grandir avec le nombre de tokens du wallet (asset, lieu d'origine,
+federations et derniere transaction sont charges en bloc).
+"""
+
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+
+from fedow_core.models import Transaction
+from fedow_core.tests.tests import FedowTestCase
+
+
+class CardCheckQueriesTest(FedowTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.wallet, self.private_pem, self.public_pem = self.create_wallet_via_api()
+
+        self.card = self.create_card(user=self.wallet.user)
+        self.primary_card = self.create_primary_card()
+
+    def _ajoute_token(self, amount=1000):
+        # Un asset local de la place, cree puis recharge sur la carte.
+        # / A local asset of the place, created then refilled on the card.
+        asset = self.create_local_asset()
+        Transaction.objects.create(sender=self.place.wallet, receiver=self.place.wallet, asset=asset,
+                                   amount=amount, action=Transaction.CREATION, ip="127.0.0.1",
+                                   primary_card=self.primary_card)
+        Transaction.objects.create(sender=self.place.wallet, receiver=self.wallet, asset=asset,
+                                   amount=amount, action=Transaction.REFILL, ip="127.0.0.1",
+                                   card=self.card, primary_card=self.primary_card)
+        return asset
+
+    def _check_carte(self, card):
+        # Cle cashless posee avant la mesure : seules les requetes du check sont comptees.
+        # / Cashless key set before measuring: only the check queries are counted.
+        self._pose_cle_cashless(self.place)
+        with CaptureQueriesContext(connection) as requetes:
+            response = self._get_from_simulated_cashless(f'card/{card.first_tag_id}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json(), len(requetes)
+
+    def test_requetes_independantes_du_nombre_de_tokens(self):
+        self._ajoute_token()
+        _, avec_un_token = self._check_carte(self.card)
+
+        for _ in range(4):
+            self._ajoute_token()
+        data, avec_cinq_tokens = self._check_carte(self.card)
+
+        self.assertEqual(len(data['wallet']['tokens']), 5)
+        self.assertEqual(avec_cinq_tokens, avec_un_token)
+
+    def test_contenu_du_check_carte(self):
+        asset = self._ajoute_token(amount=2500)
+        data, _ = self._check_carte(self.card)
+
+        self.assertFalse(data['is_primary'])
+        self.assertEqual(data['origin']['place']['uuid'], str(self.place.uuid))
+        token = next(t for t in data['wallet']['tokens'] if t['asset']['uuid'] == str(asset.uuid))
+        self.assertEqual(token['value'], 2500)
+        self.assertEqual(token['last_transaction']['action'], Transaction.REFILL)
+        self.assertEqual(token['last_transaction']['receiver_name'], self.wallet.get_name())
+        self.assertEqual(token['asset']['place_origin']['uuid'], str(self.place.uuid))
+
+    def test_carte_primaire_du_lieu(self):
+        data, _ = self._check_carte(self.primary_card)
+        self.assertTrue(data['is_primary'])
+        self.assertTrue(data['is_wallet_ephemere'])
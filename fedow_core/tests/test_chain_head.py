@@ -0,0 +1,171 @@
+"""
+Tete de chaine par asset : deux ecritures concurrentes ne forkent plus la chaine.
+/ Per-asset chain head: two concurrent writes no longer fork the chain.
+
+LOCALISATION : fedow_core/tests/test_chain_head.py
+
+Avant : chaque Transaction.save() prenait pour parent "la plus recente par date".
+Deux workers qui lisaient ce parent en meme temps ecrivaient deux enfants du meme
+maillon (320 forks en prod, cf TECH_DEV/DRIFT §6).
+Maintenant : le parent est AssetChainHead, deplace par compare-and-swap. Le
+perdant du CAS se raccroche a la nouvelle tete et recalcule son hash.
+"""
+
+from unittest.mock import patch
+
+from django.db.models import Count
+
+from fedow_core.models import AssetChainHead, Token, Transaction
+from fedow_core.tests.tests import FedowTestCase
+
+
+class ChainHeadTest(FedowTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.asset = self.create_local_asset()
+
+        self.primary_card = self.create_primary_card()
+
+    def _creation(self, amount=1000):
+        return Transaction.objects.create(
+            sender=self.place.wallet,
+            receiver=self.place.wallet,
+            asset=self.asset,
+            amount=amount,
+            action=Transaction.CREATION,
+            ip="127.0.0.1",
+            primary_card=self.primary_card,
+        )
+
+    def _assert_chaine_lineaire(self):
+        # Aucun parent ne doit avoir deux enfants (hors auto-reference du premier bloc).
+        # / No parent may have two children (except the self-referencing first block).
+        forks = (Transaction.objects.filter(asset=self.asset)
+                 .exclude(action=Transaction.FIRST)
+                 .values('previous_transaction')
+                 .annotate(nb=Count('uuid'))
+                 .filter(nb__gt=1))
+        self.assertFalse(forks.exists())
+
+    def test_la_tete_suit_le_dernier_maillon(self):
+        """
+        Le premier bloc cree la tete, chaque maillon la deplace sur lui.
+        / The first block creates the head, each link moves it onto itself.
+        """
+        first = self.asset.transactions.get(action=Transaction.FIRST)
+        self.assertEqual(AssetChainHead.objects.get(asset=self.asset).transaction, first)
+
+        previous = first
+        for i in range(5):
+            tx = self._creation()
+            self.assertEqual(tx.previous_transaction, previous)
+            self.assertEqual(AssetChainHead.objects.get(asset=self.asset).transaction, tx)
+            previous = tx
+
+        self._assert_chaine_lineaire()
+
+    def test_ecriture_concurrente_se_raccroche_a_la_nouvelle_tete(self):
+        """
+        Un autre worker ecrit entre la lecture du parent et l'ecriture :
+        le CAS echoue, le maillon se raccroche au lieu de forker.
+        / Another worker writes between parent read and write: relink, no fork.
+        """
+        head_avant = self._creation()
+        original = Transaction._previous_asset_transaction
+        deja_concurrent = []
+
+        def lecture_puis_ecriture_concurrente(tx):
+            parent = original(tx)
+            if not deja_concurrent:
+                deja_concurrent.append(True)
+                # Le worker concurrent gagne la course sur la meme tete.
+                # / The concurrent worker wins the race on the same head.
+                deja_concurrent.append(self._creation(amount=200))
+            return parent
+
+        with patch.object(Transaction, '_previous_asset_transaction', autospec=True,
+                          side_effect=lecture_puis_ecriture_concurrente):
+            tx = self._creation(amount=300)
+
+        concurrent = deja_concurrent[1]
+        self.assertEqual(concurrent.previous_transaction, head_avant)
+        self.assertEqual(tx.previous_transaction, concurrent)
+        self.assertTrue(Transaction.objects.get(pk=tx.pk).verify_hash())
+        self.assertEqual(AssetChainHead.objects.get(asset=self.asset).transaction_id, tx.pk)
+        self._assert_chaine_lineaire()
+
+        # Les deltas de solde ne sont appliques qu'une fois malgre le raccrochage.
+        # / Balance deltas applied once despite the relink.
+        token = Token.objects.get(wallet=self.place.wallet, asset=self.asset)
+        self.assertEqual(token.value, 1000 + 200 + 300)
+
+    def test_parent_lu_dans_la_tete_sans_relire_la_transaction(self):
+        """
+        La tete garde hash / date / action du dernier maillon : le parent se lit
+        en une seule requete, sans recharger la ligne Transaction.
+        / The head keeps hash / datetime / action: the parent costs one query.
+        """
+        tx = self._creation()
+        head = AssetChainHead.objects.get(asset=self.asset)
+        self.assertEqual(head.transaction_hash, tx.hash)
+        self.assertEqual(head.transaction_datetime, tx.datetime)
+        self.assertEqual(head.transaction_action, Transaction.CREATION)
+
+        suivante = Transaction(asset=self.asset)
+        with self.assertNumQueries(1):
+            parent = suivante._previous_asset_transaction()
+            self.assertEqual(parent.pk, tx.pk)
+            self.assertEqual(parent.hash, tx.hash)
+            self.assertTrue(parent.from_chain_head)
+
+        # Le maillon suivant chaine bien sur ce parent, et son hash reste verifiable
+        # depuis la vraie ligne en base.
+        # / The next link chains on it and its hash verifies against the stored row.
+        suivante = self._creation()
+        self.assertEqual(suivante.previous_transaction_id, tx.pk)
+        self.assertTrue(Transaction.objects.get(pk=suivante.pk).verify_hash())
+
+    def test_vente_concurrente_entre_creation_et_recharge(self):
+        """
+        Une vente sur le meme asset arrive pendant l'ecriture d'une recharge :
+        la CREATION et la REFILL sont ecrites sous une seule prise de tete, la
+        vente passe avant le couple, jamais entre les deux.
+        / A sale on the same asset lands while a refill is written: CREATION and
+        REFILL share one head claim, the sale goes before the pair, never between.
+        """
+        wallet, _private_pem, _public_pem = self.create_wallet_via_api()
+        card = self.create_card(user=wallet.user)
+
+        def recharge(amount):
+            creation = dict(sender=self.place.wallet, receiver=self.place.wallet, asset=self.asset, amount=amount,
+                            action=Transaction.CREATION, ip="127.0.0.1", primary_card=self.primary_card, card=card)
+            return Transaction.create_chained(creation, {**creation, 'receiver': wallet, 'action': Transaction.REFILL})
+
+        recharge(1000)
+        original = Transaction._previous_asset_transaction
+        vente_concurrente = []
+
+        def lecture_puis_vente_concurrente(tx):
+            parent = original(tx)
+            if not vente_concurrente:
+                vente_concurrente.append(True)
+                # La vente gagne la course sur la tete lue par la CREATION.
+                # / The sale wins the race on the head read by the CREATION.
+                vente_concurrente.append(Transaction.objects.create(
+                    sender=wallet, receiver=self.place.wallet, asset=self.asset, amount=300,
+                    action=Transaction.SALE, ip="127.0.0.1", card=card, primary_card=self.primary_card))
+            return parent
+
+        with patch.object(Transaction, '_previous_asset_transaction', autospec=True,
+                          side_effect=lecture_puis_vente_concurrente):
+            creation, refill = recharge(500)
+
+        vente = vente_concurrente[1]
+        self.assertEqual(creation.previous_transaction_id, vente.pk)
+        self.assertEqual(refill.previous_transaction_id, creation.pk)
+        for maillon in (creation, refill):
+            self.assertTrue(Transaction.objects.get(pk=maillon.pk).verify_hash())
+        self.assertEqual(AssetChainHead.objects.get(asset=self.asset).transaction_id, refill.pk)
+        self._assert_chaine_lineaire()
+        self.assertEqual(Token.objects.get(wallet=wallet, asset=self.asset).value, 1000 - 300 + 500)
@@ -0,0 +1,241 @@
+"""
+Montants payes et rembourses tenus sur CheckoutStripe : le plan de remboursement est local.
+/ Paid and refunded amounts kept on CheckoutStripe: the refund plan is local.
+
+LOCALISATION : fedow_core/tests/test_checkout_refund_ledger.py
+
+La validation d'un checkout enregistre amount_paid et le payment intent. Un
+remboursement augmente amount_refunded avec la transaction REFUND. refund_fed_by_signature choisit les
+paiements en une requete et n'appelle Stripe que pour Refund.create.
+"""
+
+import hashlib
+import hmac
+import json
+import time
+from unittest.mock import patch
+from uuid import uuid4
+
+from django.core.signing import Signer
+from django.utils import timezone
+from stripe import StripeObject
+
+from fedow_core.models import Asset, CheckoutStripe, Configuration, Token, Transaction
+from fedow_core.tests.tests import FedowTestCase
+from fedow_core.utils import data_to_b64, dict_to_b64_utf8, get_private_key, sign_message
+
+SECRET_ENDPOINT_STRIPE_DE_TEST = 'whsec_test_fedow_refund_ledger'
+
+
+class StripeLocal:
+    """
+    Bouchon local du client Stripe : sessions, paiements TPE et remboursements en memoire,
+    chaque appel est note.
+    / Local Stripe client stub: in-memory sessions and refunds, every call recorded.
+    """
+
+    def __init__(self):
+        self.sessions = {}
+        self.intents = {}
+        self.appels = []
+        self.cles_idempotence = []
+
+    def ajoute_session(self, session_id, montant, signed_data):
+        self.sessions[session_id] = StripeObject.construct_from({
+            'id': session_id,
+            'payment_status': 'paid',
+            'amount_total': montant,
+            'payment_intent': f"pi_{session_id}",
+            'metadata': {'signed_data': signed_data},
+        }, 'sk_test_fake')
+
+    def session_retrieve(self, session_id, **kwargs):
+        self.appels.append(('Session.retrieve', session_id))
+        return self.sessions[session_id]
+
+    def ajoute_paiement_tpe(self, intent_id, montant, metadata):
+        self.intents[intent_id] = StripeObject.construct_from({
+            'id': intent_id,
+            'created': int(time.time()),
+            'amount_received': montant,
+            'metadata': metadata,
+        }, 'sk_test_fake')
+
+    def payment_intent_retrieve(self, intent_id, **kwargs):
+        self.appels.append(('PaymentIntent.retrieve', intent_id))
+        return self.intents[intent_id]
+
+    def refund_create(self, payment_intent=None, amount=None, **kwargs):
+        self.appels.append(('Refund.create', payment_intent, amount))
+        self.cles_idempotence.append(kwargs.get('idempotency_key'))
+        return StripeObject.construct_from({'status': 'succeeded', 'amount': amount}, 'sk_test_fake')
+
+    def noms_des_appels(self):
+        return [appel[0] for appel in self.appels]
+
+
+class CheckoutRefundLedgerTest(FedowTestCase):
+
+    def setUp(self):
+        super().setUp()
+        config = Configuration.get_solo()
+        self.stripe_asset = Asset.objects.get(wallet_origin=config.primary_wallet, category=Asset.STRIPE_FED_FIAT)
+        # Sans clé Stripe, install ne crée pas de prix : on en pose un pour is_stripe_primary().
+        # / Without a Stripe key, install creates no price: set one for is_stripe_primary().
+        if not self.stripe_asset.id_price_stripe:
+            self.stripe_asset.id_price_stripe = 'price_test_refund_ledger'
+            self.stripe_asset.save()
+        self.wallet, self.private_pem, _public_pem = self.create_wallet_via_api()
+        token_primaire, _created = Token.objects.get_or_create(wallet=config.primary_wallet, asset=self.stripe_asset)
+        token_utilisateur, _created = Token.objects.get_or_create(wallet=self.wallet, asset=self.stripe_asset)
+        self.signed_data = Signer().sign(dict_to_b64_utf8({
+            'primary_token': str(token_primaire.uuid),
+            'user_token': str(token_utilisateur.uuid),
+        }))
+
+        self.stripe_local = StripeLocal()
+        for cible, methode in (
+                ('fedow_core.views.stripe.checkout.Session.retrieve', self.stripe_local.session_retrieve),
+                ('fedow_core.models.stripe.checkout.Session.retrieve', self.stripe_local.session_retrieve),
+                ('fedow_core.models.stripe.PaymentIntent.retrieve', self.stripe_local.payment_intent_retrieve),
+                ('fedow_core.models.stripe.Refund.create', self.stripe_local.refund_create),
+        ):
+            patcher = patch(cible, side_effect=methode)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher_secret = patch.object(Configuration, 'get_stripe_endpoint_secret',
+                                      return_value=SECRET_ENDPOINT_STRIPE_DE_TEST)
+        patcher_secret.start()
+        self.addCleanup(patcher_secret.stop)
+
+    def _recharge_payee(self, montant) -> CheckoutStripe:
+        checkout = CheckoutStripe.objects.create(
+            checkout_session_id_stripe=f'cs_test_{uuid4().hex}',
+            asset=self.stripe_asset,
+            user=self.wallet.user,
+            metadata=self.signed_data,
+            status=CheckoutStripe.OPEN,
+        )
+        self.stripe_local.ajoute_session(checkout.checkout_session_id_stripe, montant, self.signed_data)
+
+        reponse = self._poster_webhook({
+            'type': 'checkout.session.completed',
+            'data': {'object': {
+                'id': checkout.checkout_session_id_stripe,
+                'metadata': {'signed_data': self.signed_data},
+            }},
+        })
+        self.assertEqual(reponse.status_code, 200)
+        checkout.refresh_from_db()
+        return checkout
+
+    def _recharge_tpe(self, montant) -> CheckoutStripe:
+        # Recharge sur un terminal Stripe (TPE) d'un lieu LaBoutik : PaymentIntent signé par le cashless.
+        # / Top-up on a Stripe terminal of a LaBoutik place: PaymentIntent signed by the cashless.
+        self.place.cashless_rsa_pub_key = self.public_cashless_pem
+        self.place.save()
+        card = self.create_card(user=self.wallet.user)
+        data = {'fedow_place_uuid': str(self.place.uuid), 'tag_id': card.first_tag_id}
+        intent_id = f"pi_tpe_{uuid4().hex}"
+        self.stripe_local.ajoute_paiement_tpe(intent_id, montant, {
+            'data': json.dumps(data),
+            'signature': sign_message(data_to_b64(data), self.private_cashless_rsa).decode('utf-8'),
+        })
+
+        reponse = self._poster_webhook({
+            'type': 'terminal.reader.action_succeeded',
+            'data': {'object': {'action': {'process_payment_intent': {'payment_intent': intent_id}}}},
+        })
+        self.assertEqual(reponse.status_code, 200)
+        return CheckoutStripe.objects.get(checkout_session_id_stripe=intent_id)
+
+    def _poster_webhook(self, evenement):
+        corps_json = json.dumps({'object': 'event', **evenement})
+        horodatage = int(time.time())
+        empreinte = hmac.new(SECRET_ENDPOINT_STRIPE_DE_TEST.encode('utf-8'),
+                             f"{horodatage}.{corps_json}".encode('utf-8'), hashlib.sha256).hexdigest()
+        return self.client.post('/webhook_stripe/', corps_json, content_type='application/json',
+                                headers={'Stripe-Signature': f"t={horodatage},v1={empreinte}"})
+
+    def _demande_remboursement(self):
+        date_iso = timezone.now().isoformat()
+        signature = sign_message(f"{self.wallet.uuid}:{date_iso}".encode('utf8'),
+                                 get_private_key(self.private_pem)).decode('utf-8')
+        return self.client.get('/wallet/refund_fed_by_signature/',
+                               headers={'Wallet': str(self.wallet.uuid), 'Date': date_iso, 'Signature': signature})
+
+    def test_validation_enregistre_montant_et_payment_intent(self):
+        checkout = self._recharge_payee(1500)
+        self.assertEqual(checkout.status, CheckoutStripe.PAID)
+        self.assertEqual(checkout.amount_paid, 1500)
+        self.assertEqual(checkout.amount_refunded, 0)
+        self.assertEqual(checkout.intent_payment_id_stripe, f"pi_{checkout.checkout_session_id_stripe}")
+        self.assertEqual(checkout.refundable_amount(), 1500)
+
+    def test_remboursement_sans_lecture_stripe(self):
+        ancien = self._recharge_payee(1500)
+        recent = self._recharge_payee(1000)
+        self.stripe_local.appels.clear()
+
+        reponse = self._demande_remboursement()
+        self.assertEqual(reponse.status_code, 202)
+
+        # Seuls les remboursements partent chez Stripe (aucune lecture), du plus récent au plus ancien.
+        # / Only the refunds reach Stripe, newest first.
+        self.assertEqual(self.stripe_local.appels, [
+            ('Refund.create', recent.intent_payment_id_stripe, 1000),
+            ('Refund.create', ancien.intent_payment_id_stripe, 1500),
+        ])
+        for checkout in (ancien, recent):
+            checkout.refresh_from_db()
+            self.assertEqual(checkout.status, CheckoutStripe.REFUND)
+            self.assertEqual(checkout.amount_refunded, checkout.amount_paid)
+        self.assertEqual(Token.objects.get(wallet=self.wallet, asset=self.stripe_asset).value, 0)
+
+    def test_recharge_tpe_remboursable(self):
+        checkout = self._recharge_tpe(2000)
+        self.assertEqual(checkout.status, CheckoutStripe.WALLET_USER_OK)
+        self.assertEqual((checkout.amount_paid, checkout.intent_payment_id_stripe),
+                         (2000, checkout.checkout_session_id_stripe))
+        self.stripe_local.appels.clear()
+
+        self.assertEqual(self._demande_remboursement().status_code, 202)
+        self.assertEqual(self.stripe_local.appels,
+                         [('Refund.create', checkout.intent_payment_id_stripe, 2000)])
+        checkout.refresh_from_db()
+        self.assertEqual(checkout.amount_refunded, 2000)
+
+    def test_nouvel_essai_garde_la_cle_idempotence(self):
+        checkout = self._recharge_payee(1500)
+        creation_originale = Transaction.objects.create
+
+        def maillon_en_echec(**kwargs):
+            raise RuntimeError("echec d'ecriture du maillon REFUND")
+
+        # Stripe rembourse, puis l'ecriture de la transaction REFUND echoue.
+        # / Stripe refunds, then writing the REFUND transaction fails.
+        with patch.object(Transaction.objects, 'create', side_effect=maillon_en_echec):
+            self.assertEqual(self._demande_remboursement().status_code, 409)
+        checkout.refresh_from_db()
+        self.assertEqual((checkout.status, checkout.amount_refunded), (CheckoutStripe.PAID, 0))
+
+        # Le nouvel essai retombe sur la meme cle : Stripe ne rembourse qu'une fois.
+        # / The retry reuses the same key: Stripe refunds only once.
+        with patch.object(Transaction.objects, 'create', side_effect=creation_originale):
+            self.assertEqual(self._demande_remboursement().status_code, 202)
+        self.assertEqual(len(self.stripe_local.cles_idempotence), 2)
+        self.assertEqual(len(set(self.stripe_local.cles_idempotence)), 1)
+        checkout.refresh_from_db()
+        self.assertEqual((checkout.status, checkout.amount_refunded), (CheckoutStripe.REFUND, 1500))
+
+    def test_plan_de_remboursement_local(self):
+        ancien = CheckoutStripe(amount_paid=2000, amount_refunded=500)
+        recent = CheckoutStripe(amount_paid=1000)
+        sans_montant = CheckoutStripe(amount_paid=None)
+
+        # Un seul paiement suffisant est préféré. / A single sufficient payment is preferred.
+        self.assertEqual(CheckoutStripe.refund_plan([recent, ancien], 1200), {ancien: 1200})
+        # Sinon on cumule, le déjà remboursé est déduit. / Otherwise cumulate, minus what was refunded.
+        self.assertEqual(CheckoutStripe.refund_plan([sans_montant, recent, ancien], 2300),
+                         {recent: 1000, ancien: 1300})
+        self.assertEqual(CheckoutStripe.refund_plan([sans_montant], 100), {})
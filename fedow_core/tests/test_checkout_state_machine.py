@@ -0,0 +1,151 @@
+"""
+Machine à états de la validation d'un checkout Stripe, sans attente active.
+/ Stripe checkout validation state machine, without busy-waiting.
+
+LOCALISATION : fedow_core/tests/test_checkout_state_machine.py
+
+Le webhook POST et le retour GET se disputent le checkout par compare-and-swap
+(CheckoutStripe.claim). Le perdant répond tout de suite : 202 si l'autre est en
+cours, 208 si c'est déjà conclu. Aucun worker ne dort.
+"""
+
+import hashlib
+import hmac
+import json
+import time
+from datetime import timedelta
+from unittest.mock import patch
+from uuid import uuid4
+
+from django.core.signing import Signer
+from django.utils import timezone
+from stripe import StripeObject
+
+from fedow_core.models import Asset, CheckoutStripe, Configuration, Token
+from fedow_core.tests.tests import FedowTestCase
+from fedow_core.utils import dict_to_b64_utf8
+
+SECRET_ENDPOINT_STRIPE_DE_TEST = 'whsec_test_fedow_state_machine'
+
+
+class CheckoutStateMachineTest(FedowTestCase):
+
+    def setUp(self):
+        super().setUp()
+        config = Configuration.get_solo()
+        stripe_asset = Asset.objects.get(wallet_origin=config.primary_wallet, category=Asset.STRIPE_FED_FIAT)
+        # Sans clé Stripe, install ne crée pas de prix : on en pose un pour is_stripe_primary().
+        # / Without a Stripe key, install creates no price: set one for is_stripe_primary().
+        if not stripe_asset.id_price_stripe:
+            stripe_asset.id_price_stripe = 'price_test_state_machine'
+            stripe_asset.save()
+        wallet_utilisateur, _private_pem, _public_pem = self.create_wallet_via_api()
+        token_primaire, _created = Token.objects.get_or_create(wallet=config.primary_wallet, asset=stripe_asset)
+        token_utilisateur, _created = Token.objects.get_or_create(wallet=wallet_utilisateur, asset=stripe_asset)
+        self.signed_data = Signer().sign(dict_to_b64_utf8({
+            'primary_token': str(token_primaire.uuid),
+            'user_token': str(token_utilisateur.uuid),
+        }))
+        self.checkout = CheckoutStripe.objects.create(
+            checkout_session_id_stripe=f'cs_test_{uuid4().hex}',
+            asset=stripe_asset,
+            user=wallet_utilisateur.user,
+            metadata=self.signed_data,
+            status=CheckoutStripe.OPEN,
+        )
+
+        patcher_secret = patch.object(Configuration, 'get_stripe_endpoint_secret',
+                                      return_value=SECRET_ENDPOINT_STRIPE_DE_TEST)
+        patcher_secret.start()
+        self.addCleanup(patcher_secret.stop)
+
+    def _session_stripe(self, payment_status):
+        return StripeObject.construct_from({
+            'id': self.checkout.checkout_session_id_stripe,
+            'payment_status': payment_status,
+            'amount_total': 1500,
+            'metadata': {'signed_data': self.signed_data},
+        }, 'sk_test_fake')
+
+    def _poster_webhook(self):
+        corps_json = json.dumps({
+            'object': 'event',
+            'type': 'checkout.session.completed',
+            'data': {'object': {
+                'id': self.checkout.checkout_session_id_stripe,
+                'metadata': {'signed_data': self.signed_data},
+            }},
+        })
+        horodatage = int(time.time())
+        empreinte = hmac.new(SECRET_ENDPOINT_STRIPE_DE_TEST.encode('utf-8'),
+                             f"{horodatage}.{corps_json}".encode('utf-8'), hashlib.sha256).hexdigest()
+        return self.client.post('/webhook_stripe/', corps_json, content_type='application/json',
+                                headers={'Stripe-Signature': f"t={horodatage},v1={empreinte}"})
+
+    def test_claim_exclusif_et_reprise_apres_expiration(self):
+        self.assertTrue(self.checkout.claim())
+        self.assertEqual(self.checkout.status, CheckoutStripe.PROGRESS)
+
+        concurrent = CheckoutStripe.objects.get(pk=self.checkout.pk)
+        self.assertFalse(concurrent.claim())
+
+        # Worker mort en cours de traitement : le checkout est repris après le délai.
+        # / Worker died mid-processing: the checkout is reclaimed after the timeout.
+        CheckoutStripe.objects.filter(pk=self.checkout.pk).update(
+            progress_since=timezone.now() - timedelta(minutes=10))
+        self.assertTrue(concurrent.claim())
+
+        concurrent.release()
+        self.assertEqual(concurrent.status, CheckoutStripe.OPEN)
+
+    def test_worker_perime_n_ecrase_pas_le_repreneur(self):
+        # A prend le checkout puis reste bloque ; B le reprend apres expiration et conclut PAID.
+        # / A claims then stalls; B reclaims after expiry and closes as PAID.
+        worker_a = CheckoutStripe.objects.get(pk=self.checkout.pk)
+        self.assertTrue(worker_a.claim())
+        CheckoutStripe.objects.filter(pk=self.checkout.pk).update(
+            progress_since=timezone.now() - timedelta(minutes=10))
+        worker_a.refresh_from_db()
+        worker_b = CheckoutStripe.objects.get(pk=self.checkout.pk)
+        self.assertTrue(worker_b.claim())
+
+        # A se reveille : ni release ni ERROR ne touchent le claim de B.
+        # / A wakes up: neither release nor ERROR touch B's claim.
+        self.assertFalse(worker_a.release())
+        self.assertFalse(worker_a.conclude(CheckoutStripe.ERROR))
+        self.assertEqual(worker_a.status, CheckoutStripe.PROGRESS)
+
+        self.assertTrue(worker_b.conclude(CheckoutStripe.PAID, amount_paid=1500))
+        self.assertFalse(worker_a.conclude(CheckoutStripe.ERROR))
+        self.checkout.refresh_from_db()
+        self.assertEqual((self.checkout.status, self.checkout.amount_paid), (CheckoutStripe.PAID, 1500))
+
+    @patch('fedow_core.views.stripe.checkout.Session.retrieve')
+    def test_webhook_repond_202_puis_208_sans_attendre(self, mock_session_retrieve):
+        mock_session_retrieve.return_value = self._session_stripe('paid')
+        self.assertTrue(CheckoutStripe.objects.get(pk=self.checkout.pk).claim())
+
+        debut = time.monotonic()
+        reponse = self._poster_webhook()
+        self.assertEqual(reponse.status_code, 202)
+        self.assertLess(time.monotonic() - debut, 1)
+        mock_session_retrieve.assert_not_called()
+
+        CheckoutStripe.objects.filter(pk=self.checkout.pk).update(status=CheckoutStripe.OPEN)
+        self.assertEqual(self._poster_webhook().status_code, 200)
+        self.assertEqual(self._poster_webhook().status_code, 208)
+
+    @patch('fedow_core.views.stripe.checkout.Session.retrieve')
+    def test_paiement_non_conclu_rend_la_main(self, mock_session_retrieve):
+        mock_session_retrieve.return_value = self._session_stripe('unpaid')
+        self.assertEqual(self._poster_webhook().status_code, 208)
+
+        # Pas encore payé : le checkout revient en OPEN, la livraison suivante reprend.
+        # / Not paid yet: back to OPEN, the next delivery takes over.
+        self.checkout.refresh_from_db()
+        self.assertEqual(self.checkout.status, CheckoutStripe.OPEN)
+
+        mock_session_retrieve.return_value = self._session_stripe('paid')
+        self.assertEqual(self._poster_webhook().status_code, 200)
+        self.checkout.refresh_from_db()
+        self.assertEqual(self.checkout.status, CheckoutStripe.PAID)
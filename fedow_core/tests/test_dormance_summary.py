@@ -0,0 +1,64 @@
+"""
+Résumé compact de la monnaie dormante (tableau de bord asset).
+/ Compact dormant-money summary (asset dashboard).
+
+LOCALISATION : fedow_core/tests/test_dormance_summary.py
+
+_calcul_monnaie_fondante n'envoie plus une ligne par portefeuille : tranches,
+médianes et volumes par seuil sont calculés côté serveur, en taille fixe.
+"""
+
+import json
+import random
+from statistics import median
+
+from django.test import SimpleTestCase
+
+from fedow_dashboard.views import (BORNES_BREAKAGE, SEUILS_INACTIVITE, SEUILS_SIMULATEUR_MOIS,
+                                   _resume_dormance)
+
+
+class ResumeDormanceTest(SimpleTestCase):
+
+    def _portefeuilles(self, nombre):
+        generateur = random.Random(nombre)
+        paires = sorted((generateur.randint(0, 900), generateur.randint(1, 5000)) for _ in range(nombre))
+        return [age for age, _solde in paires], [solde for _age, solde in paires]
+
+    def test_identique_au_parcours_complet(self):
+        ages, soldes = self._portefeuilles(500)
+        resume = _resume_dormance(ages, soldes)
+        paires = list(zip(ages, soldes))
+
+        self.assertEqual(resume['solde_total'], sum(soldes))
+        self.assertEqual(resume['solde_median'], median(soldes))
+        self.assertEqual(resume['volumes_inactivite'],
+                         [sum(s for a, s in paires if a >= jours) for jours, _label in SEUILS_INACTIVITE])
+        bornes = [0, *BORNES_BREAKAGE, float('inf')]
+        self.assertEqual(resume['breakage'],
+                         [sum(s for a, s in paires if debut <= a < fin) for debut, fin in zip(bornes, bornes[1:])])
+
+        for ligne in resume['par_seuil']:
+            actifs = [s for a, s in paires if a < ligne['mois'] * 30]
+            inactifs = [s for a, s in paires if a >= ligne['mois'] * 30]
+            self.assertEqual((ligne['nb_actifs'], ligne['solde_actifs']), (len(actifs), sum(actifs)))
+            self.assertEqual((ligne['nb_inactifs'], ligne['volume_inactif']), (len(inactifs), sum(inactifs)))
+            self.assertEqual(ligne['median_actifs'], median(actifs) if actifs else None)
+            self.assertEqual(ligne['median_inactifs'], median(inactifs) if inactifs else None)
+
+    def test_taille_fixe_quel_que_soit_le_nombre_de_cartes(self):
+        petit = _resume_dormance(*self._portefeuilles(10))
+        grand = _resume_dormance(*self._portefeuilles(20000))
+        self.assertEqual(len(grand['par_seuil']), len(SEUILS_SIMULATEUR_MOIS))
+        self.assertEqual(len(grand['breakage']), len(BORNES_BREAKAGE) + 1)
+        self.assertEqual(petit.keys(), grand.keys())
+        # 2000 fois plus de cartes, quelques caractères de plus (chiffres) : pas une ligne par carte.
+        # / 2000x more cards, a few more characters (digits): not one row per card.
+        self.assertLess(len(json.dumps(grand)), 1.5 * len(json.dumps(petit)))
+
+    def test_aucun_portefeuille(self):
+        resume = _resume_dormance([], [])
+        self.assertEqual(resume['nb_wallets'], 0)
+        self.assertEqual(resume['solde_median'], 0)
+        self.assertEqual(resume['breakage'], [0] * (len(BORNES_BREAKAGE) + 1))
+        self.assertTrue(all(ligne['median_inactifs'] is None for ligne in resume['par_seuil']))
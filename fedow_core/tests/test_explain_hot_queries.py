@@ -0,0 +1,70 @@
+"""
+Index composites de Transaction : plans d'execution des requetes chaudes.
+/ Transaction composite indexes: query plans of the hot queries.
+
+LOCALISATION : fedow_core/tests/test_explain_hot_queries.py
+
+Chaque requete chaude doit passer par un index, jamais par un parcours complet
+de la table des transactions.
+"""
+
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+
+from fedow_core.management.commands.explain_hot_queries import (
+    parcours_complet, plan_de_requete, requetes_chaudes,
+)
+from fedow_core.models import Asset, Transaction
+from fedow_core.tests.tests import FedowTestCase
+
+
+class ExplainHotQueriesTest(FedowTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.asset = Asset.objects.get(category=Asset.STRIPE_FED_FIAT)
+        self.wallet = Transaction.objects.first().sender
+
+    def test_aucun_parcours_complet(self):
+        for nom, queryset in requetes_chaudes(self.asset, self.wallet).items():
+            with self.subTest(requete=nom):
+                self.assertFalse(parcours_complet(plan_de_requete(queryset)))
+
+    def test_index_composites_utilises(self):
+        requetes = requetes_chaudes(self.asset, self.wallet)
+        self.assertTrue(any('tx_asset_datetime_idx' in etape
+                            for etape in plan_de_requete(requetes['list_by_asset'])))
+        self.assertTrue(any('tx_action_asset_amount_idx' in etape
+                            for etape in plan_de_requete(requetes['asset_totals_from_sums'])))
+
+    def test_historique_par_curseur_une_branche_par_index(self):
+        # Les branches de paginated_list_by_wallet_signature, pas un OR recopie.
+        # / The real branches of the wallet history, not a copied OR.
+        requetes = requetes_chaudes(self.asset, self.wallet)
+        for branche, index in (('sender', 'tx_sender_datetime_idx'), ('receiver', 'tx_receiver_datetime_idx')):
+            with self.subTest(branche=branche):
+                plan = plan_de_requete(requetes[f'wallet_history_cursor_{branche}'])
+                self.assertTrue(any(index in etape for etape in plan))
+                self.assertNotIn('MULTI-INDEX OR', plan)
+
+    def test_pas_d_index_simple_sur_les_cles_etrangeres(self):
+        # Les index composites (fk, datetime) couvrent les filtres sur la cle seule.
+        # / The composite (fk, datetime) indexes cover lookups on the key alone.
+        with connection.cursor() as cursor:
+            colonnes_indexees = [
+                tuple(index['columns'])
+                for index in connection.introspection.get_constraints(cursor, Transaction._meta.db_table).values()
+                if index['index']
+            ]
+        for colonne in ('asset_id', 'sender_id', 'receiver_id'):
+            with self.subTest(colonne=colonne):
+                self.assertNotIn((colonne,), colonnes_indexees)
+                self.assertIn((colonne, 'datetime'), colonnes_indexees)
+
+    def test_commande_strict(self):
+        out = StringIO()
+        call_command('explain_hot_queries', '--strict', stdout=out)
+        self.assertIn('wallet_history', out.getvalue())
+        self.assertNotIn('FULL SCAN', out.getvalue())
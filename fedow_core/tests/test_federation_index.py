@@ -0,0 +1,67 @@
+"""
+Index des federations : assets acceptes et wallets federes par place.
+/ Federation index: accepted assets and federated wallets per place.
+
+LOCALISATION : fedow_core/tests/test_federation_index.py
+
+L'index est construit en quelques requetes et perime par m2m_changed quand une
+place ou un asset entre / sort d'une federation, sans vider tout le cache.
+"""
+
+from unittest.mock import patch
+
+from django.core.cache import cache
+from faker import Faker
+
+from fedow_core.models import Asset, Federation, Place, build_federation_index, wallet_creator
+from fedow_core.tests.tests import FedowTestCase
+
+
+class FederationIndexTest(FedowTestCase):
+
+    def setUp(self):
+        super().setUp()
+        faker = Faker()
+        self.autre_place = Place.objects.create(name=faker.company(), wallet=wallet_creator())
+        self.asset_autre_place = Asset.objects.create(
+            name=faker.currency_name(),
+            currency_code=faker.currency_code(),
+            category=Asset.TOKEN_LOCAL_FIAT,
+            wallet_origin=self.autre_place.wallet,
+        )
+        self.federation = Federation.objects.create(name=faker.company())
+
+    def test_federation_ajoute_puis_retire_les_assets(self):
+        self.assertNotIn(self.asset_autre_place.pk, self.place.accepted_asset_ids())
+
+        with patch.object(cache, 'clear') as cache_clear:
+            self.federation.places.add(self.place, self.autre_place)
+            self.federation.assets.add(self.asset_autre_place)
+            self.federation.save()
+        cache_clear.assert_not_called()
+
+        self.assertIn(self.asset_autre_place.pk, self.place.accepted_asset_ids())
+        self.assertIn(self.asset_autre_place, self.place.accepted_assets())
+        self.assertIn(self.autre_place.wallet, self.place.wallet_federated_with())
+
+        # Retrait cote inverse (place.federations) : l'index suit aussi.
+        # / Removal from the reverse side (place.federations): the index follows too.
+        self.place.federations.remove(self.federation)
+        self.assertNotIn(self.asset_autre_place.pk, self.place.accepted_asset_ids())
+        self.assertNotIn(self.autre_place.wallet, self.place.wallet_federated_with())
+
+    def test_asset_archive_n_est_plus_accepte(self):
+        self.federation.places.add(self.place, self.autre_place)
+        self.federation.assets.add(self.asset_autre_place)
+        self.assertIn(self.asset_autre_place.pk, self.place.accepted_asset_ids())
+
+        self.asset_autre_place.archive = True
+        self.asset_autre_place.save()
+        self.assertNotIn(self.asset_autre_place.pk, self.place.accepted_asset_ids())
+
+    def test_lecture_sans_requete(self):
+        primaire = Asset.objects.get(category=Asset.STRIPE_FED_FIAT)
+        self.place.accepted_asset_ids()
+        with self.assertNumQueries(0):
+            self.assertIn(primaire.pk, self.place.accepted_asset_ids())
+        self.assertEqual(build_federation_index()[self.place.uuid], self.place.federation_entry())
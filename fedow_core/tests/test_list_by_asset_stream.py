@@ -0,0 +1,105 @@
+"""
+Export en flux de POST /transaction/list_by_asset/ : stream=ndjson ou stream=csv.
+/ Streaming export of POST /transaction/list_by_asset/: stream=ndjson or stream=csv.
+
+LOCALISATION : fedow_core/tests/test_list_by_asset_stream.py
+
+Les lignes sont lues par paquets (values() + iterator()) et envoyees au fil de
+l'eau par StreamingHttpResponse. Sans stream, la reponse JSON reste inchangee.
+"""
+
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+
+from django.utils import timezone
+from rest_framework import status
+
+from fedow_core.models import Transaction
+from fedow_core.tests.tests import FedowTestCase
+from fedow_core.utils import data_to_b64, get_private_key, sign_message
+from fedow_core.views import EXPORT_FIELDS
+
+
+class ListByAssetStreamTest(FedowTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.wallet, self.private_pem, _public_pem = self.create_wallet_via_api()
+        self.primary_card = self.create_primary_card()
+
+        self.asset = self.create_local_asset()
+        self.recharges = []
+        self.attendues = list(Transaction.objects.filter(asset=self.asset).exclude(action=Transaction.CREATION))
+        for amount in (100, 200, 300):
+            Transaction.objects.create(sender=self.place.wallet, receiver=self.place.wallet, asset=self.asset,
+                                       amount=amount, action=Transaction.CREATION, ip="127.0.0.1",
+                                       primary_card=self.primary_card)
+            self.recharges.append(Transaction.objects.create(
+                sender=self.place.wallet, receiver=self.wallet, asset=self.asset,
+                amount=amount, action=Transaction.REFILL, ip="127.0.0.1",
+                primary_card=self.primary_card))
+        # Meme selection que list_by_asset : tout sauf CREATION (le bloc FIRST inclus).
+        # / Same selection as list_by_asset: everything but CREATION (FIRST block included).
+        self.attendues = self.attendues + self.recharges
+
+    def _list_by_asset(self, **kwargs):
+        # Cle API du lieu + signature du wallet (HasPlaceKeyAndWalletSignature).
+        # / Place API key + wallet signature (HasPlaceKeyAndWalletSignature).
+        data = {
+            'asset_uuid': str(self.asset.uuid),
+            'start_date': (timezone.now() - timedelta(days=1)).isoformat(),
+            'end_date': (timezone.now() + timedelta(days=1)).isoformat(),
+            **kwargs,
+        }
+        signature = sign_message(data_to_b64(data), get_private_key(self.private_pem)).decode('utf-8')
+        return self.client.post('/transaction/list_by_asset/', json.dumps(data), content_type='application/json',
+                                headers={
+                                    'Authorization': f'Api-Key {self.temp_key_place}',
+                                    'Wallet': str(self.wallet.uuid),
+                                    'Date': datetime.now().isoformat(),
+                                    'Signature': signature,
+                                })
+
+    @staticmethod
+    def _contenu(response) -> str:
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_ndjson_une_ligne_par_transaction(self):
+        response = self._list_by_asset(stream='ndjson')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+
+        lignes = [json.loads(ligne) for ligne in self._contenu(response).splitlines()]
+        # Sans CREATION, de la plus recente a la plus ancienne.
+        # / CREATION excluded, newest first.
+        self.assertEqual([ligne['uuid'] for ligne in lignes],
+                         [str(t.uuid) for t in reversed(self.attendues)])
+        self.assertEqual(list(lignes[0].keys()), list(EXPORT_FIELDS))
+        self.assertEqual(lignes[0]['amount'], 300)
+        self.assertEqual(lignes[0]['action'], Transaction.REFILL)
+        self.assertEqual(lignes[0]['sender_name'], self.place.wallet.get_name())
+        self.assertEqual(lignes[0]['receiver_name'], self.wallet.get_name())
+
+    def test_csv_entete_et_lignes(self):
+        response = self._list_by_asset(stream='csv')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('attachment', response['Content-Disposition'])
+
+        lignes = list(csv.reader(io.StringIO(self._contenu(response))))
+        self.assertEqual(lignes[0], list(EXPORT_FIELDS))
+        self.assertEqual(len(lignes), 1 + len(self.attendues))
+        montants = [int(ligne[EXPORT_FIELDS.index('amount')]) for ligne in lignes[1:4]]
+        self.assertEqual(montants, [300, 200, 100])
+
+    def test_json_par_defaut_et_stream_invalide(self):
+        response = self._list_by_asset()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.streaming)
+        self.assertEqual(len(response.json()), len(self.attendues))
+
+        response = self._list_by_asset(stream='xml')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
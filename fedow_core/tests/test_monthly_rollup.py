@@ -0,0 +1,91 @@
+"""
+Rollup mensuel des transactions (AssetMonthlyRollup) et graphes du tableau de bord.
+/ Monthly transaction rollup (AssetMonthlyRollup) and dashboard charts.
+
+LOCALISATION : fedow_core/tests/test_monthly_rollup.py
+
+Transaction.save() incremente la case (asset, mois, action). Les graphes
+temporels lisent ces cases au lieu d'agreger toute la table des transactions.
+"""
+
+from datetime import timedelta
+
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from fedow_core.models import AssetMonthlyRollup, Transaction
+from fedow_core.tests.tests import FedowTestCase
+from fedow_dashboard.views import _calcul_temporel, _pouls_reseau
+
+
+class AssetMonthlyRollupTest(FedowTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.wallet, _private_pem, _public_pem = self.create_wallet_via_api()
+        self.primary_card = self.create_primary_card()
+
+        self.asset = self.create_local_asset()
+
+    def _creation_puis_recharge(self, creation, recharge, moment=None):
+        # Horloge croissante : la chaine refuse un maillon plus ancien que le precedent.
+        # / Increasing clock: the chain refuses a link older than the previous one.
+        self.horloge = moment or getattr(self, 'horloge', timezone.now()) + timedelta(seconds=2)
+        moment = self.horloge
+        Transaction.objects.create(sender=self.place.wallet, receiver=self.place.wallet, asset=self.asset,
+                                   amount=creation, action=Transaction.CREATION, ip="127.0.0.1",
+                                   primary_card=self.primary_card, datetime=moment)
+        Transaction.objects.create(sender=self.place.wallet, receiver=self.wallet, asset=self.asset,
+                                   amount=recharge, action=Transaction.REFILL, ip="127.0.0.1",
+                                   primary_card=self.primary_card, datetime=moment + timedelta(seconds=1))
+
+    def _agregat_des_transactions(self):
+        return sorted(
+            (ligne['mois'].date(), ligne['action'], ligne['nombre'], ligne['somme'])
+            for ligne in (Transaction.objects.filter(asset=self.asset)
+                          .annotate(mois=TruncMonth('datetime'))
+                          .values('mois', 'action')
+                          .annotate(nombre=Count('uuid'), somme=Sum('amount')))
+        )
+
+    def _rollup(self):
+        return sorted(AssetMonthlyRollup.objects.filter(asset=self.asset)
+                      .values_list('month', 'action', 'count', 'total'))
+
+    def test_rollup_suit_les_transactions(self):
+        self._creation_puis_recharge(1000, 300)
+        self._creation_puis_recharge(500, 200)
+        self._creation_puis_recharge(700, 700, moment=timezone.now() + timedelta(days=40))
+
+        self.assertEqual(self._rollup(), self._agregat_des_transactions())
+        mois_courant = AssetMonthlyRollup.month_of(timezone.now())
+        recharges = AssetMonthlyRollup.objects.get(asset=self.asset, month=mois_courant, action=Transaction.REFILL)
+        self.assertEqual((recharges.count, recharges.total), (2, 500))
+
+    def test_case_absente_repart_des_transactions(self):
+        self._creation_puis_recharge(1000, 400)
+        AssetMonthlyRollup.objects.filter(asset=self.asset, action=Transaction.REFILL).delete()
+
+        # La transaction suivante recree la case, en comptant les recharges deja passees.
+        # / The next transaction rebuilds the cell, counting the earlier refills.
+        self._creation_puis_recharge(100, 100)
+        self.assertEqual(self._rollup(), self._agregat_des_transactions())
+
+    def test_graphes_lisent_le_rollup(self):
+        self._creation_puis_recharge(1000, 300)
+        self._creation_puis_recharge(900, 900, moment=timezone.now() + timedelta(days=40))
+
+        with self.assertNumQueries(1):
+            temporel = _calcul_temporel(self.asset)
+        # CREATION exclue, une seule serie : les recharges, mois vides compris.
+        # / CREATION excluded, a single series: the refills, empty months included.
+        self.assertEqual([serie['data'] for serie in temporel['datasets']],
+                         [[3.0] + [0] * (len(temporel['labels']) - 2) + [9.0]])
+
+        pouls = _pouls_reseau()
+        attendu = (Transaction.objects.exclude(action=Transaction.FIRST)
+                   .annotate(mois=TruncMonth('datetime'))
+                   .values('mois').annotate(nb=Count('uuid')).order_by('mois'))
+        self.assertEqual(pouls['data'], [ligne['nb'] for ligne in attendu])
+        self.assertEqual(pouls['labels'], [ligne['mois'].strftime('%Y-%m') for ligne in attendu])
@@ -0,0 +1,63 @@
+"""
+Cache des cles publiques RSA chargees : wallets et places cashless.
+/ Loaded RSA public key cache: wallets and cashless places.
+
+LOCALISATION : fedow_core/tests/test_public_key_cache.py
+
+Le PEM n'est decode qu'une fois par processus. Un nouveau PEM (empreinte
+differente) est recharge, l'ancienne cle n'est plus jamais servie.
+"""
+
+from fedow_core.models import Wallet
+from fedow_core.tests.tests import FedowTestCase
+from fedow_core.utils import PublicKeyCache, public_key_cache, rsa_generator
+
+
+class PublicKeyCacheTest(FedowTestCase):
+
+    def setUp(self):
+        super().setUp()
+        public_key_cache.clear()
+
+    def test_requetes_signees_servies_par_le_cache(self):
+        """
+        Deux GET signes par le serveur cashless : une seule lecture du PEM.
+        / Two signed GETs from the cashless server: the PEM is decoded once.
+        """
+        for i in range(2):
+            response = self._get_from_simulated_cashless('asset/')
+            self.assertEqual(response.status_code, 200)
+
+        # Le helper re-sauve la place avec le meme PEM : l'entree reste en cache.
+        # / The helper saves the place again with the same PEM: the entry stays.
+        stats = public_key_cache.stats()
+        self.assertEqual(stats['misses'], 1)
+        self.assertGreaterEqual(stats['hits'], 1)
+
+    def test_nouveau_pem_recharge_la_cle(self):
+        wallet, private_pem, public_pem = self.create_wallet_via_api()
+        ancienne = wallet.public_key()
+        self.assertIs(Wallet.objects.get(pk=wallet.pk).public_key(), ancienne)
+
+        nouveau_private_pem, nouveau_public_pem = rsa_generator()
+        wallet.public_pem = nouveau_public_pem
+        wallet.save()
+
+        nouvelle = Wallet.objects.get(pk=wallet.pk).public_key()
+        self.assertIsNot(nouvelle, ancienne)
+        self.assertEqual(nouvelle.public_numbers(), wallet.public_key().public_numbers())
+
+    def test_lru_borne(self):
+        cache = PublicKeyCache(maxsize=2)
+        pems = [rsa_generator()[1] for i in range(3)]
+        for i, pem in enumerate(pems):
+            cache.get(f"wallet:{i}", pem)
+        self.assertEqual(cache.stats()['size'], 2)
+
+        # Le plus ancien est sorti, les deux derniers sont servis par le cache.
+        # / The oldest was evicted, the last two are cache hits.
+        cache.get("wallet:1", pems[1])
+        cache.get("wallet:2", pems[2])
+        cache.get("wallet:0", pems[0])
+        self.assertEqual(cache.stats()['hits'], 2)
+        self.assertEqual(cache.stats()['misses'], 4)
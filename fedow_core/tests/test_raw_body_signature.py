@@ -0,0 +1,65 @@
+"""
+Signature des POST sur le corps brut : header `Signature-Mode: raw-body`.
+/ POST signatures over the raw body: `Signature-Mode: raw-body` header.
+
+LOCALISATION : fedow_core/tests/test_raw_body_signature.py
+
+Le client signe les octets qu'il envoie, le serveur les verifie tels quels
+(RawBodySignatureMiddleware) : l'ordre des cles et le formatage JSON ne
+comptent plus. Sans le header, l'ancien schema data_to_b64 reste valable.
+"""
+
+import json
+from unittest.mock import patch
+
+from rest_framework import status
+
+from fedow_core import permissions
+from fedow_core.models import Asset
+from fedow_core.tests.tests import FedowTestCase
+from fedow_core.utils import sign_message
+
+
+class RawBodySignatureTest(FedowTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.place.cashless_rsa_pub_key = self.public_cashless_pem
+        self.place.save()
+
+    def _post_signe(self, corps: bytes, signature: str, mode: str | None):
+        headers = {
+            'Authorization': f'Api-Key {self.temp_key_place}',
+            'Signature': signature,
+        }
+        if mode:
+            headers['Signature-Mode'] = mode
+        return self.client.post('/asset/', corps, content_type='application/json', headers=headers)
+
+    def test_corps_brut_signe_sans_reserialisation(self):
+        # JSON compact, cles dans un ordre quelconque : json.dumps ne le reproduirait pas.
+        # / Compact JSON, arbitrary key order: json.dumps would not rebuild it.
+        corps = json.dumps({
+            "category": Asset.TOKEN_LOCAL_FIAT,
+            "name": "Raw body",
+            "currency_code": "RAW",
+        }, separators=(',', ':')).encode('utf-8')
+        signature = sign_message(corps, self.private_cashless_rsa).decode('utf-8')
+
+        with patch.object(permissions, 'data_to_b64', wraps=permissions.data_to_b64) as data_to_b64:
+            response = self._post_signe(corps, signature, 'raw-body')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        data_to_b64.assert_not_called()
+
+        # La meme signature, sans le mode : le message reconstruit differe.
+        # / Same signature without the mode: the rebuilt message differs.
+        response = self._post_signe(corps, signature, None)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_anciens_clients_data_to_b64(self):
+        response = self._post_from_simulated_cashless('asset', {
+            "name": "Data to b64",
+            "currency_code": "B64",
+            "category": Asset.TOKEN_LOCAL_FIAT,
+        })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
@@ -0,0 +1,87 @@
+"""
+Signatures GET des wallets : fenetre sur le header Date et cache des signatures verifiees.
+/ Wallet GET signatures: Date header window and verified signature cache.
+
+LOCALISATION : fedow_core/tests/test_signature_window.py
+
+Un GET signe "{wallet.uuid}:{date}". Repete dans la fenetre, il est servi par le
+cache sans calcul RSA ; une date perimee est refusee avant toute crypto.
+"""
+
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework import status
+
+from fedow_core import permissions
+from fedow_core.tests.tests import FedowTestCase
+from fedow_core.utils import get_private_key, sign_message, verified_signature_cache
+
+
+class SignatureWindowTest(FedowTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.wallet, self.private_pem, self.public_pem = self.create_wallet_via_api()
+        verified_signature_cache.clear()
+
+    def _headers_signes(self, date: datetime) -> dict:
+        date_iso = date.isoformat()
+        signature = sign_message(
+            f"{self.wallet.uuid}:{date_iso}".encode('utf8'),
+            get_private_key(self.private_pem),
+        ).decode('utf-8')
+        return {
+            'Authorization': f'Api-Key {self.temp_key_place}',
+            'Wallet': str(self.wallet.uuid),
+            'Date': date_iso,
+            'Signature': signature,
+        }
+
+    def _get_wallet_signe(self, headers: dict):
+        return self.client.get('/wallet/retrieve_by_signature/', headers=headers)
+
+    def test_get_repete_sans_calcul_rsa(self):
+        # RSA-PSS est sale : le client qui interroge en boucle renvoie les memes headers.
+        # / RSA-PSS is salted: a polling client re-sends the same signed headers.
+        headers = self._headers_signes(datetime.now())
+        with patch.object(permissions, 'verify_signature', wraps=permissions.verify_signature) as verify:
+            for i in range(3):
+                response = self._get_wallet_signe(headers)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(verify.call_count, 1)
+        self.assertEqual(verified_signature_cache.stats()['hits'], 2)
+
+        # Autre wallet, meme signature : pas d'entree commune dans le cache.
+        # / Another wallet, same signature: no shared cache entry.
+        autre_wallet, autre_private_pem, autre_public_pem = self.create_wallet_via_api()
+        response = self._get_wallet_signe({**headers, 'Wallet': str(autre_wallet.uuid)})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_date_perimee_refusee_avant_la_crypto(self):
+        with patch.object(permissions, 'verify_signature', wraps=permissions.verify_signature) as verify:
+            response = self._get_wallet_signe(self._headers_signes(datetime.now() - timedelta(hours=1)))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        verify.assert_not_called()
+
+    @override_settings(SIGNATURE_DATE_WINDOW=0)
+    def test_fenetre_desactivee(self):
+        response = self._get_wallet_signe(self._headers_signes(datetime.now() - timedelta(hours=1)))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(verified_signature_cache.stats()['size'], 0)
+
+    @override_settings(TIME_ZONE='Europe/Paris')
+    def test_date_naive_lue_dans_time_zone(self):
+        # Heure de Paris sans fuseau : dans la fenetre. Heure UTC sans fuseau : une ou deux heures d'ecart.
+        # / Naive Paris time: inside the window. Naive UTC time: one or two hours off.
+        heure_de_paris = timezone.localtime().replace(tzinfo=None)
+        self.assertLess(permissions.secondes_hors_fenetre(heure_de_paris), 0)
+        self.assertEqual(self._get_wallet_signe(self._headers_signes(heure_de_paris)).status_code,
+                         status.HTTP_200_OK)
+
+        heure_utc = timezone.now().replace(tzinfo=None)
+        self.assertGreater(permissions.secondes_hors_fenetre(heure_utc), 0)
+        self.assertEqual(self._get_wallet_signe(self._headers_signes(heure_utc)).status_code,
+                         status.HTTP_403_FORBIDDEN)
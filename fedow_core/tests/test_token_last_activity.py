@@ -0,0 +1,82 @@
+"""
+Derniere activite portee par le Token : last_transaction_id et last_activity_at.
+/ Last activity carried by the Token: last_transaction_id and last_activity_at.
+
+LOCALISATION : fedow_core/tests/test_token_last_activity.py
+
+Transaction.save() pose les deux colonnes dans l'UPDATE du delta de solde :
+la vue d'une carte ou d'un wallet ne refait plus de requete OR sur toutes les
+transactions de l'asset, et le tableau de bord n'a plus besoin de ses GROUP BY.
+"""
+
+
+from django.db.models import Q
+
+from fedow_core.models import Token, Transaction
+from fedow_core.serializers import TokenSerializer
+from fedow_core.tests.tests import FedowTestCase
+from fedow_dashboard.views import _calcul_monnaie_fondante
+
+
+class TokenLastActivityTest(FedowTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.wallet, self.private_pem, self.public_pem = self.create_wallet_via_api()
+
+        self.card = self.create_card(user=self.wallet.user)
+        self.primary_card = self.create_primary_card()
+
+        self.asset = self.create_local_asset()
+        self.creation = Transaction.objects.create(
+            sender=self.place.wallet,
+            receiver=self.place.wallet,
+            asset=self.asset,
+            amount=10000,
+            action=Transaction.CREATION,
+            ip="127.0.0.1",
+            primary_card=self.primary_card,
+        )
+        self.refill = Transaction.objects.create(
+            sender=self.place.wallet,
+            receiver=self.wallet,
+            asset=self.asset,
+            amount=2500,
+            action=Transaction.REFILL,
+            ip="127.0.0.1",
+            card=self.card,
+            primary_card=self.primary_card,
+        )
+
+    def test_emetteur_et_receveur_a_jour(self):
+        for wallet in (self.place.wallet, self.wallet):
+            token = Token.objects.get(wallet=wallet, asset=self.asset)
+            self.assertEqual(token.last_transaction_id, self.refill.uuid)
+            self.assertEqual(token.last_activity_at, self.refill.datetime)
+
+        # Meme resultat que l'ancienne requete OR sur les transactions de l'asset.
+        # / Same result as the former OR query over the asset transactions.
+        token = Token.objects.get(wallet=self.wallet, asset=self.asset)
+        ancienne = self.asset.transactions.filter(
+            Q(sender=self.wallet) | Q(receiver=self.wallet)
+        ).order_by('datetime').last()
+        self.assertEqual(token.last_transaction(), ancienne)
+        self.assertEqual(Token.objects.get(wallet=self.place.wallet, asset=self.asset).value, 7500)
+
+    def test_serializer_une_lecture_par_token(self):
+        token = Token.objects.select_related('asset').get(wallet=self.wallet, asset=self.asset)
+        with self.assertNumQueries(0):
+            self.assertEqual(token.last_transaction_datetime(), self.refill.datetime)
+        token.last_transaction()
+        with self.assertNumQueries(0):
+            token.start_membership_date()
+
+        data = TokenSerializer(token).data
+        self.assertEqual(data['last_transaction']['uuid'], str(self.refill.uuid))
+
+    def test_monnaie_fondante_sans_group_by(self):
+        Token.objects.filter(wallet=self.wallet, asset=self.asset).update(
+            last_activity_at=self.refill.datetime.replace(year=self.refill.datetime.year - 2))
+        with self.assertNumQueries(4):
+            resultat = _calcul_monnaie_fondante(self.asset)
+        self.assertIn(25.0, resultat['data'])
@@ -0,0 +1,134 @@
+"""
+Lot de transactions d'un serveur cashless : POST /transaction/batch/.
+/ Cashless server transaction batch: POST /transaction/batch/.
+
+LOCALISATION : fedow_core/tests/test_transaction_batch.py
+
+Une signature pour tout le lot, une seule ecriture en base, un resultat par ligne.
+Chaque ligne porte son uuid : rejouer le lot (timeout reseau cote LaBoutik) ne
+debite jamais deux fois la carte.
+"""
+
+from unittest.mock import patch
+from uuid import uuid4
+
+from rest_framework import status
+
+from fedow_core.models import Token, Transaction
+from fedow_core.serializers import TransactionBatchW2W
+from fedow_core.tests.tests import FedowTestCase
+
+
+class TransactionBatchTest(FedowTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.wallet, self.private_pem, self.public_pem = self.create_wallet_via_api()
+
+        self.card = self.create_card(user=self.wallet.user)
+
+        self.primary_card = self.create_primary_card()
+
+        self.asset = self.create_local_asset()
+
+        Transaction.objects.create(
+            sender=self.place.wallet,
+            receiver=self.place.wallet,
+            asset=self.asset,
+            amount=10000,
+            action=Transaction.CREATION,
+            ip="127.0.0.1",
+            primary_card=self.primary_card,
+        )
+        Transaction.objects.create(
+            sender=self.place.wallet,
+            receiver=self.wallet,
+            asset=self.asset,
+            amount=5000,
+            action=Transaction.REFILL,
+            ip="127.0.0.1",
+            card=self.card,
+        )
+
+    def _vente(self, amount):
+        return {
+            "uuid": str(uuid4()),
+            "amount": amount,
+            "sender": str(self.wallet.uuid),
+            "receiver": str(self.place.wallet.uuid),
+            "asset": str(self.asset.uuid),
+            "user_card_firstTagId": self.card.first_tag_id,
+            "primary_card_fisrtTagId": self.primary_card.first_tag_id,
+        }
+
+    def _solde_user(self):
+        return Token.objects.get(wallet=self.wallet, asset=self.asset).value
+
+    def test_lot_de_ventes_ecrit_et_rejoue_sans_double_debit(self):
+        """
+        Trois ventes en un lot, puis le meme lot rejoue : aucune ligne n'est debitee deux fois.
+        / Three sales in one batch, then the same batch replayed: nothing is charged twice.
+        """
+        lot = {"transactions": [self._vente(1000), self._vente(500), self._vente(250)]}
+
+        response = self._post_from_simulated_cashless('transaction/batch', lot)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([r['status'] for r in response.data], ['created'] * 3)
+        for ligne, resultat in zip(lot['transactions'], response.data):
+            self.assertEqual(resultat['uuid'], ligne['uuid'])
+            transaction = Transaction.objects.get(uuid=ligne['uuid'])
+            self.assertEqual(transaction.action, Transaction.SALE)
+            self.assertEqual(resultat['hash'], transaction.hash)
+        self.assertEqual(self._solde_user(), 5000 - 1750)
+
+        # Rejeu apres un timeout cote LaBoutik.
+        # / Replay after a LaBoutik side timeout.
+        response = self._post_from_simulated_cashless('transaction/batch', lot)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([r['status'] for r in response.data], ['already_done'] * 3)
+        self.assertEqual(self._solde_user(), 5000 - 1750)
+
+    def test_une_ligne_refusee_n_ecrit_rien(self):
+        """
+        La derniere vente depasse le solde : tout le lot est refuse, rien n'est ecrit.
+        / The last sale exceeds the balance: the whole batch is refused, nothing written.
+        """
+        lot = {"transactions": [self._vente(1000), self._vente(3000), self._vente(2000)]}
+        nb_transactions_avant = Transaction.objects.count()
+
+        response = self._post_from_simulated_cashless('transaction/batch', lot)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual([r['status'] for r in response.data], ['not_applied', 'not_applied', 'error'])
+        self.assertEqual(Transaction.objects.count(), nb_transactions_avant)
+        self.assertEqual(self._solde_user(), 5000)
+
+    def test_uuid_en_double_dans_le_lot(self):
+        vente = self._vente(100)
+        response = self._post_from_simulated_cashless('transaction/batch', {"transactions": [vente, vente]})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self._solde_user(), 5000)
+
+    def test_rejeu_concurrent_rend_already_done(self):
+        """
+        Un envoi concurrent du meme lot ecrit entre la premiere lecture et le verrou :
+        les lignes sont relues sous le verrou et rendues already_done, pas une erreur 500.
+        / A concurrent send writes between the first read and the lock: lines are
+        re-read under the lock and reported already_done, not a 500.
+        """
+        lot = {"transactions": [self._vente(1000), self._vente(500)]}
+        self.assertEqual(self._post_from_simulated_cashless('transaction/batch', lot).status_code,
+                         status.HTTP_201_CREATED)
+
+        lecture_originale = TransactionBatchW2W._deja_ecrites
+        lectures = []
+
+        def premiere_lecture_perimee(serializer, lignes):
+            lectures.append(lignes)
+            return {} if len(lectures) == 1 else lecture_originale(serializer, lignes)
+
+        with patch.object(TransactionBatchW2W, '_deja_ecrites', premiere_lecture_perimee):
+            response = self._post_from_simulated_cashless('transaction/batch', lot)
+        self.assertEqual(len(lectures), 2)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([r['status'] for r in response.data], ['already_done'] * 2)
+        self.assertEqual(self._solde_user(), 5000 - 1500)
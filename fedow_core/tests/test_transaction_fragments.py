@@ -0,0 +1,103 @@
+"""
+Fragments versionnes de CachedTransactionSerializer (page « mon compte » de Lespass).
+/ Versioned CachedTransactionSerializer fragments (Lespass "my account" page).
+
+LOCALISATION : fedow_core/tests/test_transaction_fragments.py
+
+Les wallets, assets et cartes serialises sont cles par version : un solde n'est
+jamais perime apres une transaction, et une page se lit en quelques get_many
+quel que soit son nombre de lignes.
+"""
+
+from unittest.mock import patch
+
+from django.core.cache import cache
+
+from fedow_core.models import Transaction
+from fedow_core.serializers import CachedTransactionSerializer
+from fedow_core.tests.tests import FedowTestCase
+
+CONTEXTE = {'detailed_asset': True, 'serialized_sender': True, 'serialized_receiver': True}
+
+
+class TransactionFragmentsTest(FedowTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.wallet, self.private_pem, self.public_pem = self.create_wallet_via_api()
+
+        self.card = self.create_card(user=self.wallet.user)
+        self.primary_card = self.create_primary_card()
+
+        self.asset = self.create_local_asset()
+
+    def _recharge(self, amount):
+        Transaction.objects.create(sender=self.place.wallet, receiver=self.place.wallet, asset=self.asset,
+                                   amount=amount, action=Transaction.CREATION, ip="127.0.0.1",
+                                   primary_card=self.primary_card)
+        return Transaction.objects.create(sender=self.place.wallet, receiver=self.wallet, asset=self.asset,
+                                          amount=amount, action=Transaction.REFILL, ip="127.0.0.1",
+                                          card=self.card, primary_card=self.primary_card)
+
+    def _page(self):
+        transactions = Transaction.objects.filter(receiver=self.wallet).order_by('-datetime')
+        return CachedTransactionSerializer(transactions, many=True, context=CONTEXTE).data
+
+    def _valeur(self, wallet_data):
+        return next(t['value'] for t in wallet_data['tokens'] if t['asset']['uuid'] == str(self.asset.uuid))
+
+    def test_solde_jamais_perime(self):
+        self._recharge(1000)
+        page = self._page()
+        self.assertEqual(self._valeur(page[0]['serialized_receiver']), 1000)
+
+        self._recharge(500)
+        page = self._page()
+        self.assertEqual(self._valeur(page[0]['serialized_receiver']), 1500)
+        self.assertEqual(self._valeur(page[1]['serialized_receiver']), 1500)
+        # Le wallet de la carte suit aussi, sans changer la carte.
+        # / The card wallet follows too, without touching the card.
+        self.assertEqual(self._valeur(page[1]['card']['wallet']), 1500)
+        self.assertEqual(page[0]['serialized_asset']['uuid'], str(self.asset.uuid))
+
+    def test_lectures_groupees_par_page(self):
+        self._recharge(1000)
+        self._page()
+        with patch.object(cache, 'get_or_set', wraps=cache.get_or_set) as get_or_set, \
+                patch.object(cache, 'get_many', wraps=cache.get_many) as get_many:
+            self._page()
+        appels_une_ligne = get_many.call_count
+        get_or_set.assert_not_called()
+
+        for _ in range(3):
+            self._recharge(100)
+        self._page()
+        with patch.object(cache, 'get_or_set', wraps=cache.get_or_set) as get_or_set, \
+                patch.object(cache, 'get_many', wraps=cache.get_many) as get_many:
+            page = self._page()
+        self.assertEqual(len(page), 4)
+        self.assertEqual(get_many.call_count, appels_une_ligne)
+        get_or_set.assert_not_called()
+
+    def test_asset_renomme_relu(self):
+        transaction = self._recharge(1000)
+        avant = CachedTransactionSerializer(transaction, context=CONTEXTE).data
+        self.asset.name = "Monnaie renommee"
+        self.asset.save()
+        apres = CachedTransactionSerializer(transaction, context=CONTEXTE).data
+        self.assertNotEqual(avant['serialized_asset']['name'], "Monnaie renommee")
+        self.assertEqual(apres['serialized_asset']['name'], "Monnaie renommee")
+
+    def test_lieu_renomme_relu(self):
+        # L'asset et la carte embarquent leur lieu : un renommage se voit tout de suite.
+        # / The asset and the card embed their place: a rename shows up at once.
+        transaction = self._recharge(1000)
+        CachedTransactionSerializer(transaction, context=CONTEXTE).data
+        self.place.name = "Lieu renomme"
+        self.place.lespass_domain = "renomme.example.org"
+        self.place.save()
+        apres = CachedTransactionSerializer(transaction, context=CONTEXTE).data
+        self.assertEqual(apres['serialized_asset']['place_origin']['name'], "Lieu renomme")
+        self.assertEqual(apres['serialized_asset']['place_origin']['lespass_domain'], "renomme.example.org")
+        self.assertEqual(apres['card']['origin']['place']['name'], "Lieu renomme")
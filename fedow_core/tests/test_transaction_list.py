@@ -0,0 +1,86 @@
+"""
+GET /transaction/ : liste filtrée, paginée par curseur, hash vérifié à la demande.
+/ GET /transaction/: filtered, cursor-paginated list, hash checked on demand.
+
+LOCALISATION : fedow_core/tests/test_transaction_list.py
+
+Le coût d'un appel ne dépend plus de la taille de la table : une page bornée,
+un nombre de requêtes fixe, pas de verify_hash() par ligne sauf si demandé.
+"""
+
+from urllib.parse import urlencode, urlsplit
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+
+from fedow_core.models import Transaction
+from fedow_core.tests.tests import FedowTestCase
+
+
+class TransactionListTest(FedowTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.wallet, _private_pem, _public_pem = self.create_wallet_via_api()
+        self.primary_card = self.create_primary_card()
+
+        self.asset = self.create_local_asset()
+
+    def _recharges(self, nombre):
+        for _ in range(nombre):
+            Transaction.objects.create(sender=self.place.wallet, receiver=self.place.wallet, asset=self.asset,
+                                       amount=100, action=Transaction.CREATION, ip="127.0.0.1",
+                                       primary_card=self.primary_card)
+            Transaction.objects.create(sender=self.place.wallet, receiver=self.wallet, asset=self.asset,
+                                       amount=100, action=Transaction.REFILL, ip="127.0.0.1",
+                                       primary_card=self.primary_card)
+
+    def _liste(self, **params):
+        return self._get_from_simulated_cashless(f'transaction/?{urlencode(params)}')
+
+    def test_filtres_et_curseur(self):
+        self._recharges(3)
+        attendues = list(Transaction.objects.filter(receiver=self.wallet, action=Transaction.REFILL)
+                         .order_by('-datetime', '-uuid').values_list('uuid', flat=True))
+
+        response = self._liste(wallet=self.wallet.uuid, action=Transaction.REFILL, page_size=2)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNotNone(response.data['next'])
+
+        suivant = urlsplit(response.data['next'])
+        suite = self._get_from_simulated_cashless(f"{suivant.path.lstrip('/')}?{suivant.query}")
+        self.assertEqual(suite.status_code, status.HTTP_200_OK)
+        self.assertIsNone(suite.data['next'])
+        self.assertEqual([ligne['uuid'] for ligne in response.data['results'] + suite.data['results']],
+                         [str(uuid) for uuid in attendues])
+
+        response = self._liste(asset=self.asset.uuid, action=Transaction.CREATION)
+        self.assertEqual({ligne['action'] for ligne in response.data['results']}, {Transaction.CREATION})
+
+        response = self._liste(action='XXX')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_projection_et_verify_hash_a_la_demande(self):
+        self._recharges(1)
+        response = self._liste(asset=self.asset.uuid)
+        self.assertNotIn('verify_hash', response.data['results'][0])
+        self.assertEqual(response.data['results'][0]['receiver_name'], self.wallet.get_name())
+
+        response = self._liste(asset=self.asset.uuid, fields='uuid,amount,verify_hash', verify_hash='true')
+        for ligne in response.data['results']:
+            self.assertEqual(set(ligne), {'uuid', 'amount', 'verify_hash'})
+            self.assertTrue(ligne['verify_hash'])
+
+    def test_requetes_independantes_du_nombre_de_lignes(self):
+        self._recharges(1)
+        self._liste(asset=self.asset.uuid, verify_hash='true')
+        with CaptureQueriesContext(connection) as peu:
+            self._liste(asset=self.asset.uuid, verify_hash='true')
+
+        self._recharges(4)
+        with CaptureQueriesContext(connection) as beaucoup:
+            response = self._liste(asset=self.asset.uuid, verify_hash='true')
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertEqual(len(peu.captured_queries), len(beaucoup.captured_queries))
@@ -0,0 +1,151 @@
+"""
+Commande verify_chain : verification complete puis incrementale de la chaine.
+/ verify_chain command: full then incremental chain verification.
+
+LOCALISATION : fedow_core/tests/test_verify_chain.py
+
+Le premier passage verifie toute la chaine et pose un point de reprise par asset.
+Les passages suivants ne relisent que les nouveaux maillons. Un maillon modifie
+hors save() (hash invalide) et un parent a deux enfants (fork) sont detectes.
+"""
+
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from uuid import UUID
+
+from django.core.management import call_command
+from django.db import connection
+from django.utils import timezone
+
+from fedow_core.management.commands.verify_chain import verifie_chaine_asset, verifie_en_parallele
+from fedow_core.models import Asset, ChainCheckpoint, Transaction
+from fedow_core.tests.tests import FedowTestCase
+
+
+class VerifyChainTest(FedowTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.asset = self.create_local_asset()
+
+        self.primary_card = self.create_primary_card()
+
+        self.creations = [self._creation() for i in range(3)]
+
+    def _creation(self, amount=1000, **kwargs):
+        return Transaction.objects.create(
+            sender=self.place.wallet,
+            receiver=self.place.wallet,
+            asset=self.asset,
+            amount=amount,
+            action=Transaction.CREATION,
+            ip="127.0.0.1",
+            primary_card=self.primary_card,
+            **kwargs,
+        )
+
+    def _verify_chain(self, *args):
+        out = StringIO()
+        call_command('verify_chain', '--asset', str(self.asset.uuid), *args, stdout=out)
+        return out.getvalue()
+
+    def test_passage_complet_puis_incremental(self):
+        sortie = self._verify_chain()
+        self.assertIn("4 maillons verifies, 0 hash invalides, 0 forks, 0 trous", sortie)
+
+        checkpoint = ChainCheckpoint.objects.get(asset=self.asset)
+        self.assertEqual(checkpoint.transaction_id, self.creations[-1].pk)
+        self.assertEqual(checkpoint.nb_links, 4)
+
+        # Rien de nouveau : aucun maillon relu.
+        # / Nothing new: no link read again.
+        sortie = self._verify_chain()
+        self.assertIn("0 maillons verifies", sortie)
+
+        nouvelle = self._creation()
+        sortie = self._verify_chain()
+        self.assertIn("1 maillons verifies, 0 hash invalides", sortie)
+        checkpoint.refresh_from_db()
+        self.assertEqual(checkpoint.transaction_id, nouvelle.pk)
+        self.assertEqual(checkpoint.nb_links, 5)
+
+    def test_hash_invalide_et_fork_detectes(self):
+        self._verify_chain()
+
+        # Un maillon modifie hors save() : son hash ne correspond plus.
+        # / A link modified outside save(): its hash no longer matches.
+        falsifiee = self._creation()
+        Transaction.objects.filter(pk=falsifiee.pk).update(amount=999999)
+
+        # Un second enfant pour le meme parent, comme avant la tete de chaine.
+        # / A second child of the same parent, as before the chain head.
+        forkee = self._creation()
+        Transaction.objects.filter(pk=forkee.pk).update(previous_transaction=falsifiee.previous_transaction)
+
+        sortie = self._verify_chain()
+        self.assertIn("2 maillons verifies, 2 hash invalides, 1 forks, 0 trous", sortie)
+        self.assertIn(str(falsifiee.pk), sortie)
+
+        checkpoint = ChainCheckpoint.objects.get(asset=self.asset)
+        self.assertEqual(checkpoint.nb_invalid_hashes, 2)
+        self.assertEqual(checkpoint.nb_forks, 1)
+
+        # --full repart du premier bloc et remet les compteurs a plat.
+        # / --full restarts from the first block and resets the counters.
+        sortie = self._verify_chain('--full')
+        self.assertIn("6 maillons verifies, 2 hash invalides, 1 forks", sortie)
+        checkpoint.refresh_from_db()
+        self.assertEqual(checkpoint.nb_links, 6)
+        self.assertEqual(checkpoint.nb_forks, 1)
+
+    def test_enfant_de_meme_datetime_avant_son_parent_par_uuid(self):
+        """
+        Un enfant a la datetime de son parent et un uuid plus petit : l'ordre (datetime, uuid)
+        le lit avant son parent. Ni trou, ni tete decalee, ni maillon oublie en incremental.
+        / A child sharing its parent's datetime with a smaller uuid: no gap, no head
+        mismatch, and no link skipped by the incremental run.
+        """
+        moment = timezone.now() + timedelta(minutes=1)
+        parent = self._creation(uuid=UUID('ffffffff-0000-4000-8000-000000000000'), datetime=moment)
+        enfant = self._creation(uuid=UUID('00000000-0000-4000-8000-000000000002'), datetime=moment)
+        self.assertEqual(enfant.previous_transaction_id, parent.pk)
+
+        sortie = self._verify_chain()
+        self.assertIn("6 maillons verifies, 0 hash invalides, 0 forks, 0 trous", sortie)
+        self.assertNotIn("la tete de chaine ne pointe pas", sortie)
+        self.assertEqual(ChainCheckpoint.objects.get(asset=self.asset).transaction_id, enfant.pk)
+
+        # Petit-enfant de meme datetime, uuid entre les deux : relu, le reste non.
+        # / Same-datetime grandchild, uuid in between: read, the rest is not.
+        petit_enfant = self._creation(uuid=UUID('00000000-0000-4000-8000-000000000001'), datetime=moment)
+        sortie = self._verify_chain()
+        self.assertIn("1 maillons verifies, 0 hash invalides, 0 forks, 0 trous", sortie)
+        self.assertNotIn("la tete de chaine ne pointe pas", sortie)
+        self.assertEqual(ChainCheckpoint.objects.get(asset=self.asset).transaction_id, petit_enfant.pk)
+
+    def test_workers_en_lecture_seule_meme_rapport_que_sequentiel(self):
+        """
+        --workers : chaque asset est verifie dans un processus, sur sa propre connexion
+        SQLite en lecture seule. Le rapport fusionne est identique au sequentiel.
+        / --workers: one process per asset, read-only connection, same merged report.
+        """
+        falsifiee = self._creation()
+        Transaction.objects.filter(pk=falsifiee.pk).update(amount=1)
+
+        # La base de test est en memoire : on la copie dans un fichier pour les workers.
+        # / The test DB is in memory: copy it to a file for the workers.
+        dossier = tempfile.mkdtemp()
+        nom_base = os.path.join(dossier, 'verify_chain.sqlite3')
+        with connection.cursor() as cursor:
+            cursor.execute("VACUUM INTO %s", [nom_base])
+
+        travaux = [(asset.pk, None) for asset in Asset.objects.all()]
+        self.assertGreater(len(travaux), 1)
+
+        rapports = verifie_en_parallele(travaux, 2, nom_base)
+        for asset_uuid, depuis in travaux:
+            self.assertEqual(rapports[asset_uuid], verifie_chaine_asset(asset_uuid, depuis))
+        self.assertEqual(rapports[self.asset.pk]['invalid_hashes'], [falsifiee.pk])
+        os.remove(nom_base)
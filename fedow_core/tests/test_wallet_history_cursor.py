@@ -0,0 +1,101 @@
+"""
+Historique d'un wallet pagine par curseur (datetime, uuid).
+/ Wallet history paginated by a (datetime, uuid) cursor.
+
+LOCALISATION : fedow_core/tests/test_wallet_history_cursor.py
+
+GET /transaction/paginated_list_by_wallet_signature/?pagination=cursor : chaque page
+est une lecture d'intervalle, sans OFFSET ni COUNT(*), et l'ancetre de fusion du
+wallet n'est resolu qu'une fois.
+"""
+
+from datetime import datetime
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+
+from fedow_core.models import Transaction, wallet_creator
+from fedow_core.tests.tests import FedowTestCase
+from fedow_core.utils import sign_message, get_private_key
+
+
+class WalletHistoryCursorTest(FedowTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.wallet, self.private_pem, self.public_pem = self.create_wallet_via_api()
+
+        self.card = self.create_card(user=self.wallet.user)
+        self.primary_card = self.create_primary_card()
+
+        self.asset = self.create_local_asset()
+
+    def _recharge(self, receiver, card, amount=100):
+        Transaction.objects.create(sender=self.place.wallet, receiver=self.place.wallet, asset=self.asset,
+                                   amount=amount, action=Transaction.CREATION, ip="127.0.0.1",
+                                   primary_card=self.primary_card)
+        return Transaction.objects.create(sender=self.place.wallet, receiver=receiver, asset=self.asset,
+                                          amount=amount, action=Transaction.REFILL, ip="127.0.0.1",
+                                          card=card, primary_card=self.primary_card)
+
+    def _get_historique(self, url):
+        date_iso = datetime.now().isoformat()
+        signature = sign_message(f"{self.wallet.uuid}:{date_iso}".encode('utf8'),
+                                 get_private_key(self.private_pem)).decode('utf-8')
+        return self.client.get(url, headers={
+            'Authorization': f'Api-Key {self.temp_key_place}',
+            'Wallet': str(self.wallet.uuid),
+            'Date': date_iso,
+            'Signature': signature,
+        })
+
+    def test_parcours_par_curseur(self):
+        recharges = [self._recharge(self.wallet, self.card) for _ in range(5)]
+        attendues = [f"{t.uuid}" for t in sorted(recharges, key=lambda t: (t.datetime, t.uuid), reverse=True)]
+
+        url = '/transaction/paginated_list_by_wallet_signature/?pagination=cursor&page_size=2'
+        lues, pages = [], 0
+        while url:
+            with CaptureQueriesContext(connection) as requetes:
+                response = self._get_historique(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.json())
+            sql_historique = [q['sql'] for q in requetes.captured_queries
+                              if 'FROM "fedow_core_transaction"' in q['sql']]
+            self.assertFalse(any('COUNT(' in sql or 'OFFSET' in sql for sql in sql_historique))
+            lues += [ligne['uuid'] for ligne in response.json()['results']]
+            url = response.json()['next']
+            pages += 1
+
+        self.assertEqual(pages, 3)
+        self.assertEqual(lues, attendues)
+
+    def test_curseur_invalide(self):
+        response = self._get_historique('/transaction/paginated_list_by_wallet_signature/?cursor=pas-un-curseur')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        # Sans curseur : pagination par numero de page, comme avant.
+        # / Without a cursor: page numbers, as before.
+        self._recharge(self.wallet, self.card)
+        response = self._get_historique('/transaction/paginated_list_by_wallet_signature/')
+        self.assertEqual(response.json()['count'], 1)
+
+    def test_ancetre_de_fusion(self):
+        # Carte anonyme rechargee, puis declaree : son wallet ephemere fusionne.
+        # / Anonymous card refilled, then claimed: its ephemeral wallet is merged.
+        wallet_ephemere = wallet_creator()
+        carte_anonyme = self.create_card(wallet_ephemere=wallet_ephemere)
+        recharge_anonyme = self._recharge(wallet_ephemere, carte_anonyme, amount=300)
+        Transaction.objects.create(sender=wallet_ephemere, receiver=self.wallet, asset=self.asset,
+                                   amount=300, action=Transaction.FUSION, ip="127.0.0.1",
+                                   card=carte_anonyme, primary_card=self.primary_card)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.wallet.lineage_ids(), [self.wallet.pk, wallet_ephemere.pk])
+
+        response = self._get_historique('/transaction/paginated_list_by_wallet_signature/?pagination=cursor')
+        uuids = [ligne['uuid'] for ligne in response.json()['results']]
+        self.assertEqual(len(uuids), 2)
+        self.assertIn(f"{recharge_anonyme.uuid}", uuids)
+        self.assertIsNone(response.json()['next'])
@@ -0,0 +1,62 @@
+"""
+Lignee des wallets fusionnes : WalletLineage.
+/ Lineage of fused wallets: WalletLineage.
+
+LOCALISATION : fedow_core/tests/test_wallet_lineage.py
+
+La branche FUSION de Transaction.save() inscrit l'ancetre ; la lignee couvre
+toutes les profondeurs et se lit en une requete.
+"""
+
+from fedow_core.models import Transaction, WalletLineage, wallet_creator
+from fedow_core.tests.tests import FedowTestCase
+
+
+class WalletLineageTest(FedowTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.wallet, self.private_pem, self.public_pem = self.create_wallet_via_api()
+        self.primary_card = self.create_primary_card()
+
+        self.asset = self.create_local_asset()
+
+    def test_fusion_inscrit_l_ancetre(self):
+        wallet_ephemere = wallet_creator()
+        carte_anonyme = self.create_card(wallet_ephemere=wallet_ephemere)
+        Transaction.objects.create(sender=self.place.wallet, receiver=self.place.wallet, asset=self.asset,
+                                   amount=300, action=Transaction.CREATION, ip="127.0.0.1",
+                                   primary_card=self.primary_card)
+        Transaction.objects.create(sender=self.place.wallet, receiver=wallet_ephemere, asset=self.asset,
+                                   amount=300, action=Transaction.REFILL, ip="127.0.0.1",
+                                   card=carte_anonyme, primary_card=self.primary_card)
+        Transaction.objects.create(sender=wallet_ephemere, receiver=self.wallet, asset=self.asset,
+                                   amount=300, action=Transaction.FUSION, ip="127.0.0.1",
+                                   card=carte_anonyme, primary_card=self.primary_card)
+
+        self.assertTrue(WalletLineage.objects.filter(wallet=self.wallet, ancestor=wallet_ephemere).exists())
+        with self.assertNumQueries(1):
+            self.assertEqual(self.wallet.lineage_ids(), [self.wallet.pk, wallet_ephemere.pk])
+        self.assertEqual(wallet_ephemere.lineage_ids(), [wallet_ephemere.pk])
+
+    def test_plusieurs_niveaux_dans_les_deux_ordres(self):
+        a, b, c = wallet_creator(), wallet_creator(), wallet_creator()
+        # a fusionne dans b, puis b dans c.
+        # / a merged into b, then b into c.
+        WalletLineage.link(b.pk, a.pk)
+        WalletLineage.link(c.pk, b.pk)
+        self.assertEqual(set(c.lineage_ids()), {a.pk, b.pk, c.pk})
+
+        # b fusionne dans c d'abord, puis a dans b : c herite quand meme de a.
+        # / b merged into c first, then a into b: c still inherits a.
+        d, e, f = wallet_creator(), wallet_creator(), wallet_creator()
+        WalletLineage.link(f.pk, e.pk)
+        WalletLineage.link(e.pk, d.pk)
+        self.assertEqual(set(f.lineage_ids()), {d.pk, e.pk, f.pk})
+
+    def test_lien_rejoue_sans_doublon(self):
+        a, b = wallet_creator(), wallet_creator()
+        WalletLineage.link(b.pk, a.pk)
+        WalletLineage.link(b.pk, a.pk)
+        WalletLineage.link(a.pk, a.pk)
+        self.assertEqual(WalletLineage.objects.filter(wallet__in=[a, b]).count(), 1)
@@ -0,0 +1,84 @@
+"""
+Photo des soldes d'un wallet en cache, perimee par version a chaque transaction.
+/ Cached wallet balance snapshot, expired by version on every transaction.
+
+LOCALISATION : fedow_core/tests/test_wallet_snapshot.py
+
+Un wallet inchange se relit sans base de donnees ; apres une vente ou une
+recharge, la photo d'avant n'est plus jamais servie.
+"""
+
+
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+
+from fedow_core.models import Transaction
+from fedow_core.serializers import wallet_snapshot
+from fedow_core.tests.tests import FedowTestCase
+
+
+class WalletSnapshotTest(FedowTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.wallet, self.private_pem, self.public_pem = self.create_wallet_via_api()
+
+        self.primary_card = self.create_primary_card()
+
+        self.asset = self.create_local_asset()
+
+    def _recharge(self, card, amount):
+        # Une recharge suit toujours une creation monetaire.
+        # / A refill always follows a money creation.
+        Transaction.objects.create(sender=self.place.wallet, receiver=self.place.wallet, asset=self.asset,
+                                   amount=amount, action=Transaction.CREATION, ip="127.0.0.1",
+                                   primary_card=self.primary_card)
+        return Transaction.objects.create(sender=self.place.wallet, receiver=self.wallet, asset=self.asset,
+                                          amount=amount, action=Transaction.REFILL, ip="127.0.0.1",
+                                          card=card, primary_card=self.primary_card)
+
+    def _valeur(self, data):
+        return next(t['value'] for t in data['tokens'] if t['asset']['uuid'] == str(self.asset.uuid))
+
+    def test_wallet_inchange_sans_base(self):
+        self._recharge(self.create_card(user=self.wallet.user), 1500)
+        premiere = wallet_snapshot(self.wallet.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(wallet_snapshot(self.wallet.pk), premiere)
+            self.assertEqual(wallet_snapshot(str(self.wallet.pk).upper()), premiere)
+
+        # Par l'API du cashless : aucune lecture des tokens au second appel.
+        # / Through the cashless API: no token read on the second call.
+        self._get_from_simulated_cashless(f'wallet/{self.wallet.pk}/')
+        with CaptureQueriesContext(connection) as requetes:
+            response = self._get_from_simulated_cashless(f'wallet/{self.wallet.pk}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self._valeur(response.json()), 1500)
+        self.assertFalse(any('fedow_core_token' in q['sql'] for q in requetes.captured_queries))
+
+    def test_transaction_perime_la_photo(self):
+        card = self.create_card(user=self.wallet.user)
+        self._recharge(card, 1500)
+        self.assertEqual(self._valeur(wallet_snapshot(self.wallet.pk)), 1500)
+
+        self._recharge(card, 1000)
+        self.assertEqual(self._valeur(wallet_snapshot(self.wallet.pk)), 2500)
+        # Le wallet du lieu aussi, des qu'il recoit une creation monetaire.
+        # / The place wallet too, as soon as it receives a money creation.
+        self.assertEqual(self._valeur(wallet_snapshot(self.place.wallet.pk)), 0)
+        Transaction.objects.create(sender=self.place.wallet, receiver=self.place.wallet, asset=self.asset,
+                                   amount=500, action=Transaction.CREATION, ip="127.0.0.1",
+                                   primary_card=self.primary_card)
+        self.assertEqual(self._valeur(wallet_snapshot(self.place.wallet.pk)), 500)
+
+    def test_carte_liee_perime_la_photo(self):
+        self.assertFalse(wallet_snapshot(self.wallet.pk)['has_user_card'])
+        card = self.create_card(user=self.wallet.user)
+        self.assertTrue(wallet_snapshot(self.wallet.pk)['has_user_card'])
+
+        card.user = None
+        card.save()
+        self.assertFalse(wallet_snapshot(self.wallet.pk)['has_user_card'])
@@ -0,0 +1,115 @@
+"""
+Outbox des webhooks Lespass : ecrite avec le maillon, livree en tache de fond.
+/ Lespass webhook outbox: written with the link, delivered in the background.
+
+LOCALISATION : fedow_core/tests/test_webhook_outbox.py
+
+Une adhesion LaBoutik (SUBSCRIBE) ne fait plus d'appel reseau pendant la requete.
+dispatch_webhooks livre, reessaie avec un delai croissant et n'abandonne jamais.
+"""
+
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import MagicMock, patch
+
+import requests
+from django.core.management import call_command
+from django.db import OperationalError
+from django.utils import timezone
+
+from fedow_core.management.commands.dispatch_webhooks import TIMEOUT_LIVRAISON, reserve_lot
+from fedow_core.models import Asset, Transaction, WebhookOutbox
+from fedow_core.tests.tests import FedowTestCase
+
+
+class WebhookOutboxTest(FedowTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.place.lespass_domain = "lespass.example.org"
+        self.place.save()
+        self.wallet, _private_pem, _public_pem = self.create_wallet_via_api()
+        self.primary_card = self.create_primary_card()
+
+        self.adhesion = self.create_local_asset(category=Asset.SUBSCRIPTION)
+
+    def _adhesion_laboutik(self):
+        return Transaction.objects.create(sender=self.place.wallet, receiver=self.wallet, asset=self.adhesion,
+                                          amount=1000, action=Transaction.SUBSCRIBE, ip="127.0.0.1",
+                                          primary_card=self.primary_card)
+
+    def _dispatch(self, session_get):
+        with patch.object(requests.Session, 'get', session_get):
+            call_command('dispatch_webhooks', '--once', stdout=StringIO())
+
+    def test_adhesion_ecrit_l_outbox_sans_appel_reseau(self):
+        with patch.object(requests.Session, 'request') as appel_reseau:
+            transaction = self._adhesion_laboutik()
+        appel_reseau.assert_not_called()
+
+        message = WebhookOutbox.objects.get(transaction=transaction)
+        self.assertEqual(message.url, f"https://lespass.example.org/fwh/membership/{transaction.uuid}")
+        self.assertIsNone(message.delivered_at)
+        self.assertEqual(message.attempts, 0)
+
+    def test_dispatcher_livre_une_seule_fois(self):
+        transaction = self._adhesion_laboutik()
+        session_get = MagicMock(return_value=MagicMock(status_code=200))
+        self._dispatch(session_get)
+
+        session_get.assert_called_once()
+        self.assertEqual(session_get.call_args.args[0], f"https://lespass.example.org/fwh/membership/{transaction.uuid}")
+        message = WebhookOutbox.objects.get(transaction=transaction)
+        self.assertIsNotNone(message.delivered_at)
+        self.assertEqual(message.attempts, 1)
+
+        session_get.reset_mock()
+        self._dispatch(session_get)
+        session_get.assert_not_called()
+
+    def test_echec_reessai_avec_delai_jamais_abandonne(self):
+        transaction = self._adhesion_laboutik()
+        en_echec = MagicMock(side_effect=requests.ConnectionError("Lespass injoignable"))
+        for tentative in range(1, 4):
+            WebhookOutbox.objects.filter(transaction=transaction).update(next_attempt_at=timezone.now())
+            avant = timezone.now()
+            self._dispatch(en_echec)
+            message = WebhookOutbox.objects.get(transaction=transaction)
+            self.assertEqual(message.attempts, tentative)
+            self.assertIsNone(message.delivered_at)
+            self.assertIn("Lespass injoignable", message.last_error)
+            # 30s, 60s, 120s : le delai double a chaque echec.
+            # / 30s, 60s, 120s: the delay doubles on each failure.
+            self.assertGreaterEqual(message.next_attempt_at, avant + timedelta(seconds=30 * 2 ** (tentative - 1)))
+
+        # Pas encore echue : ni reservee ni envoyee.
+        # / Not due yet: neither claimed nor sent.
+        self.assertEqual(reserve_lot(10), [])
+
+        WebhookOutbox.objects.filter(transaction=transaction).update(next_attempt_at=timezone.now())
+        self._dispatch(MagicMock(return_value=MagicMock(status_code=200)))
+        message = WebhookOutbox.objects.get(transaction=transaction)
+        self.assertIsNotNone(message.delivered_at)
+        self.assertIsNone(message.last_error)
+
+    def test_bail_couvre_le_pire_cas_du_lot(self):
+        # 50 envois qui expirent tous : le bail ne doit pas tomber avant la fin du lot.
+        # / 50 deliveries all timing out: the lease must outlast the batch.
+        transaction = self._adhesion_laboutik()
+        avant = timezone.now()
+        self.assertEqual(len(reserve_lot(50)), 1)
+        message = WebhookOutbox.objects.get(transaction=transaction)
+        self.assertGreater(message.next_attempt_at, avant + timedelta(seconds=50 * sum(TIMEOUT_LIVRAISON)))
+
+    def test_passe_en_erreur_ne_tue_pas_le_dispatcher(self):
+        # Base verrouillee pendant une passe : journalisee, puis la boucle reprend.
+        # / Database locked during one pass: logged, then the loop goes on.
+        passes = MagicMock(side_effect=[OperationalError("database is locked"), (1, 0), KeyboardInterrupt])
+        with patch('fedow_core.management.commands.dispatch_webhooks.une_passe', passes), \
+                patch('fedow_core.management.commands.dispatch_webhooks.time.sleep') as pause, \
+                patch('fedow_core.management.commands.dispatch_webhooks.logger.exception') as journal:
+            with self.assertRaises(KeyboardInterrupt):
+                call_command('dispatch_webhooks', stdout=StringIO())
+        self.assertEqual(passes.call_count, 3)
+        journal.assert_called_once()
+        pause.assert_called_once()
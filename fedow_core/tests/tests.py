@@ -109,6 +109,52 @@ class FedowTestCase(TransactionTestCase):
         wallet = Wallet.objects.get(pk=wallet_uuid)
         return wallet, private_pem, public_pem
 
+    def create_card(self, **kwargs) -> Card:
+        """
+        Carte NFC de la génération 1 du lieu de test. kwargs : user, wallet_ephemere...
+        / NFC card of the test place's first generation.
+        """
+        complete_tag_id_uuid = str(uuid4())
+        qrcode_uuid = str(uuid4())
+        return Card.objects.create(
+            complete_tag_id_uuid=complete_tag_id_uuid,
+            first_tag_id=f"{complete_tag_id_uuid.split('-')[0]}",
+            qrcode_uuid=qrcode_uuid,
+            number_printed=f"{qrcode_uuid.split('-')[0]}",
+            origin=Origin.objects.get_or_create(place=self.place, generation=1)[0],
+            **kwargs,
+        )
+
+    def create_primary_card(self) -> Card:
+        """
+        Carte primaire (carte de caisse) du lieu de test.
+        / Primary (cash register) card of the test place.
+        """
+        primary_card = self.create_card()
+        primary_card.primary_places.add(self.place)
+        return primary_card
+
+    def create_local_asset(self, category=Asset.TOKEN_LOCAL_FIAT, **kwargs) -> Asset:
+        """
+        Asset du lieu de test, nom et devise tirés par Faker.
+        / Asset of the test place, name and currency drawn by Faker.
+        """
+        faker = Faker()
+        champs = {
+            'name': faker.currency_name(),
+            'currency_code': faker.currency_code(),
+            'category': category,
+            'wallet_origin': self.place.wallet,
+        }
+        return Asset.objects.create(**{**champs, **kwargs})
+
+    def _pose_cle_cashless(self, place: Place):
+        # Save seulement si la clé change : chaque save de Place périme les photos en cache.
+        # / Save only when the key changes: every Place save expires the cached snapshots.
+        if place.cashless_rsa_pub_key != self.public_cashless_pem:
+            place.cashless_rsa_pub_key = self.public_cashless_pem
+            place.save()
+
     def _post_from_simulated_cashless(self, path, data: dict or list):
         # TODO: Une clé temp ne devrait pas pouvoir acceder au lieu
         key = self.temp_key_place
@@ -116,8 +162,7 @@ class FedowTestCase(TransactionTestCase):
         json_data = json.dumps(data)
 
         # On simule une paire de clé générée par le serveur cashless
-        place.cashless_rsa_pub_key = self.public_cashless_pem
-        place.save()
+        self._pose_cle_cashless(place)
         public_key = place.cashless_public_key()
 
         # Signature de la requete
@@ -150,8 +195,7 @@ class FedowTestCase(TransactionTestCase):
         ).decode('utf-8')
 
         # On simule une paire de clé générée par le serveur cashless
-        place.cashless_rsa_pub_key = self.public_cashless_pem
-        place.save()
+        self._pose_cle_cashless(place)
         public_key = place.cashless_public_key()
 
         # Ici, on s'auto vérifie :
@@ -1,6 +1,10 @@
 import base64
+import hashlib
 import json
 import logging
+import threading
+import time
+from collections import OrderedDict
 
 from cryptography.exceptions import InvalidSignature
 from cryptography.fernet import Fernet
@@ -147,6 +151,148 @@ def get_public_key(public_key_pem: str) -> rsa.RSAPublicKey | bool:
         raise e
 
 
+class PublicKeyCache:
+    """
+    Cache LRU, local au processus, des cles publiques RSA deja chargees.
+    Chaque requete signee (wallet ou place cashless) relisait le PEM : decodage
+    X.509 a chaque appel. La cle est indexee par proprietaire (uuid) et par
+    l'empreinte SHA256 du PEM : si le PEM change, l'empreinte change et la
+    cle est rechargee, l'ancienne est remplacee.
+    / Process-local LRU cache of loaded RSA public keys, keyed by owner uuid
+    and PEM fingerprint. A new PEM means a new fingerprint, hence a reload.
+
+    LOCALISATION : fedow_core/utils.py
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._cles = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def empreinte(public_key_pem: str) -> str:
+        return hashlib.sha256(public_key_pem.encode('utf-8')).hexdigest()
+
+    def get(self, owner: str, public_key_pem: str) -> rsa.RSAPublicKey | bool:
+        empreinte = self.empreinte(public_key_pem)
+        with self._lock:
+            en_cache = self._cles.get(owner)
+            if en_cache and en_cache[0] == empreinte:
+                self._cles.move_to_end(owner)
+                self.hits += 1
+                return en_cache[1]
+            self.misses += 1
+
+        # Decodage hors verrou : les autres threads ne l'attendent pas.
+        # / Decoding outside the lock: other threads do not wait on it.
+        public_key = get_public_key(public_key_pem)
+        if not public_key:
+            # Cle non RSA : rien a garder.
+            # / Not an RSA key: nothing to keep.
+            return public_key
+
+        with self._lock:
+            self._cles[owner] = (empreinte, public_key)
+            self._cles.move_to_end(owner)
+            while len(self._cles) > self.maxsize:
+                self._cles.popitem(last=False)
+        return public_key
+
+    def invalidate(self, owner: str, public_key_pem: str | None = None):
+        # Avec le PEM courant, on ne retire l'entree que si elle ne lui correspond plus.
+        # / With the current PEM, only drop the entry if it no longer matches it.
+        empreinte = self.empreinte(public_key_pem) if public_key_pem else None
+        with self._lock:
+            en_cache = self._cles.get(owner)
+            if en_cache and en_cache[0] != empreinte:
+                del self._cles[owner]
+
+    def clear(self):
+        with self._lock:
+            self._cles.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._cles),
+                'maxsize': self.maxsize,
+            }
+
+
+public_key_cache = PublicKeyCache(maxsize=getattr(settings, 'PUBLIC_KEY_CACHE_SIZE', 1024))
+
+
+class VerifiedSignatureCache:
+    """
+    Cache borne des signatures deja verifiees, avec expiration.
+    Un client qui interroge son solde renvoie la meme paire (message, signature)
+    tant que sa date ne change pas : inutile de refaire le calcul RSA-PSS.
+    L'empreinte couvre le PEM, le message et la signature : une autre cle ou
+    une autre signature ne tombe jamais sur une entree existante.
+    / Bounded, expiring cache of verified signature digests. A polling client
+    re-sends the same (message, signature): skip the RSA-PSS verify.
+
+    LOCALISATION : fedow_core/utils.py
+    """
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._expirations = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def empreinte(public_key_pem: str, message: bytes, signature: str) -> str:
+        digest = hashlib.sha256(public_key_pem.encode('utf-8'))
+        digest.update(b'\0' + message + b'\0' + signature.encode('utf-8'))
+        return digest.hexdigest()
+
+    def contains(self, empreinte: str) -> bool:
+        with self._lock:
+            expiration = self._expirations.get(empreinte)
+            if expiration and expiration > time.monotonic():
+                self.hits += 1
+                return True
+            if expiration:
+                del self._expirations[empreinte]
+            self.misses += 1
+            return False
+
+    def add(self, empreinte: str, ttl: float):
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._expirations[empreinte] = time.monotonic() + ttl
+            self._expirations.move_to_end(empreinte)
+            while len(self._expirations) > self.maxsize:
+                self._expirations.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._expirations.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._expirations),
+                'maxsize': self.maxsize,
+            }
+
+
+verified_signature_cache = VerifiedSignatureCache(maxsize=getattr(settings, 'VERIFIED_SIGNATURE_CACHE_SIZE', 4096))
+
+
 def sign_message(message: bytes = None,
                  private_key: rsa.RSAPrivateKey = None) -> bytes:
     # Signer le message
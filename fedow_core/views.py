@@ -1,8 +1,9 @@
+import csv
 import json
 import logging
 import re
-import time
-from datetime import timedelta, datetime
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from datetime import datetime
 from decimal import Decimal
 from io import StringIO
 from uuid import UUID
@@ -13,18 +14,20 @@ from django.core.cache import cache
 from django.core.management import call_command
 from django.core.serializers.json import DjangoJSONEncoder
 from django.core.signing import Signer
-from django.db import IntegrityError
-from django.db.models import Q
-from django.http import JsonResponse, Http404
+from django.db import IntegrityError, transaction as db_transaction
+from django.db.models import Q, Exists, OuterRef, F
+from django.http import JsonResponse, Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, render
 from django.utils import timezone
 from faker import Faker
 from rest_framework import viewsets, status, serializers
 from rest_framework.decorators import permission_classes, action
 from rest_framework.exceptions import ValidationError
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination, BasePagination
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.views import APIView
 
 from fedow_core.models import Transaction, Place, Configuration, Asset, CheckoutStripe, Token, Wallet, \
@@ -36,7 +39,8 @@ from fedow_core.serializers import TransactionSerializer, HandshakeValidator, \
     AssetCreateValidator, AssetSerializer, WalletSerializer, CardRefundOrVoidValidator, \
     FederationSerializer, BadgeCardValidator, WalletGetOrCreate, LinkWalletCardQrCode, OriginSerializer, \
     CachedTransactionSerializer, TransactionQrCodeSerializer, TransactionRefilFromLespassSerializer, \
-    LinkWalletCard_card_number, TransactionSimpleSerializer
+    LinkWalletCard_card_number, TransactionSimpleSerializer, TransactionBatchW2W, wallet_snapshot, \
+    TransactionListSerializer
 from fedow_core.utils import fernet_encrypt, dict_to_b64_utf8, utf8_b64_to_dict, b64_to_data, get_request_ip, \
     get_public_key, rsa_encrypt_string, verify_signature, data_to_b64
 from fedow_core.validators import PlaceValidator, FederationAddValidator, LocalAssetBankDepositValidator
@@ -67,6 +71,81 @@ class StandardResultsSetPagination(PageNumberPagination):
     max_page_size = 100
 
 
+class KeysetPagination(BasePagination):
+    """
+    Pagination par curseur sur (datetime, uuid), du plus récent au plus ancien.
+    Chaque page est une lecture d'intervalle sur un index (datetime, ...) : pas
+    d'OFFSET qui relit les pages précédentes, pas de COUNT(*) de tout l'historique.
+    Plusieurs branches (ex : sender puis receiver, au lieu d'un OR) sont lues
+    chacune dans son index puis fusionnées.
+    / Cursor pagination on (datetime, uuid), newest first: index range reads, no
+    OFFSET, no COUNT(*). Several branches are read separately then merged.
+
+    LOCALISATION : fedow_core/views.py
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.paginate_branches([queryset], request)
+
+    def paginate_branches(self, querysets, request):
+        self.request = request
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            page_size = self.page_size
+        page_size = max(1, min(page_size, self.max_page_size))
+        position = self.decode_cursor(request.query_params.get(self.cursor_query_param))
+
+        lignes = {}
+        for queryset in querysets:
+            for ligne in self.branch_page(queryset, position, page_size):
+                lignes[ligne.uuid] = ligne
+
+        ordonnees = sorted(lignes.values(), key=lambda ligne: (ligne.datetime, ligne.uuid), reverse=True)
+        page = ordonnees[:page_size]
+        self.next_position = (page[-1].datetime, page[-1].uuid) if len(ordonnees) > page_size else None
+        return page
+
+    @staticmethod
+    def branch_page(queryset, position, page_size):
+        # Une branche apres le curseur, bornee a page_size + 1 lignes (la derniere dit s'il y a une suite).
+        # / One branch after the cursor, bounded to page_size + 1 rows (the extra one tells if more follow).
+        queryset = queryset.order_by('-datetime', '-uuid')
+        if position:
+            datetime_curseur, uuid_curseur = position
+            queryset = queryset.filter(Q(datetime__lt=datetime_curseur)
+                                       | Q(datetime=datetime_curseur, uuid__lt=uuid_curseur))
+        return queryset[:page_size + 1]
+
+    @staticmethod
+    def encode_cursor(position) -> str:
+        datetime_curseur, uuid_curseur = position
+        return urlsafe_b64encode(f"{datetime_curseur.isoformat()}|{uuid_curseur}".encode('utf8')).decode('utf8')
+
+    @staticmethod
+    def decode_cursor(cursor: str):
+        if not cursor:
+            return None
+        try:
+            datetime_curseur, uuid_curseur = urlsafe_b64decode(cursor.encode('utf8')).decode('utf8').split('|')
+            return datetime.fromisoformat(datetime_curseur), UUID(uuid_curseur)
+        except (ValueError, UnicodeDecodeError):
+            raise NotFound("Invalid cursor")
+
+    def get_next_link(self):
+        if not self.next_position:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param,
+                                   self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+
 # Create your views here.
 class TestApiKey(viewsets.ViewSet):
     def list(self, request):
@@ -377,8 +456,18 @@ class CardAPI(viewsets.ViewSet):
 
     def retrieve(self, request, pk=None):
         # Utilisé par les serveurs cashless comme un check card
+        # A chaque badge NFC : carte, wallet, lieu d'origine et carte primaire du lieu
+        # en une requête ; les tokens sont chargés en bloc par WalletSerializer.
+        # / On every NFC tap: card, wallet, origin place and the place primary flag in
+        # one query; tokens are bulk-loaded by WalletSerializer.
         try:
-            card = Card.objects.get(first_tag_id=pk)
+            card = (Card.objects
+                    .select_related('origin__place',
+                                    'user__wallet__place', 'user__wallet__primary',
+                                    'wallet_ephemere__place', 'wallet_ephemere__primary')
+                    .annotate(is_primary_for_place=Exists(
+                        Card.primary_places.through.objects.filter(card=OuterRef('pk'), place=request.place)))
+                    .get(first_tag_id=pk))
             serializer = CardSerializer(card, context={'request': request})
 
             logger.info(f"\nCHECK CARTE N° {card.number_printed} - TagId {card.first_tag_id}")
@@ -434,8 +523,7 @@ class WalletAPI(viewsets.ViewSet):
     def retrieve_by_signature(self, request):
         # La méthode d'auth diffère d'un retrive standard et donne le wallet plutot que le place
         wallet: Wallet = request.wallet
-        serializer = WalletSerializer(wallet, context={'request': request})
-        return Response(serializer.data)
+        return Response(wallet_snapshot(wallet.pk, context={'request': request}, wallet=wallet))
 
     @action(detail=False, methods=['POST'])
     def local_asset_bank_deposit(self, request):
@@ -556,6 +644,7 @@ class WalletAPI(viewsets.ViewSet):
         1. Récupère le wallet depuis la requête
         2. Vérifie s'il y a de l'argent à rembourser
         3. Trouve les paiements Stripe qui peuvent être remboursés via les transaction de type REFILL
+           (montants payés / remboursés lus en base, sans appel Stripe)
         4. Effectue le remboursement via Stripe
         5. Crée une transaction de remboursement
         6. Retourne le wallet mis à jour
@@ -577,57 +666,28 @@ class WalletAPI(viewsets.ViewSet):
                 return Response("Rien à rembourser", status=status.HTTP_200_OK)
 
             # Récupération des transactions du wallet
-            transactions = Transaction.objects.filter(Q(sender=wallet) | Q(receiver=wallet))
-            # On va récupérer aussi les transactions pour afficher ceux avant une éventuelle fusion
-            if transactions.filter(action=Transaction.FUSION).exists():
-                ex_wallet = transactions.filter(action=Transaction.FUSION).last().sender
-                transactions = Transaction.objects.filter(Q(sender=wallet) | Q(receiver=wallet) |
-                                                          Q(sender=ex_wallet) | Q(receiver=ex_wallet))
-
+            # On va récupérer aussi les transactions d'avant les fusions (toute la lignée)
+            # / Include the transactions made before any fusion (whole lineage)
+            wallet_ids = wallet.lineage_ids()
+            transactions = Transaction.wallet_history(wallet_ids)
+
+            # Paiements Stripe encore remboursables, du plus récent au plus ancien.
+            # Montants lus en base (amount_paid / amount_refunded) : une seule requête, aucun appel Stripe.
+            # / Still refundable Stripe payments, newest first: one query, no Stripe call.
             refill_transaction = transactions.filter(
                 action=Transaction.REFILL,
-                asset__category=Asset.STRIPE_FED_FIAT
-            ).order_by('-datetime')
-            # Recherche des paiements Stripe du plus récent au plus ancien
-            checkouts = [transaction.checkout_stripe for transaction in refill_transaction if
-                         transaction.checkout_stripe.status in [CheckoutStripe.PAID, CheckoutStripe.WALLET_USER_OK]]
+                asset__category=Asset.STRIPE_FED_FIAT,
+                checkout_stripe__status__in=CheckoutStripe.REFUNDABLE,
+                checkout_stripe__amount_paid__gt=F('checkout_stripe__amount_refunded'),
+            ).select_related('checkout_stripe').order_by('-datetime')
+            checkouts = [transaction.checkout_stripe for transaction in refill_transaction]
 
             # Le wallet primaire qui sera le receiver :
             config = Configuration.get_solo()
             primary_wallet = config.primary_wallet
 
             # Dictionnaire des paiements à rembourser {checkout: montant}
-            checkouts_db = {}
-
-            # Check si le refund peut être fait par un seul remboursement :
-            rest_to_refund = to_refund
-
-            for checkout in checkouts:
-                try:
-                    payment_intent = checkout.get_intent_payment()
-                    refill = payment_intent.amount
-
-                    if refill >= to_refund:
-                        # Checkout trouvé ! On utilise celui-ci pour rembourser. 
-                        # Si d'autres ont été ajoutés avant, on les écrase, celui-ci suffit.
-                        checkouts_db = {checkout: to_refund}
-                        break
-                    else:
-                        # La recharge en ligne est inférieure à ce qu'il faut rembourser, 
-                        # on l'ajoute dans la liste des transactions à rembourser.
-                        logger.info(f"Checkout refill {refill}, rest : {rest_to_refund}")
-                        checkouts_db[checkout] = refill if refill < rest_to_refund else rest_to_refund
-                        rest_to_refund -= refill if refill < rest_to_refund else rest_to_refund
-                        if rest_to_refund == 0:
-                            # On a suffisamment pour rembourser
-                            logger.info(f"Montant restant à rembourser : {rest_to_refund}")
-                            break
-                        elif rest_to_refund < 0:
-                            logger.error(f"Erreur de calcul, montant négatif : {rest_to_refund}")
-                            raise ValueError(f"Erreur de calcul, montant négatif : {rest_to_refund}")
-                except Exception as e:
-                    logger.error(f"Erreur lors de la récupération du checkout Stripe {checkout.uuid}: {e}")
-                    continue
+            checkouts_db = CheckoutStripe.refund_plan(checkouts, to_refund)
 
             if not checkouts_db:
                 logger.error(f"Pas de paiement Stripe trouvé pour le wallet {wallet.uuid}")
@@ -640,11 +700,14 @@ class WalletAPI(viewsets.ViewSet):
             for checkout, value in checkouts_db.items():
                 try:
                     # Effectue le remboursement via Stripe, avec une cle d'idempotence
-                    # par (checkout, montant) : un double-clic / une requete rejouee
-                    # ne rembourse pas deux fois le meme paiement.
-                    # / Stripe refund with a per-(checkout, amount) idempotency key.
+                    # par (checkout, deja rembourse, montant). amount_refunded n'avance qu'avec
+                    # la transaction REFUND (meme bloc atomique) : un double-clic, une requete
+                    # rejouee ou un nouvel essai apres l'echec du maillon retombent sur le meme
+                    # remboursement Stripe ; un remboursement partiel ulterieur du meme montant passe.
+                    # / Stripe refund keyed on (checkout, already refunded, amount); amount_refunded
+                    # only moves with the REFUND transaction, so retries collapse into one refund.
                     refund = checkout.refund_payment_intent(
-                        value, idempotency_key=f"refund:{checkout.uuid}:{value}"
+                        value, idempotency_key=f"refund:{checkout.uuid}:{checkout.amount_refunded}:{value}"
                     )
                     if not refund.status == 'succeeded':
                         logger.error(f"Remboursement échoué : {refund}")
@@ -663,7 +726,9 @@ class WalletAPI(viewsets.ViewSet):
                         "card": None,
                         "subscription_start_datetime": None
                     }
-                    transaction = Transaction.objects.create(**transaction_dict)
+                    with db_transaction.atomic():
+                        transaction = Transaction.objects.create(**transaction_dict)
+                        checkout.record_refund(value)
                     logger.info(f"Transaction de remboursement créée: {transaction.uuid}")
 
                 except Exception as e:
@@ -757,19 +822,16 @@ class WalletAPI(viewsets.ViewSet):
         checkout_db = get_object_or_404(CheckoutStripe, pk=pk)
         logger.warning(f"WEBHOOK GET: {checkout_db.status}")
 
-        # On attend un peu, la vérification est déja en cours par le webhook POST
-        now = timezone.now()
-        while checkout_db.status == CheckoutStripe.PROGRESS \
-                and timezone.now() - now < timedelta(seconds=10):
-            time.sleep(1)
-            logger.info('checkout db in progress. Waiting for POST ?')
-            checkout_db.refresh_from_db()
-
         if checkout_db.status != CheckoutStripe.PAID:
-            # On lance la validation au cas ou le webhook stripe POST ne s'est pas fait
+            # On lance la validation au cas ou le webhook stripe POST ne s'est pas fait.
+            # Si le webhook POST la tient déjà, on ne l'attend pas : 202, Lespass redemande.
+            # / Validate in case the Stripe webhook did not; never wait for it: 202.
             try:
                 checkout_db = StripeAPI.validate_stripe_checkout_and_make_transaction(
                     checkout_db, request)
+            except CheckoutAlreadyClaimed:
+                if checkout_db.status == CheckoutStripe.PROGRESS:
+                    return Response("Checkout Stripe in progress", status=status.HTTP_202_ACCEPTED)
             except ValueError as e:
                 return Response(f"Error validate_stripe_checkout_and_make_transaction : {e}",
                                 status=status.HTTP_400_BAD_REQUEST)
@@ -842,8 +904,9 @@ class WalletAPI(viewsets.ViewSet):
     ### END ROUTE LESPAS
 
     def retrieve(self, request, pk=None):
-        serializer = WalletSerializer(Wallet.objects.get(pk=pk), context={'request': request})
-        return Response(serializer.data)
+        # Photo en cache : un wallet inchangé ne touche pas la base.
+        # / Cached snapshot: an unchanged wallet does not hit the database.
+        return Response(wallet_snapshot(pk, context={'request': request}))
 
     # def create(self, request):
     #     wallet_create_serializer = WalletCreateSerializer(data=request.data, context={'request': request})
@@ -1067,9 +1130,8 @@ class PlaceAPI(viewsets.ViewSet):
 
             # Que tu sois test ou flush, on t'ajoute
             fed_test.places.add(place)
-            # Save pour faire le clear cache
-            fed_test.save()
-            cache.clear()
+            # L'index des federations est perime par m2m_changed (signals.py).
+            # / The federation index is expired by m2m_changed (signals.py).
 
             # accepted_assets = request.place.accepted_assets()
             # serializers = AssetSerializer(accepted_assets, many=True, context={'request': request})
@@ -1090,6 +1152,13 @@ class PlaceAPI(viewsets.ViewSet):
 
 
 # TODO : mettre tout les appel et retour vers stripe dans un view set pour faire une vrai API Stripe X TiBillet
+class CheckoutAlreadyClaimed(ValidationError):
+    """
+    Le checkout est déjà pris par une autre livraison (PROGRESS) ou déjà conclu.
+    / The checkout is already claimed by another delivery, or already concluded.
+    """
+
+
 class StripeAPI(viewsets.ViewSet):
 
     @staticmethod
@@ -1144,6 +1213,10 @@ class StripeAPI(viewsets.ViewSet):
             status=CheckoutStripe.PAID,
             user=wallet.user if hasattr(wallet, 'user') else None,
             # si le wallet a un user
+            # Montant encaissé et payment intent gardés localement pour les remboursements.
+            # / Amount received and payment intent kept locally for refunds.
+            amount_paid=int(stripe_payment['amount_received']),
+            intent_payment_id_stripe=payment_intent_stripe_id,
         )
 
         tr_data = {
@@ -1171,10 +1244,21 @@ class StripeAPI(viewsets.ViewSet):
 
     @staticmethod
     def validate_stripe_checkout_and_make_transaction(checkout_db: CheckoutStripe, request):
-        checkout_db.status = CheckoutStripe.PROGRESS
-        checkout_db.save()
+        # Prise atomique du checkout : une seule livraison (webhook POST ou retour GET) valide.
+        # / Atomic claim: a single delivery (webhook POST or return GET) validates.
+        if not checkout_db.claim():
+            raise CheckoutAlreadyClaimed(f"Checkout {checkout_db.uuid} : {checkout_db.get_status_display()}")
         logger.info(
             f" >>----VALIDATOR---->> StripeAPI : validate_stripe_checkout_and_make_transaction : {checkout_db.status}")
+        try:
+            return StripeAPI._validate_claimed_checkout(checkout_db, request)
+        finally:
+            # Ni PAID ni ERROR (pas encore payé, erreur passagère) : on rend la main.
+            # / Neither PAID nor ERROR: hand the checkout back.
+            checkout_db.release()
+
+    @staticmethod
+    def _validate_claimed_checkout(checkout_db: CheckoutStripe, request):
         # Récupération de l'objet checkout chez Stripe
         # En allant chercher directement sur le serveur de stripe, on s'assure de la véracité du checktou
         config = Configuration.get_solo()
@@ -1239,18 +1323,30 @@ class StripeAPI(viewsets.ViewSet):
                 # dans le cas d'une recharge par user / wallet sans carte depuis le front billetterie
                 tr_data['user_card_uuid'] = f'{card.uuid}'
 
+            # Montant et payment intent gardes localement pour les remboursements.
+            # / Amount and payment intent kept locally for refunds.
+            paye = {
+                'amount_paid': int(checkout.amount_total),
+                'intent_payment_id_stripe': getattr(checkout, 'payment_intent', None),
+            }
+
             transaction_validator = TransactionW2W(data=tr_data, context={'request': request})
             if not transaction_validator.is_valid():
+                # Recharge deja ecrite pour ce checkout (worker precedent mort avant de
+                # conclure) : le wallet est credite, on conclut PAID et non ERROR.
+                # / Refill already written for this checkout: the wallet is credited, close as PAID.
+                if Transaction.objects.filter(checkout_stripe=checkout_db, action=Transaction.REFILL).exists():
+                    checkout_db.conclude(CheckoutStripe.PAID, **paye)
+                    return checkout_db
                 logger.error(f"TransactionW2W serializer ERROR : {transaction_validator.errors}")
-                # Update checkout status
-                checkout_db.status = CheckoutStripe.ERROR
-                checkout_db.save()
+                # Ecritures conditionnelles : jamais de save() complet depuis une instance
+                # peut-etre perimee (claim repris par un autre worker entre-temps).
+                # / Conditional writes: never a full save() from a possibly stale instance.
+                checkout_db.conclude(CheckoutStripe.ERROR)
                 raise ValidationError(f"TransactionW2W serializer ERROR : {transaction_validator.errors}")
 
-            # Update checkout status
-            checkout_db.status = CheckoutStripe.PAID
-            # TODO: passer en VALID pour eviter double chargement !!!!!
-            checkout_db.save()
+            if not checkout_db.conclude(CheckoutStripe.PAID, **paye):
+                logger.warning(f"Checkout {checkout_db.uuid} repris par un autre worker : statut {checkout_db.status}")
 
         return checkout_db
 
@@ -1439,19 +1535,18 @@ class WebhookStripe(APIView):
 
             checkout_db = get_object_or_404(CheckoutStripe, checkout_session_id_stripe=checkout_session_id_stripe)
             logger.warning(f"Webhook POST : {checkout_db.status}")
-            # On attend un peu, la vérification est déja en cours par le webhook POST
-            now = timezone.now()
-            while checkout_db.status == CheckoutStripe.PROGRESS \
-                    and timezone.now() - now < timedelta(seconds=10):
-                time.sleep(1)
-                logger.info('checkout db in progress. Waiting for GET ?')
-                checkout_db.refresh_from_db()
 
             if checkout_db.status != CheckoutStripe.PAID:
 
                 try:
                     checkout_db = StripeAPI.validate_stripe_checkout_and_make_transaction(
                         checkout_db, request)
+                except CheckoutAlreadyClaimed:
+                    # Le retour GET valide déjà ce checkout : pas d'attente, 202.
+                    # / The return GET is already validating it: no waiting, 202.
+                    if checkout_db.status == CheckoutStripe.PROGRESS:
+                        logger.info(f"WebhookStripe 202 checkout {checkout_db.uuid} in progress")
+                        return Response("En cours", status=status.HTTP_202_ACCEPTED)
                 except ValueError as e:
                     return Response(f"Error validate_stripe_checkout_and_make_transaction : {e}",
                                     status=status.HTTP_400_BAD_REQUEST)
@@ -1490,9 +1585,6 @@ class Onboard_stripe_return(APIView):
                 place.stripe_connect_valid = True
                 place.save()
 
-                # Mise à jour du cache avec la monnaie fédérée
-                place.federated_with()
-
                 # Envoie des infos de la monnaie fédéré
                 config = Configuration.get_solo()
                 primary_wallet = config.primary_wallet
@@ -1515,6 +1607,72 @@ class Onboard_stripe_return(APIView):
 """
 
 
+# Colonnes de l'export en flux de list_by_asset : projection values(), sans instance
+# de modele ni serializer. sender_name / receiver_name suivent Wallet.get_name().
+# / Streaming export columns of list_by_asset: values() projection, no model instance.
+EXPORT_FIELDS = (
+    'uuid', 'datetime', 'action', 'amount', 'asset', 'sender', 'receiver',
+    'sender_name', 'receiver_name', 'card', 'primary_card', 'comment', 'metadata',
+    'subscription_start_datetime', 'hash', 'previous_transaction',
+)
+
+
+def _nom_du_wallet(uuid, name, place_name, primary_pk) -> str:
+    # Meme regle que Wallet.get_name(), a partir des colonnes jointes.
+    # / Same rule as Wallet.get_name(), from the joined columns.
+    if name:
+        return name
+    if place_name:
+        return place_name
+    if primary_pk:
+        return "Primary"
+    return f"{str(uuid)[:8]}"
+
+
+def export_transactions(transactions):
+    """
+    Lignes de l'export, lues par paquets de EXPORT_CHUNK_SIZE avec .iterator() :
+    la memoire reste la meme quelle que soit la periode demandee.
+    / Export rows read in chunks with .iterator(): flat memory whatever the range.
+
+    LOCALISATION : fedow_core/views.py
+    """
+    colonnes = transactions.values(
+        'uuid', 'datetime', 'action', 'amount', 'asset', 'sender', 'receiver', 'card', 'primary_card',
+        'comment', 'metadata', 'subscription_start_datetime', 'hash', 'previous_transaction',
+        'sender__name', 'sender__place__name', 'sender__primary__pk',
+        'receiver__name', 'receiver__place__name', 'receiver__primary__pk',
+    )
+    for ligne in colonnes.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE):
+        ligne['sender_name'] = _nom_du_wallet(ligne['sender'], ligne.pop('sender__name'),
+                                              ligne.pop('sender__place__name'), ligne.pop('sender__primary__pk'))
+        ligne['receiver_name'] = _nom_du_wallet(ligne['receiver'], ligne.pop('receiver__name'),
+                                                ligne.pop('receiver__place__name'), ligne.pop('receiver__primary__pk'))
+        yield ligne
+
+
+class _Echo:
+    # Tampon minimal pour csv.writer : renvoie la ligne au lieu de l'ecrire.
+    # / Minimal csv.writer buffer: returns the line instead of storing it.
+    def write(self, value):
+        return value
+
+
+def stream_ndjson(lignes):
+    for ligne in lignes:
+        yield json.dumps({champ: ligne[champ] for champ in EXPORT_FIELDS}, cls=DjangoJSONEncoder) + "\n"
+
+
+def stream_csv(lignes):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for ligne in lignes:
+        yield writer.writerow([
+            json.dumps(ligne[champ], cls=DjangoJSONEncoder) if champ == 'metadata' else ligne[champ]
+            for champ in EXPORT_FIELDS
+        ])
+
+
 class TransactionAPI(viewsets.ViewSet):
     """
     GET /transaction/ : liste des transactions
@@ -1530,6 +1688,9 @@ class TransactionAPI(viewsets.ViewSet):
             asset_uuid = serializers.UUIDField()
             start_date = serializers.DateTimeField()
             end_date = serializers.DateTimeField()
+            # Export en flux (ndjson / csv) au lieu d'une liste JSON en mémoire.
+            # / Streaming export (ndjson / csv) instead of an in-memory JSON list.
+            stream = serializers.ChoiceField(choices=['ndjson', 'csv'], required=False)
 
         validator = Validator(data=request.data)
         if not validator.is_valid():
@@ -1538,19 +1699,23 @@ class TransactionAPI(viewsets.ViewSet):
         asset: Asset = get_object_or_404(Asset, uuid=validator.validated_data.get('asset_uuid'))
 
         # Si place est à l'origine de l'asset, on peut afficher TOUTES les transactions
-        transactions = Transaction.objects.filter(
-            asset=asset,
-            datetime__gte=validator.validated_data.get('start_date'),
-            datetime__lte=validator.validated_data.get('end_date')
-        ).exclude(action=Transaction.CREATION).order_by('-datetime')
-
-        if asset.wallet_origin != place.wallet:
-            # Si place est juste fédéré à l'asset, on envoie que les transactions qu'il a encaissé
-            wallet = place.wallet
-            transactions = transactions.filter(
-                Q(sender=wallet) | Q(receiver=wallet)
-            )
+        # Si place est juste fédéré à l'asset, on envoie que les transactions qu'il a encaissé
+        transactions = Transaction.asset_period(
+            asset,
+            validator.validated_data.get('start_date'),
+            validator.validated_data.get('end_date'),
+            wallet=None if asset.wallet_origin == place.wallet else place.wallet,
+        )
 
+        stream = validator.validated_data.get('stream')
+        if stream == 'ndjson':
+            return StreamingHttpResponse(stream_ndjson(export_transactions(transactions)),
+                                         content_type='application/x-ndjson')
+        if stream == 'csv':
+            response = StreamingHttpResponse(stream_csv(export_transactions(transactions)),
+                                             content_type='text/csv')
+            response['Content-Disposition'] = f'attachment; filename="transactions_{asset.uuid}.csv"'
+            return response
 
         serializer = TransactionSimpleSerializer(transactions, many=True, context={
             'request': request,
@@ -1561,17 +1726,22 @@ class TransactionAPI(viewsets.ViewSet):
     def paginated_list_by_wallet_signature(self, request):
         wallet = request.wallet
         # wallet = sender OR receiver
-        transactions = Transaction.objects.filter(Q(sender=wallet) | Q(receiver=wallet))
-
         # On va récupérer aussi les transactions pour afficher ceux avant une éventuelle fusion
-        if transactions.filter(action=Transaction.FUSION).exists():
-            ex_wallet = transactions.filter(action=Transaction.FUSION).last().sender
-            transactions = Transaction.objects.filter(Q(sender=wallet) | Q(receiver=wallet) |
-                                                      Q(sender=ex_wallet) | Q(receiver=ex_wallet))
-
-        # Apply pagination
-        paginator = StandardResultsSetPagination()
-        page = paginator.paginate_queryset(transactions, request)
+        # Toute la lignée (WalletLineage), résolue une seule fois pour la requête.
+        # / The whole lineage, resolved once per request.
+        wallet_ids = wallet.lineage_ids()
+
+        # ?cursor=... (ou ?pagination=cursor pour la première page) : pagination par
+        # curseur, une branche par index (sender, datetime) / (receiver, datetime).
+        # Sinon, pagination par numéro de page (compatibilité).
+        # / Cursor mode: one branch per index, no OR and no COUNT(*). Otherwise page numbers.
+        if 'cursor' in request.query_params or request.query_params.get('pagination') == 'cursor':
+            paginator = KeysetPagination()
+            page = paginator.paginate_branches(Transaction.wallet_history_branches(wallet_ids), request)
+        else:
+            transactions = Transaction.wallet_history(wallet_ids)
+            paginator = StandardResultsSetPagination()
+            page = paginator.paginate_queryset(transactions, request)
 
         # On fabrique un sérializer avec moins d'info que le complet
         # pour l'affichage de la liste des transactions.
@@ -1599,8 +1769,62 @@ class TransactionAPI(viewsets.ViewSet):
         return Response(validator.errors, status=status.HTTP_400_BAD_REQUEST)
 
     def list(self, request):
-        serializer = TransactionSerializer(Transaction.objects.all(), many=True, context={'request': request})
-        return Response(serializer.data)
+        """
+        Liste filtrée et paginée par curseur (KeysetPagination) : coût borné par page.
+        Filtres : asset, wallet (émetteur OU receveur), action, start_date, end_date.
+        fields=uuid,amount,... limite les champs, verify_hash=true recalcule les hash.
+        / Filtered, cursor-paginated list: bounded cost per call.
+
+        LOCALISATION : fedow_core/views.py
+        """
+
+        class Validator(serializers.Serializer):
+            asset = serializers.UUIDField(required=False)
+            wallet = serializers.UUIDField(required=False)
+            action = serializers.ChoiceField(choices=Transaction.TYPE_ACTION, required=False)
+            start_date = serializers.DateTimeField(required=False)
+            end_date = serializers.DateTimeField(required=False)
+            fields = serializers.CharField(required=False)
+            verify_hash = serializers.BooleanField(default=False)
+
+        validator = Validator(data=request.query_params)
+        if not validator.is_valid():
+            return Response(f"Error : {validator.errors}", status=status.HTTP_400_BAD_REQUEST)
+        data = validator.validated_data
+
+        transactions = Transaction.objects.select_related(
+            'sender__place', 'sender__primary', 'receiver__place', 'receiver__primary', 'asset')
+        if data['verify_hash']:
+            # dict_for_hash lit le hash du parent et la session Stripe.
+            # / dict_for_hash reads the parent hash and the Stripe session.
+            transactions = transactions.select_related('previous_transaction', 'checkout_stripe')
+        if data.get('asset'):
+            transactions = transactions.filter(asset=data['asset'])
+        if data.get('action'):
+            transactions = transactions.filter(action=data['action'])
+        if data.get('start_date'):
+            transactions = transactions.filter(datetime__gte=data['start_date'])
+        if data.get('end_date'):
+            transactions = transactions.filter(datetime__lte=data['end_date'])
+
+        paginator = KeysetPagination()
+        if data.get('wallet'):
+            # Une branche par index (sender, datetime) / (receiver, datetime), comme l'historique.
+            # / One branch per index, like the wallet history.
+            page = paginator.paginate_branches([
+                transactions.filter(sender=data['wallet']),
+                transactions.filter(receiver=data['wallet']),
+            ], request)
+        else:
+            page = paginator.paginate_queryset(transactions, request)
+
+        fields = [champ.strip() for champ in data['fields'].split(',')] if data.get('fields') else None
+        serializer = TransactionListSerializer(page, many=True, context={
+            'request': request,
+            'verify_hash': data['verify_hash'],
+            'fields': fields,
+        })
+        return paginator.get_paginated_response(serializer.data)
 
     def retrieve(self, request, pk):
         transaction = get_object_or_404(Transaction, uuid=pk)
@@ -1624,6 +1848,22 @@ class TransactionAPI(viewsets.ViewSet):
         logger.error(f"{timezone.localtime()} ERROR - Transaction create error : {transaction_validator.errors}")
         return Response(transaction_validator.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['POST'])
+    def batch(self, request):
+        # Lot de ventes / recharges d'un serveur cashless : une signature, une ecriture.
+        # 201 : resultat par ligne (created / already_done).
+        # 400 : resultat par ligne (error / not_applied), rien n'est ecrit.
+        # / Cashless batch: one signature, one write. Per line results.
+        batch_validator = TransactionBatchW2W(data=request.data, context={'request': request})
+        if batch_validator.is_valid():
+            return Response(batch_validator.results, status=status.HTTP_201_CREATED)
+
+        logger.error(f"{timezone.localtime()} ERROR - Transaction batch error : {batch_validator.errors}")
+        # Detail ligne par ligne si le lot a ete examine, sinon l'erreur de forme.
+        # / Per line detail if the batch was examined, otherwise the shape error.
+        return Response(getattr(batch_validator, 'results', None) or batch_validator.errors,
+                        status=status.HTTP_400_BAD_REQUEST)
+
     @action(detail=False, methods=['POST'])
     def refill_from_lespass_to_user_wallet(self, request):
         # Méthode réclamée lorsqu'un produit permet de recharger un wallet
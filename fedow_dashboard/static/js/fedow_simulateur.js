@@ -5,7 +5,11 @@
  * LOCALISATION : fedow_dashboard/static/js/fedow_simulateur.js
  *
  * Sources injectees par le template :
- *  #data-monnaie-fondante : wallets_dormants, depense_totale, currency_code, nb_vides, total_charge.
+ *  #data-monnaie-fondante : dormance {nb_wallets, solde_total, solde_median, breakage[5],
+ *                           par_seuil [{mois, nb_actifs, solde_actifs, median_actifs,
+ *                           nb_inactifs, volume_inactif, median_inactifs}]} (resume calcule
+ *                           cote serveur, taille fixe), depense_totale, currency_code, nb_vides,
+ *                           total_charge.
  *  #data-courbe-survie    : survie [{age_mois, part_restante}],
  *                           stock_par_age [{age_mois, montant_centimes, nb_cartes}],
  *                           refill_par_age [{age_mois, montant_centimes}] (recharge totale par age),
@@ -34,7 +38,11 @@ document.addEventListener("DOMContentLoaded", function () {
         return;
     }
 
-    const walletsDormants = donnees.wallets_dormants || [];
+    const dormance = donnees.dormance || {};
+    // Resume par seuil du curseur (mois) : plus de parcours des portefeuilles cote client.
+    // / Per-threshold summary (months): no more per-wallet scan client-side.
+    const parSeuil = {};
+    (dormance.par_seuil || []).forEach(function (p) { parSeuil[p.mois] = p; });
     const devise = donnees.currency_code || "";
     const depenseTotale = donnees.depense_totale || 0;
 
@@ -73,21 +81,14 @@ document.addEventListener("DOMContentLoaded", function () {
             minimumFractionDigits: 2, maximumFractionDigits: 2,
         }) + " " + devise;
     }
-    function mediane(valeurs) {
-        if (!valeurs.length) return 0;
-        const triees = valeurs.slice().sort(function (a, b) { return a - b; });
-        const milieu = Math.floor(triees.length / 2);
-        return triees.length % 2 ? triees[milieu] : (triees[milieu - 1] + triees[milieu]) / 2;
-    }
     function texte(id, valeur) {
         const el = document.getElementById(id);
         if (el) el.textContent = valeur;
     }
 
     // ---------- Moyennes statiques (ne dependent pas du seuil) ----------
-    const soldes = walletsDormants.map(function (w) { return w[1]; });
-    const nbWallets = soldes.length;
-    const soldeTotal = soldes.reduce(function (s, v) { return s + v; }, 0);
+    const nbWallets = dormance.nb_wallets || 0;
+    const soldeTotal = dormance.solde_total || 0;
 
     const nbVides = donnees.nb_vides || 0;
     const nbCartesAsset = nbWallets + nbVides;
@@ -97,23 +98,15 @@ document.addEventListener("DOMContentLoaded", function () {
         texte("moy-nb-total", nbCartesAsset.toLocaleString("fr-FR"));
         texte("moy-depense", formate(nbCartesAsset ? depenseTotale / nbCartesAsset : 0));
         texte("moy-solde", formate(soldeTotal / nbWallets));
-        texte("moy-solde-median", formate(mediane(soldes)));
+        texte("moy-solde-median", formate(dormance.solde_median || 0));
         texte("moy-solde-carte", formate(nbCartesAsset ? soldeTotal / nbCartesAsset : 0));
     }
 
     // ---------- Breakage (rétention) : snapshot du solde sur cartes par ancienneté ----------
     const totalCharge = donnees.total_charge || 0;
     if (nbWallets > 0) {
-        const buckets = [0, 0, 0, 0, 0];
-        for (let i = 0; i < walletsDormants.length; i++) {
-            const age = walletsDormants[i][0];
-            const val = walletsDormants[i][1];
-            if (age < 30) buckets[0] += val;
-            else if (age < 90) buckets[1] += val;
-            else if (age < 180) buckets[2] += val;
-            else if (age < 365) buckets[3] += val;
-            else buckets[4] += val;
-        }
+        // Tranches < 1 mois, < 3 mois, < 6 mois, < 1 an, au-dela (BORNES_BREAKAGE).
+        const buckets = dormance.breakage || [0, 0, 0, 0, 0];
         const pctCharge = function (centimes) {
             return totalCharge
                 ? (centimes / totalCharge * 100).toLocaleString("fr-FR", { maximumFractionDigits: 1 }) + " %"
@@ -281,24 +274,18 @@ document.addEventListener("DOMContentLoaded", function () {
         }
 
         // ----- Moyennes dynamiques : actifs / inactifs selon le seuil -----
-        const seuilJours = seuil * 30;
-        const inactifs = [];
-        const actifs = [];
-        let volumeInactif = 0;
-        for (let i = 0; i < walletsDormants.length; i++) {
-            const age = walletsDormants[i][0];
-            const solde = walletsDormants[i][1];
-            if (age >= seuilJours) { inactifs.push(solde); volumeInactif += solde; }
-            else { actifs.push(solde); }
-        }
-        const soldeActifs = actifs.reduce(function (s, v) { return s + v; }, 0);
+        const resume = parSeuil[seuil] || {
+            nb_actifs: 0, solde_actifs: 0, median_actifs: null,
+            nb_inactifs: 0, volume_inactif: 0, median_inactifs: null,
+        };
+        const volumeInactif = resume.volume_inactif;
         texte("moy-seuil", String(seuil));
-        texte("moy-nb-actifs", actifs.length.toLocaleString("fr-FR"));
-        texte("moy-actifs", actifs.length ? formate(soldeActifs / actifs.length) : "—");
-        texte("moy-actifs-median", actifs.length ? formate(mediane(actifs)) : "—");
-        texte("moy-nb-inactifs", inactifs.length.toLocaleString("fr-FR"));
-        texte("moy-inactifs", inactifs.length ? formate(volumeInactif / inactifs.length) : "—");
-        texte("moy-inactifs-median", inactifs.length ? formate(mediane(inactifs)) : "—");
+        texte("moy-nb-actifs", resume.nb_actifs.toLocaleString("fr-FR"));
+        texte("moy-actifs", resume.nb_actifs ? formate(resume.solde_actifs / resume.nb_actifs) : "—");
+        texte("moy-actifs-median", resume.nb_actifs ? formate(resume.median_actifs) : "—");
+        texte("moy-nb-inactifs", resume.nb_inactifs.toLocaleString("fr-FR"));
+        texte("moy-inactifs", resume.nb_inactifs ? formate(volumeInactif / resume.nb_inactifs) : "—");
+        texte("moy-inactifs-median", resume.nb_inactifs ? formate(resume.median_inactifs) : "—");
         const pctDormant = soldeTotal ? (volumeInactif / soldeTotal * 100) : 0;
         texte("moy-pct-dormant", pctDormant.toLocaleString("fr-FR", { maximumFractionDigits: 1 }) + " %");
     }
@@ -1,19 +1,21 @@
+import heapq
 import json
+from bisect import bisect_left
 from datetime import timedelta
+from itertools import accumulate
 from pathlib import Path
 
 from django.conf import settings
 from django.shortcuts import render, get_object_or_404
 from django.core.cache import cache
-from django.db.models import Sum, Count, Max
-from django.db.models.functions import TruncMonth
+from django.db.models import Sum, Count, F
 from django.utils import timezone
 from rest_framework import viewsets
 from rest_framework.permissions import AllowAny
 from django.views.decorators.cache import cache_page
 from django.contrib.admin.views.decorators import staff_member_required
 
-from fedow_core.models import Asset, Place, Wallet, Card, Federation, Configuration, Transaction, Token
+from fedow_core.models import Asset, AssetMonthlyRollup, AssetTotals, Place, Wallet, Card, Federation, Configuration, Transaction, Token
 import logging
 
 logger = logging.getLogger(__name__)
@@ -43,6 +45,14 @@ SEUILS_INACTIVITE = [
     (30, "+1 mois"),
 ]
 
+# Bornes (jours) des tranches du breakage : < 1 mois, < 3 mois, < 6 mois, < 1 an, au-delà.
+# / Breakage bucket bounds (days).
+BORNES_BREAKAGE = [30, 90, 180, 365]
+
+# Seuils (mois) du curseur du simulateur (#sim-seuil, 1 à 24). Un mois = 30 jours, comme en JS.
+# / Simulator slider thresholds (months). One month = 30 days, as in the JS.
+SEUILS_SIMULATEUR_MOIS = range(1, 25)
+
 # Couleur de chaque type d'action pour le graphe temporel (lisible en thème clair et sombre).
 # / Color per action type for the time chart (readable in light and dark themes).
 COULEURS_ACTION = {
@@ -69,15 +79,16 @@ def _calcul_cycle_de_vie(asset):
     Les soldes sont stockés en centimes ; on les convertit en euros pour l'affichage.
     / Balances are stored in cents; converted to euros for display.
     """
-    en_circulation_centimes = asset.total_in_wallet_not_place()
-    dans_les_lieux_centimes = asset.total_in_place()
-    remis_en_banque_centimes = asset.total_bank_deposit()
+    # Totaux courants de l'asset (AssetTotals), lus en une requête au lieu de quatre SUM.
+    # / Running totals of the asset, one read instead of four SUMs.
+    totaux = asset.running_totals()
+    en_circulation_centimes = totaux.in_wallets
+    dans_les_lieux_centimes = totaux.in_places
+    remis_en_banque_centimes = totaux.deposited
 
     # Monnaie créée = somme des créations monétaires (action CREATION).
     # / Money minted = sum of monetary creations (CREATION action).
-    cree_centimes = (asset.transactions
-                     .filter(action=Transaction.CREATION)
-                     .aggregate(total=Sum('amount'))['total'] or 0)
+    cree_centimes = totaux.created
 
     # Total des tokens existant aujourd'hui (en circulation + dans les lieux).
     # / Total tokens existing today (in circulation + in places).
@@ -103,63 +114,119 @@ def _calcul_cycle_de_vie(asset):
     }
 
 
+def _medianes_cumulees(valeurs):
+    """
+    Médiane de valeurs[:i + 1] pour chaque i, en une passe (deux tas) : O(n log n).
+    / Median of values[:i + 1] for every i, in one pass (two heaps).
+    """
+    bas, haut = [], []  # bas : moitié basse (tas max, valeurs opposées) / haut : moitié haute
+    medianes = []
+    for valeur in valeurs:
+        if bas and valeur > -bas[0]:
+            heapq.heappush(haut, valeur)
+        else:
+            heapq.heappush(bas, -valeur)
+        if len(bas) > len(haut) + 1:
+            heapq.heappush(haut, -heapq.heappop(bas))
+        elif len(haut) > len(bas):
+            heapq.heappush(bas, -heapq.heappop(haut))
+        medianes.append(-bas[0] if len(bas) > len(haut) else (-bas[0] + haut[0]) / 2)
+    return medianes
+
+
+def _resume_dormance(ages, soldes):
+    """
+    Résumé compact de la distribution (âge, solde) des portefeuilles, pour le front.
+    / Compact summary of the wallets' (age, balance) distribution, for the front-end.
+
+    `ages` est trié par ordre croissant (`soldes` dans le même ordre). Chaque seuil est
+    alors une recherche dichotomique (bisect) dans `ages` et une différence de sommes
+    cumulées : O(n log n) au total, quel que soit le nombre de seuils. La taille du
+    résultat ne dépend pas du nombre de cartes (cache et page restent légers).
+    / `ages` sorted ascending: each threshold is a bisect plus a cumulative-sum
+      difference. The output size does not grow with the card base.
+    """
+    nb = len(ages)
+    cumul = [0, *accumulate(soldes)]  # cumul[i] = somme des i plus jeunes / sum of the i youngest
+    total = cumul[-1]
+    medianes_jeunes = _medianes_cumulees(soldes)
+    medianes_vieux = _medianes_cumulees(reversed(soldes))
+
+    def volume_a_partir_de(jours):
+        return total - cumul[bisect_left(ages, jours)]
+
+    coupures = [0, *(bisect_left(ages, jours) for jours in BORNES_BREAKAGE), nb]
+    par_seuil = []
+    for mois in SEUILS_SIMULATEUR_MOIS:
+        nb_actifs = bisect_left(ages, mois * 30)
+        nb_inactifs = nb - nb_actifs
+        par_seuil.append({
+            'mois': mois,
+            'nb_actifs': nb_actifs,
+            'solde_actifs': cumul[nb_actifs],
+            'median_actifs': medianes_jeunes[nb_actifs - 1] if nb_actifs else None,
+            'nb_inactifs': nb_inactifs,
+            'volume_inactif': total - cumul[nb_actifs],
+            'median_inactifs': medianes_vieux[nb_inactifs - 1] if nb_inactifs else None,
+        })
+
+    return {
+        'nb_wallets': nb,
+        'solde_total': total,
+        'solde_median': medianes_jeunes[-1] if nb else 0,
+        'breakage': [cumul[fin] - cumul[debut] for debut, fin in zip(coupures, coupures[1:])],
+        'par_seuil': par_seuil,
+        # Pour le graphe « monnaie fondante » (SEUILS_INACTIVITE), retiré avant l'envoi.
+        # / For the "melting money" chart, removed before sending.
+        'volumes_inactivite': [volume_a_partir_de(jours) for jours, _label in SEUILS_INACTIVITE],
+    }
+
+
 def _calcul_monnaie_fondante(asset):
     """
     Calcule la "monnaie fondante" : combien de tokens dorment sur les wallets inactifs.
     / Computes "melting money": how many tokens sleep on inactive wallets.
 
-    Optim : la date de dernière activité par wallet est obtenue par 2 requêtes agrégées
-    (Max(datetime) par sender, puis par receiver), donc O(wallets) et non O(transactions).
+    Optim : la date de dernière activité est portée par le Token (`last_activity_at`,
+    tenue à jour par Transaction.save()) : une seule lecture des tokens, sans GROUP BY
+    sur les transactions.
     "Inactif" = dernière tx en émetteur OU receveur (une recharge sans dépense = actif : voulu).
 
-    / Optim: last activity date per wallet via 2 aggregated queries (Max by sender, by receiver),
-      so O(wallets) not O(transactions). "Inactive" = last tx as sender OR receiver.
+    / Optim: the last activity date lives on the Token (`last_activity_at`, maintained by
+      Transaction.save()): a single read of the tokens, no GROUP BY over transactions.
+      "Inactive" = last tx as sender OR receiver.
     """
     maintenant = timezone.now()
-    tx = Transaction.objects.filter(asset=asset).exclude(action=Transaction.FIRST)
-
-    # Date de dernière activité par wallet, via 2 GROUP BY fusionnés (O(wallets)).
-    # / Last activity date per wallet, via 2 merged GROUP BY (O(wallets)).
-    derniere_activite_par_wallet = {}
-    for row in tx.values('sender').annotate(last=Max('datetime')):
-        derniere_activite_par_wallet[row['sender']] = row['last']
-    for row in tx.values('receiver').annotate(last=Max('datetime')):
-        wallet_id = row['receiver']
-        ancienne = derniere_activite_par_wallet.get(wallet_id)
-        if ancienne is None or row['last'] > ancienne:
-            derniere_activite_par_wallet[wallet_id] = row['last']
-
-    # Soldes positifs, hors lieux (place) et hors wallet primaire.
-    # / Positive balances, excluding places and the primary wallet.
+    # Cumuls par action lus dans le rollup mensuel, pas dans les transactions.
+    # / Per-action totals read from the monthly rollup, not from the transactions.
+    rollup = AssetMonthlyRollup.objects.filter(asset=asset)
+
+    # Soldes positifs, hors lieux (place) et hors wallet primaire, du plus récent au plus
+    # ancien : la base trie, les âges sortent déjà croissants.
+    # / Positive balances, excluding places and the primary wallet, newest activity first:
+    #   the database sorts, ages come out ascending.
     tokens = (Token.objects
               .filter(asset=asset, value__gt=0,
                       wallet__place__isnull=True,
-                      wallet__primary__isnull=True)
-              .values_list('wallet_id', 'value'))
-
-    # Liste anonymisée (âge en jours, solde en centimes) — réutilisée par le simulateur (Spec 3).
-    # / Anonymized (age in days, balance in cents) list — reused by the simulator (Spec 3).
-    wallets_dormants = []
-    for wallet_id, value in tokens:
-        derniere = derniere_activite_par_wallet.get(wallet_id)
-        if derniere is None:
-            continue
-        age_jours = (maintenant - derniere).days
-        wallets_dormants.append((age_jours, value))
-
-    # Pour chaque seuil : somme cumulée des wallets inactifs depuis au moins ce seuil.
-    # / For each threshold: cumulative sum of wallets inactive for at least that long.
-    labels = []
-    data = []
-    for jours, label in SEUILS_INACTIVITE:
-        total_centimes = sum(value for age_jours, value in wallets_dormants if age_jours >= jours)
-        labels.append(label)
-        data.append(round(total_centimes / 100, 2))
+                      wallet__primary__isnull=True,
+                      last_activity_at__isnull=False)
+              .order_by('-last_activity_at')
+              .values_list('last_activity_at', 'value'))
+    ages, soldes = [], []
+    for derniere, value in tokens:
+        ages.append((maintenant - derniere).days)
+        soldes.append(value)
+    dormance = _resume_dormance(ages, soldes)
+
+    # Pour chaque seuil : somme des wallets inactifs depuis au moins ce seuil.
+    # / For each threshold: sum of wallets inactive for at least that long.
+    labels = [label for _jours, label in SEUILS_INACTIVITE]
+    data = [round(total_centimes / 100, 2) for total_centimes in dormance.pop('volumes_inactivite')]
 
     # Total dépensé par les users (ventes) — pour la « dépense moyenne / portefeuille ».
     # / Total spent by users (sales) — for the per-wallet "average spend".
-    depense_totale_centimes = (tx.filter(action__in=[Transaction.SALE, Transaction.QRCODE_SALE])
-                               .aggregate(total=Sum('amount'))['total'] or 0)
+    depense_totale_centimes = (rollup.filter(action__in=[Transaction.SALE, Transaction.QRCODE_SALE])
+                               .aggregate(total=Sum('total'))['total'] or 0)
 
     # Nb de portefeuilles user ayant eu l'asset mais vidés (solde 0) — pour les moyennes.
     # / Count of user wallets that held the asset but are now empty — for the averages.
@@ -169,8 +236,8 @@ def _calcul_monnaie_fondante(asset):
 
     # Total chargé sur les cartes (recharges) — pour le taux de breakage (rétention).
     # / Total loaded onto cards (refills) — for the breakage (retention) rate.
-    total_charge_centimes = (tx.filter(action=Transaction.REFILL)
-                             .aggregate(total=Sum('amount'))['total'] or 0)
+    total_charge_centimes = (rollup.filter(action=Transaction.REFILL)
+                             .aggregate(total=Sum('total'))['total'] or 0)
 
     return {
         'labels': labels,
@@ -179,9 +246,10 @@ def _calcul_monnaie_fondante(asset):
         # Sert à l'affichage de l'état vide (rien ne dort).
         # / Used to render the empty state (nothing sleeping).
         'total_max': max(data) if data else 0,
-        # Anonymisé (sans user ni uuid) — réutilisé par le simulateur, les moyennes ET le breakage (JS).
-        # / Anonymized — reused by the simulator, the averages AND the breakage (JS).
-        'wallets_dormants': wallets_dormants,
+        # Résumé anonyme et de taille fixe (tranches, médianes par seuil) — pour le simulateur,
+        # les moyennes ET le breakage (JS). Plus de liste par portefeuille.
+        # / Fixed-size anonymous summary — for the simulator, the averages AND the breakage (JS).
+        'dormance': dormance,
         'depense_totale': depense_totale_centimes,
         'nb_vides': nb_vides,
         'total_charge': total_charge_centimes,
@@ -195,17 +263,16 @@ def _calcul_temporel(asset):
 
     On exclut FIRST (genèse) et CREATION (frappe monétaire, déjà comptée dans le cycle de
     vie) pour ne pas gonfler le volume : une recharge = CREATION + REFILL.
-    Une seule requête agrégée (TruncMonth + Sum + Count), donc pas de N+1.
+    Une seule lecture du rollup mensuel (AssetMonthlyRollup) : quelques centaines de
+    lignes quel que soit l'historique.
     / Excludes FIRST (genesis) and CREATION (minting, already in the lifecycle) to avoid
-      inflating volume: a top-up = CREATION + REFILL. Single aggregated query, no N+1.
+      inflating volume: a top-up = CREATION + REFILL. Single read of the monthly rollup.
     """
     actions_exclues = [Transaction.FIRST, Transaction.CREATION]
 
-    lignes = (asset.transactions
+    lignes = (AssetMonthlyRollup.objects.filter(asset=asset)
               .exclude(action__in=actions_exclues)
-              .annotate(mois=TruncMonth('datetime'))
-              .values('mois', 'action')
-              .annotate(nombre=Count('uuid'), total=Sum('amount'))
+              .values('action', 'total', mois=F('month'))
               .order_by('mois'))
 
     labels_action = dict(Transaction.TYPE_ACTION)
@@ -290,10 +357,8 @@ def get_dashboard_asset(asset):
     Calcule (et met en cache 5 min) les analyses du tableau de bord d'un asset.
     / Computes (and caches 5 min) the dashboard analyses for an asset.
 
-    Le cache soulage la base de production (fragile). Il se vide automatiquement
-    quand une fédération change (Federation.save() appelle cache.clear()).
-    / Cache relieves the fragile production DB. It clears automatically when a
-      federation changes (Federation.save() calls cache.clear()).
+    Le cache soulage la base de production (fragile). Il expire après 5 minutes.
+    / Cache relieves the fragile production DB. It expires after 5 minutes.
     """
     cle_cache = f"fedow_dashboard_asset_{asset.uuid}"
     donnees = cache.get(cle_cache)
@@ -432,23 +497,16 @@ def _masse_par_monnaie():
     Masse monétaire par monnaie, groupée par catégorie (LECTURE SEULE, zéro N+1).
     / Money supply per currency, grouped by category (READ-ONLY, no N+1).
 
-    4 agrégats groupés par asset + 1 lecture des assets. On ne somme jamais des
-    monnaies différentes : chaque ligne porte sa propre unité.
-    / 4 aggregates grouped by asset + 1 asset read. Never sum different currencies:
+    1 lecture des totaux courants (AssetTotals) + 1 lecture des assets. On ne somme
+    jamais des monnaies différentes : chaque ligne porte sa propre unité.
+    / 1 running totals read + 1 asset read. Never sum different currencies:
       each row carries its own unit.
     """
-    circulation = {r['asset']: r['total'] for r in Token.objects
-                   .filter(asset__archive=False, wallet__place__isnull=True)
-                   .values('asset').annotate(total=Sum('value'))}
-    lieux = {r['asset']: r['total'] for r in Token.objects
-             .filter(asset__archive=False, wallet__place__isnull=False)
-             .values('asset').annotate(total=Sum('value'))}
-    banque = {r['asset']: r['total'] for r in Transaction.objects
-              .filter(asset__archive=False, action=Transaction.DEPOSIT)
-              .values('asset').annotate(total=Sum('amount'))}
-    cree = {r['asset']: r['total'] for r in Transaction.objects
-            .filter(asset__archive=False, action=Transaction.CREATION)
-            .values('asset').annotate(total=Sum('amount'))}
+    totaux = {t.asset_id: t for t in AssetTotals.objects.filter(asset__archive=False)}
+    circulation = {asset_id: t.in_wallets for asset_id, t in totaux.items()}
+    lieux = {asset_id: t.in_places for asset_id, t in totaux.items()}
+    banque = {asset_id: t.deposited for asset_id, t in totaux.items()}
+    cree = {asset_id: t.created for asset_id, t in totaux.items()}
 
     # On exclut les adhésions (SUB) et les badgeuses (BDG) : ce ne sont pas de la
     # « monnaie » au sens masse monétaire (les badgeuses ne sont pas utilisées — YAGNI).
@@ -533,10 +591,12 @@ def _pouls_reseau():
     On compte les transactions (pas les montants) car les monnaies ont des unités
     différentes : additionner des euros et des heures n'aurait pas de sens.
     / We count transactions (not amounts) because currencies have different units.
+
+    Lu dans le rollup mensuel (AssetMonthlyRollup), pas dans les transactions.
+    / Read from the monthly rollup, not from the transactions.
     """
-    lignes = (Transaction.objects.exclude(action=Transaction.FIRST)
-              .annotate(mois=TruncMonth('datetime'))
-              .values('mois').annotate(nb=Count('uuid')).order_by('mois'))
+    lignes = (AssetMonthlyRollup.objects.exclude(action=Transaction.FIRST)
+              .values(mois=F('month')).annotate(nb=Sum('count')).order_by('mois'))
     labels, data = [], []
     for ligne in lignes:
         if not ligne['mois']:
@@ -560,9 +620,9 @@ def _dormance_fed():
     if fed is None:
         return None
     fondante = _calcul_monnaie_fondante(fed)
-    # On n'a pas besoin de la liste anonymisée ici (allège le cache).
-    # / We don't need the anonymized list here (lighten the cache).
-    fondante.pop('wallets_dormants', None)
+    # On n'a pas besoin du résumé par seuil ici (allège le cache).
+    # / We don't need the per-threshold summary here (lighten the cache).
+    fondante.pop('dormance', None)
     fondante['asset_uuid'] = str(fed.uuid)
     fondante['asset_name'] = fed.name
     return fondante
@@ -95,6 +95,9 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Corps brut des POST signes en mode raw-body (fedow_core/permissions.py).
+    # / Raw body of raw-body signed POSTs.
+    'fedow_core.middleware.RawBodySignatureMiddleware',
 ]
 
 if DEBUG:
@@ -164,6 +167,58 @@ else:
         }
     }
 
+# Cache LRU des cles publiques RSA chargees, par processus (fedow_core.utils.PublicKeyCache).
+# / Per-process LRU cache of loaded RSA public keys.
+PUBLIC_KEY_CACHE_SIZE = int(os.environ.get('PUBLIC_KEY_CACHE_SIZE', 1024))
+
+# Signatures GET des wallets : fenetre d'acceptation du header Date (secondes, 0 = pas de controle)
+# et cache borne des signatures deja verifiees dans cette fenetre. Date ISO 8601 avec fuseau ;
+# une date sans fuseau est lue dans TIME_ZONE.
+# / Wallet GET signatures: Date header acceptance window (seconds, 0 = no check)
+# and bounded cache of signatures already verified within it. ISO 8601 Date with an
+# offset; a date without one is read in TIME_ZONE.
+SIGNATURE_DATE_WINDOW = int(os.environ.get('SIGNATURE_DATE_WINDOW', 300))
+VERIFIED_SIGNATURE_CACHE_SIZE = int(os.environ.get('VERIFIED_SIGNATURE_CACHE_SIZE', 4096))
+
+# Cache des cles API verifiees (prefix -> empreinte, place, wallet), en secondes.
+# / Verified API key cache (prefix -> digest, place, wallet), in seconds.
+API_KEY_CACHE_TTL = int(os.environ.get('API_KEY_CACHE_TTL', 600))
+
+# Photo des soldes d'un wallet (WalletSerializer), perimee par version a chaque
+# transaction ; la duree borne seulement le renommage d'un lieu d'origine (secondes).
+# / Wallet balance snapshot, expired by version on every transaction; the TTL only
+# bounds an origin place rename (seconds).
+WALLET_SNAPSHOT_TTL = int(os.environ.get('WALLET_SNAPSHOT_TTL', 300))
+
+# Fragments versionnes de CachedTransactionSerializer (assets, cartes), en secondes.
+# / Versioned CachedTransactionSerializer fragments (assets, cards), in seconds.
+SERIALIZED_FRAGMENT_TTL = int(os.environ.get('SERIALIZED_FRAGMENT_TTL', 3600))
+
+# Taille des paquets lus par les exports en flux (list_by_asset ndjson / csv).
+# / Chunk size of the streaming exports (list_by_asset ndjson / csv).
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 2000))
+
+# Livraison des webhooks Lespass (commande dispatch_webhooks) : taille des lots,
+# attente entre deux passes a vide, delai de reessai (double a chaque echec, plafonne)
+# et duree de reservation d'une ligne par un dispatcher. En secondes.
+# / Lespass webhook delivery (dispatch_webhooks): batch size, idle poll, retry backoff
+# (doubled on each failure, capped) and row lease. In seconds.
+WEBHOOK_BATCH_SIZE = int(os.environ.get('WEBHOOK_BATCH_SIZE', 50))
+WEBHOOK_POLL_INTERVAL = int(os.environ.get('WEBHOOK_POLL_INTERVAL', 2))
+WEBHOOK_RETRY_BASE = int(os.environ.get('WEBHOOK_RETRY_BASE', 30))
+WEBHOOK_RETRY_MAX = int(os.environ.get('WEBHOOK_RETRY_MAX', 3600))
+# Marge du bail : ajoutee au pire cas d'un lot (taille x timeout d'un envoi).
+# / Lease margin: added to the batch worst case (size x one delivery timeout).
+WEBHOOK_LEASE = int(os.environ.get('WEBHOOK_LEASE', 60))
+
+# Au-dela de ce delai (secondes), un checkout Stripe reste en PROGRESS parce que son
+# worker est mort : un webhook ou un retour d'URL suivant peut le reprendre.
+# Doit rester au-dessus du timeout du client Stripe (80 s, plus ses reessais) : un worker
+# encore dans Session.retrieve ne doit pas se faire reprendre le checkout.
+# / Past this delay (seconds) a PROGRESS checkout is considered abandoned and reclaimable.
+# Must stay above the Stripe client timeout (80 s, plus its retries).
+CHECKOUT_CLAIM_TIMEOUT = int(os.environ.get('CHECKOUT_CLAIM_TIMEOUT', 300))
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -18,5 +18,8 @@ echo "You should be able to see the Fedow dashbord at :"
 echo "https://$DOMAIN/dashboard/"
 sqlite3 ./database/db.sqlite3 'PRAGMA journal_mode=WAL;'
 sqlite3 ./database/db.sqlite3 'PRAGMA synchronous=normal;'
+# Livraison des webhooks Lespass (outbox) en tache de fond.
+# / Lespass webhook delivery (outbox) in the background.
+poetry run python3 manage.py dispatch_webhooks >> /home/fedow/Fedow/logs/dispatch_webhooks.logs 2>&1 &
 poetry run gunicorn fedowallet_django.wsgi --log-level=info --log-file /home/fedow/Fedow/logs/gunicorn.logs -w 5 -b 0.0.0.0:8000
 